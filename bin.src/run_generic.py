@@ -78,7 +78,7 @@ def run(bdict, opsdb, colmap, args):
     resultsDb = db.ResultsDb(outDir=args.outDir)
     group = mb.MetricBundleGroup(bdict, opsdb, outDir=args.outDir, resultsDb=resultsDb)
     group.runAll()
-    group.plotAll()
+    group.plotAll(plotCache=True)
     resultsDb.close()
     mafUtils.writeConfigs(opsdb, args.outDir)
 
@@ -87,7 +87,7 @@ def replot(bdict, opsdb, colmap, args):
     resultsDb = db.ResultsDb(outDir=args.outDir)
     group = mb.MetricBundleGroup(bdict, opsdb, outDir=args.outDir, resultsDb=resultsDb)
     group.readAll()
-    group.plotAll()
+    group.plotAll(plotCache=True)
     resultsDb.close()
 
 
@@ -3,13 +3,25 @@
 import os
 import glob
 import argparse
-import numpy as np
+from multiprocessing import Pool
 
 import lsst.sims.maf.batches as batches
 
 """Join split metric outputs into a single metric output file."""
 
 
+def joinMetric(orbitRoot, baseDir, splits, metricfile, outDir):
+    b = batches.readAndCombine(orbitRoot, baseDir, splits, metricfile)
+    b.write(outDir=outDir)
+    return metricfile
+
+
+def joinDiscovery(orbitRoot, baseDir, splits, discoveryfile, outDir):
+    discovery = batches.readAndCombineDiscovery(orbitRoot, baseDir, splits, discoveryfile)
+    discovery.write(os.path.join(outDir, discoveryfile))
+    return discoveryfile
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Join moving object metrics (from splits) for a particular "
                                                  "opsim run.  Assumes split metric files are in "
@@ -19,6 +31,8 @@ if __name__ == '__main__':
                         help="Root directory containing split (or single) metric outputs.")
     parser.add_argument("--outDir", type=str, default=None,
                         help="Output directory for moving object metrics. Default [orbitRoot]")
+    parser.add_argument("--nProc", type=int, default=1,
+                        help="Number of processes to use to join the metric files. Default 1.")
     args = parser.parse_args()
 
     if args.orbitFile is None:
@@ -34,9 +48,12 @@ if __name__ == '__main__':
     #  (note that split# does not show up in the metricFileName, and is not used in run_moving_calc.py).
     #  ... this lets run_moving_calc.py easily run in parallel on multiple splits.
 
-    # Assume splits = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
-    splits = np.arange(0, 10, 1)
     orbitRoot = args.orbitFile.replace('.txt', '').replace('.des', '').replace('.s3m', '')
+    # Find the splits (<orbitRoot>_0, <orbitRoot>_1, ...) present in baseDir.
+    splits = batches.findSplits(orbitRoot, args.baseDir)
+    if len(splits) == 0:
+        print(f'Could not find any split directories {orbitRoot}_[split] in {args.baseDir}')
+        exit()
 
     if args.outDir is not None:
         outDir = args.outDir
@@ -45,14 +62,14 @@ if __name__ == '__main__':
 
     # Scan first splitDir for all metric files.
     tempdir = os.path.join(args.baseDir, f'{orbitRoot}_{splits[0]}')
-    print(f'# Joining files from {orbitRoot}_[0-9]; will use {tempdir} to find metric names.')
+    print(f'# Joining files from {len(splits)} splits of {orbitRoot}; will use {tempdir} to find metric names.')
 
     metricfiles = glob.glob(os.path.join(tempdir, '*MOOB.npz'))
     # Identify metric names that we want to join.
     metricNames = []
     for m in metricfiles:
         mname = os.path.split(m)[-1]
-        # Hack out raw Discovery outputs. We don't want to join the raw discovery files.
+        # Hack out raw Discovery outputs written by older versions as .npz (these can't be joined).
         # This is a hack because currently we're just pulling out _Time and _N_Chances to join.
         if 'Discovery' in mname:
             if 'Discovery_Time' in mname:
@@ -63,8 +80,10 @@ if __name__ == '__main__':
                 pass
         else:
             metricNames.append(mname)
+    # The raw (parent) Discovery outputs are stored separately, in columnar format.
+    discoveryNames = [os.path.split(d)[-1] for d in glob.glob(os.path.join(tempdir, '*MOOB.discovery'))]
 
-    if len(metricNames) == 0:
+    if len(metricNames) == 0 and len(discoveryNames) == 0:
         print(f"Could not read any metric files from {tempdir}")
         exit()
 
@@ -72,7 +91,14 @@ if __name__ == '__main__':
     if not (os.path.isdir(outDir)):
         os.makedirs(outDir)
 
-    # Read and combine the metric files.
-    for m in metricNames:
-        b = batches.readAndCombine(orbitRoot, args.baseDir, splits, m)
-        b.write(outDir=outDir)
+    # Read and combine the metric files (each metric file is joined independently).
+    jobs = [(joinMetric, (orbitRoot, args.baseDir, splits, m, outDir)) for m in metricNames]
+    jobs += [(joinDiscovery, (orbitRoot, args.baseDir, splits, d, outDir)) for d in discoveryNames]
+    if args.nProc > 1:
+        with Pool(args.nProc) as pool:
+            results = [pool.apply_async(func, jobargs) for func, jobargs in jobs]
+            for r in results:
+                r.get()
+    else:
+        for func, jobargs in jobs:
+            func(*jobargs)
@@ -4,6 +4,9 @@ from __future__ import print_function
 import os
 import argparse
 import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from tornado import ioloop
 from tornado import web
 from jinja2 import Environment
@@ -16,59 +19,111 @@ from lsst.sims.maf.web import MafTracking
 from lsst.sims.maf.db import addRunToDatabase
 
 
-class RunSelectHandler(web.RequestHandler):
-    def get(self):
-        selectTempl = env.get_template("runselect.html")
-        if 'runId' in self.request.arguments:
-            runId = int(self.request.arguments['runId'][0])
-        else:
-            # Set runID to a negative number, to default to first run.
-            runId = startRunId
-        self.write(selectTempl.render(runlist=runlist, runId=runId, jsPath=jsPath))
+class PageCache(object):
+    """LRU cache of rendered pages, each stored with the version (resultsDb mtime) of its run.
 
+    Parameters
+    ----------
+    maxSize : int, opt
+        The maximum number of pages to keep. Default 200.
+    """
+    def __init__(self, maxSize=200):
+        self.maxSize = maxSize
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
 
-class MetricSelectHandler(web.RequestHandler):
-    def get(self):
-        selectTempl = env.get_template("metricselect.html")
-        runId = int(self.request.arguments['runId'][0])
-        self.write(selectTempl.render(runlist=runlist, runId=runId))
+    def get(self, key, version):
+        with self._lock:
+            if key in self._pages and self._pages[key][0] == version:
+                self._pages.move_to_end(key)
+                return self._pages[key][1]
+        return None
 
+    def put(self, key, version, page):
+        with self._lock:
+            self._pages[key] = (version, page)
+            self._pages.move_to_end(key)
+            while len(self._pages) > max(self.maxSize, 0):
+                self._pages.popitem(last=False)
+
+
+def renderPage(templateName, runId, runPage=True, **kwargs):
+    """Render a template, reusing the cached page unless the run's resultsDb has changed.
+
+    Pages which only use the tracking database (runPage=False) are cached for the server lifetime.
+    """
+    # getRun reloads the run if its resultsDb has been modified.
+    version = runlist.getRun(runId).resultsDbMtime if runPage else None
+    key = (templateName, runId, tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                                             for k, v in kwargs.items())))
+    page = pageCache.get(key, version)
+    if page is None:
+        page = env.get_template(templateName).render(runlist=runlist, runId=runId, **kwargs)
+        pageCache.put(key, version, page)
+    return page
+
+
+def getJson(runId, metricId):
+    run = runlist.getRun(runId)
+    return run.getJson(run.metricIdsToMetrics([metricId]))
+
+
+def getNpz(runId, metricId):
+    run = runlist.getRun(runId)
+    return run.getNpz(run.metricIdsToMetrics([metricId]))
+
+
+class MafPageHandler(web.RequestHandler):
+    """Base handler, rendering the page template for a run in the thread pool (so that reading a
+    new run or rendering a large page does not block other requests)."""
+    templateName = None
+
+    def templateArgs(self):
+        return {}
+
+    async def get(self):
+        runId = int(self.get_argument('runId'))
+        page = await ioloop.IOLoop.current().run_in_executor(executor, lambda: renderPage(
+            self.templateName, runId, **self.templateArgs()))
+        self.write(page)
 
-class MetricResultsPageHandler(web.RequestHandler):
-    def get(self):
-        resultsTempl = env.get_template("results.html")
-        runId = int(self.request.arguments['runId'][0])
-        if 'metricId' in self.request.arguments:
-            metricIdList = self.request.arguments['metricId']
-        else:
-            metricIdList = []
-        if 'Group_subgroup' in self.request.arguments:
-            groupList = self.request.arguments['Group_subgroup']
-        else:
-            groupList = []
-        self.write(resultsTempl.render(metricIdList=metricIdList, groupList=groupList,
-                                       runId=runId, runlist=runlist))
+
+class RunSelectHandler(MafPageHandler):
+    templateName = "runselect.html"
+
+    async def get(self):
+        # Set runID to a negative number, to default to first run.
+        runId = int(self.get_argument('runId', startRunId))
+        page = await ioloop.IOLoop.current().run_in_executor(executor, lambda: renderPage(
+            self.templateName, runId, runPage=False, jsPath=jsPath))
+        self.write(page)
+
+
+class MetricSelectHandler(MafPageHandler):
+    templateName = "metricselect.html"
+
+
+class MetricResultsPageHandler(MafPageHandler):
+    templateName = "results.html"
+
+    def templateArgs(self):
+        return {'metricIdList': self.get_arguments('metricId'),
+                'groupList': self.get_arguments('Group_subgroup')}
 
 
 class DataHandler(web.RequestHandler):
-    def get(self):
-        runId = int(self.request.arguments['runId'][0])
-        metricId = int(self.request.arguments['metricId'][0])
-        if 'datatype' in self.request.arguments:
-            datatype = self.request.arguments['datatype'][0].lower()
-            datatype = datatype.decode('utf-8')
-        else:
-            datatype = 'npz'
-        run = runlist.getRun(runId)
-        metric = run.metricIdsToMetrics([metricId])
+    async def get(self):
+        runId = int(self.get_argument('runId'))
+        metricId = int(self.get_argument('metricId'))
+        datatype = self.get_argument('datatype', 'npz').lower()
         if datatype == 'npz':
-            npz = run.getNpz(metric)
+            npz = await ioloop.IOLoop.current().run_in_executor(executor, getNpz, runId, metricId)
             if npz is None:
                 self.write('No npz file available.')
             else:
                 self.redirect(npz)
         elif datatype == 'json':
-            jsn = run.getJson(metric)
+            jsn = await ioloop.IOLoop.current().run_in_executor(executor, getJson, runId, metricId)
             if jsn is None:
                 self.write('No JSON file available.')
             else:
@@ -77,34 +132,40 @@ class DataHandler(web.RequestHandler):
             self.write('Data type "%s" not understood.' % (datatype))
 
 
-class ConfigPageHandler(web.RequestHandler):
-    def get(self):
-        configTempl = env.get_template("configs.html")
-        runId = int(self.request.arguments['runId'][0])
-        self.write(configTempl.render(runlist=runlist, runId=runId))
+class ConfigPageHandler(MafPageHandler):
+    templateName = "configs.html"
+
+
+class StatPageHandler(MafPageHandler):
+    templateName = "stats.html"
+
 
+class AllMetricResultsPageHandler(MafPageHandler):
+    """Load up the files and display """
+    templateName = "allmetricresults.html"
 
-class StatPageHandler(web.RequestHandler):
-    def get(self):
-        statTempl = env.get_template("stats.html")
-        runId = int(self.request.arguments['runId'][0])
-        self.write(statTempl.render(runlist=runlist, runId=runId))
 
+class MultiColorPageHandler(MafPageHandler):
+    """Display sky maps. """
+    templateName = "multicolor.html"
 
-class AllMetricResultsPageHandler(web.RequestHandler):
-    def get(self):
-        """Load up the files and display """
-        allresultsTempl = env.get_template("allmetricresults.html")
-        runId = int(self.request.arguments['runId'][0])
-        self.write(allresultsTempl.render(runlist=runlist, runId=runId))
 
+class PlotFileHandler(web.StaticFileHandler):
+    """Serve the plot (and data) files, letting browsers cache them and revalidate with
+    If-Modified-Since / If-None-Match.
 
-class MultiColorPageHandler(web.RequestHandler):
-    def get(self):
-        """Display sky maps. """
-        multiColorTempl = env.get_template("multicolor.html")
-        runId = int(self.request.arguments['runId'][0])
-        self.write(multiColorTempl.render(runlist=runlist, runId=runId))
+    The ETag is built from the file modification time and size, rather than by hashing the
+    (possibly large) file contents on every request."""
+    cacheTime = 300
+
+    def compute_etag(self):
+        if not hasattr(self, 'absolute_path'):
+            return None
+        stat = os.stat(self.absolute_path)
+        return '"%x-%x"' % (int(stat.st_mtime * 1e6), stat.st_size)
+
+    def get_cache_time(self, path, modified, mime_type):
+        return self.cacheTime
 
 
 def make_app():
@@ -120,7 +181,8 @@ def make_app():
         ("/multiColor", MultiColorPageHandler),
         (r"/(favicon.ico)", web.StaticFileHandler, {'path': faviconPath}),
         (r"/(sorttable.js)", web.StaticFileHandler, {'path': jsPath}),
-        (r"/*/(.*)", web.StaticFileHandler, {'path': staticpath})])
+        (r"/*/(.*)", PlotFileHandler, {'path': staticpath})],
+        compress_response=True)
     return application
 
 if __name__ == "__main__":
@@ -140,6 +202,12 @@ if __name__ == "__main__":
                         action='store_true', help="Do not open a new browser tab")
     parser.add_argument("-u", "--unix_socket", type=str, default='',
                         help="UNIX socket to bind to.")
+    parser.add_argument("--runCacheSize", type=int, default=20,
+                        help="Number of (most recently viewed) runs to keep in memory.")
+    parser.add_argument("--pageCacheSize", type=int, default=200,
+                        help="Number of rendered pages to keep in memory.")
+    parser.add_argument("--threads", type=int, default=4,
+                        help="Number of threads used to read runs and render pages.")
 
     args = parser.parse_args()
 
@@ -160,7 +228,7 @@ if __name__ == "__main__":
 
     # Open tracking database and start visualization.
     global runlist
-    runlist = MafTracking(trackingDb)
+    runlist = MafTracking(trackingDb, runCacheSize=args.runCacheSize)
     if startRunId < 0:
         startRunId = runlist.runs[0]['mafRunId']
     # Set up path to template and favicon paths, and load templates.
@@ -177,6 +245,11 @@ if __name__ == "__main__":
     global staticpath
     staticpath = '.'
 
+    global pageCache
+    pageCache = PageCache(maxSize=args.pageCacheSize)
+    global executor
+    executor = ThreadPoolExecutor(max_workers=max(args.threads, 1))
+
     # Start up tornado app.
     application = make_app()
 
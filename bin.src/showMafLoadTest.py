@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import argparse
+import time
+import numpy as np
+from tornado import ioloop
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.queues import Queue
+
+from lsst.sims.maf.web import MafTracking
+
+
+def buildUrls(url, trackingDb, nRuns=5, nMetrics=10):
+    """Build a list of (page, url) covering the showMaf pages for the runs in the tracking database."""
+    runlist = MafTracking(trackingDb)
+    urls = [('runselect', url + '/')]
+    for runId in runlist.runs['mafRunId'][:nRuns]:
+        for page in ['allMetricResults', 'metricSelect', 'summaryStats', 'configParams', 'multiColor']:
+            urls.append((page, '%s/%s?runId=%d' % (url, page, runId)))
+        run = runlist.getRun(runId)
+        for metricId in run.metrics['metricId'][:nMetrics]:
+            urls.append(('metricResults', '%s/metricResults?runId=%d&metricId=%d' % (url, runId, metricId)))
+            urls.append(('getData', '%s/getData?runId=%d&metricId=%d&datatype=json' % (url, runId, metricId)))
+        for plotFile in run.plots['plotFile'][:nMetrics]:
+            urls.append(('plot', '%s/%s' % (url, os.path.join(run.outDir, plotFile))))
+    return urls
+
+
+async def loadTest(urls, nRequests, concurrency, gzip=True):
+    """Request nRequests urls (cycling through the list) with concurrency requests in flight.
+
+    Returns a dictionary of the response times for each page, and the total elapsed time.
+    """
+    client = AsyncHTTPClient(max_clients=concurrency)
+    queue = Queue()
+    for i in range(nRequests):
+        queue.put_nowait(urls[i % len(urls)])
+    times = {}
+    errors = []
+
+    async def worker():
+        while queue.qsize() > 0:
+            page, url = queue.get_nowait()
+            t = time.time()
+            response = await client.fetch(url, raise_error=False, decompress_response=gzip,
+                                          headers={'Accept-Encoding': 'gzip'} if gzip else None)
+            times.setdefault(page, []).append(time.time() - t)
+            if response.code != 200:
+                errors.append((response.code, url))
+
+    t = time.time()
+    await gen.multi([worker() for i in range(concurrency)])
+    return times, time.time() - t, errors
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Measure the requests/second served by a running showMaf," +
+                                     " for the pages of the runs in a (local) tracking database.")
+    parser.add_argument("-t", "--trackingDb", type=str,
+                        default=os.path.join(os.getcwd(), 'trackingDb_sqlite.db'),
+                        help="Tracking database filename (as used by showMaf).")
+    parser.add_argument("--url", type=str, default='http://localhost:8888', help="showMaf URL.")
+    parser.add_argument("-n", "--nRequests", type=int, default=500, help="Total number of requests.")
+    parser.add_argument("-c", "--concurrency", type=int, default=10,
+                        help="Number of requests to keep in flight.")
+    parser.add_argument("--nRuns", type=int, default=5, help="Number of runs to request pages from.")
+    parser.add_argument("--noGzip", dest='gzip', default=True, action='store_false',
+                        help="Do not accept gzipped responses.")
+    args = parser.parse_args()
+
+    urls = buildUrls(args.url.rstrip('/'), args.trackingDb, nRuns=args.nRuns)
+    times, elapsed, errors = ioloop.IOLoop.current().run_sync(
+        lambda: loadTest(urls, args.nRequests, args.concurrency, gzip=args.gzip))
+    print('%d requests (%d concurrent) in %.2f s: %.1f requests/second'
+          % (args.nRequests, args.concurrency, elapsed, args.nRequests / elapsed))
+    print('%-18s %8s %12s %12s' % ('page', 'requests', 'median (ms)', 'max (ms)'))
+    for page in sorted(times):
+        t = np.array(times[page]) * 1000
+        print('%-18s %8d %12.1f %12.1f' % (page, len(t), np.median(t), t.max()))
+    if len(errors) > 0:
+        print('%d requests failed, for example: %s' % (len(errors), errors[0]))
@@ -3,7 +3,7 @@ from __future__ import print_function
 from builtins import range
 import os
 import argparse
-from lsst.sims.maf.web import MafRunComparison
+from lsst.sims.maf.runComparison import RunComparison
 
 
 def mkstandardMetricDict(self):
@@ -79,6 +79,13 @@ def pandaprint(stats):
         print(writestring.lstrip(' ').rstrip(';'))
 
 
+def addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=None):
+    """Add a summary stat to the metricDict, to be fetched (for all runs at once) by RunComparison."""
+    name = ' '.join([str(x) for x in (summaryName, metricName, metricMetadata, slicerName) if x is not None])
+    metricDict[name] = {'metricName': metricName, 'metricMetadata': metricMetadata,
+                        'slicerName': slicerName, 'summaryName': summaryName}
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Run a simple comparison of a set of defined metrics between'
@@ -105,6 +112,9 @@ if __name__ == '__main__':
                         '\n '
                         'minion_1012'
                         '\n ')
+    parser.add_argument('--warehouse', type=str, default=None,
+                        help='Sqlite file in which to gather (and keep) the summary stats of all runs;\n'
+                        'only new or modified results databases are read when this is reused.')
     parser.set_defaults()
     args = parser.parse_args()
 
@@ -121,12 +131,9 @@ if __name__ == '__main__':
         else:
             rundirs.append(line.split()[0])
 
-    runCompare = MafRunComparison(baseDir=baseDir, runlist=runlist, rundirs=rundirs)
-
-    writestring = 'Summary_Name;'
-    for r in runlist:
-        writestring += '%s;' % r
-    print(writestring.rstrip(';'))
+    runCompare = RunComparison(baseDir=baseDir, runNames=runlist, rundirs=rundirs,
+                               warehouse=args.warehouse)
+    metricDict = {}
 
     # Get 'overview' statistics.
 
@@ -135,8 +142,7 @@ if __name__ == '__main__':
     metricMetadata = 'All Visits'
     slicerName = 'UniSlicer'
     summaryName = 'Count'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Total open shutter time (in megasec)
     # Need to add this to MAF
@@ -146,48 +152,42 @@ if __name__ == '__main__':
     metricMetadata = None
     slicerName = 'UniSlicer'
     summaryName = 'Fraction of total'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Mean Surveying efficiency (??)
     metricName = 'Total effective time of survey'
     metricMetadata = 'All Visits'
     slicerName = None
     summaryName = '(days)'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Number of nights with observations
     metricName = 'Nights with observations'
     metricMetadata = 'All Visits'
     slicerName = 'UniSlicer'
     summaryName = '(days)'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Median number of visits per night
     metricName = 'NVisits'
     metricMetadata = 'Per night'
     slicerName = 'OneDSlicer'
     summaryName = 'Median'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Median open shutter fraction
     metricName = 'OpenShutterFraction'
     metricMetadata = 'Per night'
     slicerName = None
     summaryName = 'Median'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Mean slew time
     metricName = 'Mean slewTime'
     slicerName = None
     metricMetadata = None
     summaryName = None
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Mean and Median number of visits per field
     metricName = 'NVisits'
@@ -195,52 +195,44 @@ if __name__ == '__main__':
     for summaryName in ('Mean', 'Median'):
         for f in ('u', 'g', 'r', 'i', 'z', 'y'):
             metricMetadata = '%s band, all props' % f
-            summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName,
-                                                  summaryName=summaryName)
-            pandaprint(summary)
+            addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # fO NV and Area
     metricName = 'fO'
     metricMetadata = 'All Visits (non-dithered)'
     slicerName = None
     summaryName = 'fONv: Area (sqdeg)'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
     summaryName = 'fOArea: Nvisits (#)'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Median r band seeing
     metricName = 'Median FWHMeff'
     metricMetadata = 'r band, all props'
     slicerName = None
     summaryName = 'Identity'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Median r band airmass
     metricName = 'Median airmass'
     metricMetadata = 'r band, all props'
     slicerName = 'UniSlicer'
     summaryName = 'Identity'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Median proper motion accuracy @20
     metricName = 'Proper Motion 20'
     metricMetadata = None
     slicerName = None
     summaryName = 'Median'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Median proper motion accuracy @24
     metricName = 'Proper Motion 24'
     metricMetadata = None
     slicerName = None
     summaryName = 'Median'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # WFD performance metrics
 
@@ -252,8 +244,7 @@ if __name__ == '__main__':
     for f in ('u', 'g', 'r', 'i', 'z', 'y'):
         metricMetadata.append('%s band, WFD' % f)
     for md in metricMetadata:
-        summary = runCompare.findSummaryStats(metricName, md, slicerName, summaryName=summaryName)
-        pandaprint(summary)
+        addStat(metricDict, metricName, md, slicerName, summaryName=summaryName)
 
     # Median number of visits per field
     metricName = 'NVisits'
@@ -263,8 +254,7 @@ if __name__ == '__main__':
     for f in ('u', 'g', 'r', 'i', 'z', 'y'):
         metricMetadata.append('%s band, WFD' % f)
     for md in metricMetadata:
-        summary = runCompare.findSummaryStats(metricName, md, slicerName, summaryName=summaryName)
-        pandaprint(summary)
+        addStat(metricDict, metricName, md, slicerName, summaryName=summaryName)
 
     # Median coadded depth per field
     metricName = 'CoaddM5'
@@ -274,19 +264,16 @@ if __name__ == '__main__':
     for f in ('u', 'g', 'r', 'i', 'z', 'y'):
         metricMetadata.append('%s band, WFD' % f)
     for md in metricMetadata:
-        summary = runCompare.findSummaryStats(metricName, md, slicerName, summaryName=summaryName)
-        pandaprint(summary)
+        addStat(metricDict, metricName, md, slicerName, summaryName=summaryName)
 
     # fO Nv and A
     metricName = 'fO'
     metricMetadata = 'WFD only (non-dithered)'
     slicerName = None
     summaryName = 'fONv: Area (sqdeg)'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
     summaryName = 'fOArea: Nvisits (#)'
-    summary = runCompare.findSummaryStats(metricName, metricMetadata, slicerName, summaryName=summaryName)
-    pandaprint(summary)
+    addStat(metricDict, metricName, metricMetadata, slicerName, summaryName=summaryName)
 
     # Median r and i band seeing
     metricName = 'Median FWHMeff'
@@ -296,8 +283,7 @@ if __name__ == '__main__':
     for f in (['r', 'i']):
         metricMetadata.append('%s band, WFD' % f)
     for md in metricMetadata:
-        summary = runCompare.findSummaryStats(metricName, md, slicerName, summaryName=summaryName)
-        pandaprint(summary)
+        addStat(metricDict, metricName, md, slicerName, summaryName=summaryName)
 
     # Median ury band sky brightness
     metricName = 'Median filtSkyBrightness'
@@ -307,13 +293,11 @@ if __name__ == '__main__':
     for f in (['u', 'r', 'y']):
         metricMetadata.append('%s band, WFD' % f)
     for md in metricMetadata:
-        summary = runCompare.findSummaryStats(metricName, md, slicerName, summaryName=summaryName)
-        pandaprint(summary)
+        addStat(metricDict, metricName, md, slicerName, summaryName=summaryName)
     # Median ury band airmass
     metricName = 'Median airmass'
     for md in metricMetadata:
-        summary = runCompare.findSummaryStats(metricName, md, slicerName, summaryName=summaryName)
-        pandaprint(summary)
+        addStat(metricDict, metricName, md, slicerName, summaryName=summaryName)
 
     # Median ury band normalized airmass
     # don't calculate this in maf standard output yet
@@ -321,5 +305,14 @@ if __name__ == '__main__':
     # Median ury hour angle
     # don't calculate this in maf standard output yet
 
-    # Close access to the results database files.
+    # Fetch all of the summary stats, for all runs, at once.
+    runCompare.addSummaryStats(metricDict)
+    writestring = 'Summary_Name;'
+    for r in runCompare.runlist:
+        writestring += '%s;' % r
+    print(writestring.rstrip(';'))
+    stats = runCompare.summaryStats.T
+    pandaprint([[name] + list(values) for name, values in zip(stats.index, stats.values)])
+
+    # Close access to the summary stat warehouse.
     runCompare.close()
@@ -1,6 +1,7 @@
 from __future__ import print_function, division
 from copy import deepcopy
 import os
+import glob
 import numpy as np
 import numpy.ma as ma
 import matplotlib.pyplot as plt
@@ -9,6 +10,7 @@ import lsst.sims.maf.slicers as slicers
 import lsst.sims.maf.stackers as stackers
 import lsst.sims.maf.plots as plots
 import lsst.sims.maf.metricBundles as mb
+from lsst.sims.maf.utils import readNpzArray
 from .colMapDict import ColMapDict
 from .common import summaryCompletenessAtTime, summaryCompletenessOverH, fractionPopulationAtThreshold
 
@@ -18,7 +20,7 @@ __all__ = ['defaultHrange', 'defaultCharacterization','setupMoSlicer',
            'characterizationInnerBatch', 'characterizationOuterBatch',
            'runFractionSummary', 'plotFractions',
            'plotSingle', 'plotActivity',
-           'readAndCombine', 'combineSubsets']
+           'findSplits', 'readAndCombine', 'streamCombine', 'combineSubsets', 'readAndCombineDiscovery']
 
 
 def defaultHrange(metadata):
@@ -530,16 +532,19 @@ def runCompletenessSummary(bdict, Hmark, times, outDir, resultsDb):
         comp = {}
         # Bundle = single metric bundle. Add differential and cumulative completeness.
         if 'Time' in bundle.metric.name:
-            for metric in summaryTimeMetrics:
+            # Calculate completeness at all H values and times once, then pick out each Hmark.
+            Hvals = bundle.slicer.slicePoints['H']
+            if len(Hvals) == bundle.metricValues.shape[1]:
+                completeness = metrics.completenessOverTime(bundle.metricValues, Hvals, times, Hindex=0.33)
+            else:
+                completeness = None
+            for metric in summaryTimeMetrics + summaryTimeMetrics2:
                 newkey = b + ' ' + metric.name
-                comp[newkey] = mb.makeCompletenessBundle(bundle, metric,
-                                                         Hmark=None, resultsDb=resultsDb)
-                comp[newkey].plotDict['times'] = times
-                comp[newkey].plotDict['Hval'] = metric.Hval
-            for metric in summaryTimeMetrics2:
-                newkey = b + ' ' + metric.name
-                comp[newkey] = mb.makeCompletenessBundle(bundle, metric,
-                                                         Hmark=None, resultsDb=resultsDb)
+                summaryValue = None
+                if completeness is not None:
+                    summaryValue = metric.summarize(completeness[int(metric.cumulative)], Hvals)
+                comp[newkey] = mb.makeCompletenessBundle(bundle, metric, Hmark=None, resultsDb=resultsDb,
+                                                         summaryValue=summaryValue)
                 comp[newkey].plotDict['times'] = times
                 comp[newkey].plotDict['Hval'] = metric.Hval
         elif 'N_Chances' in bundle.metric.name:
@@ -1037,6 +1042,30 @@ def plotActivity(bdict, figroot=None, resultsDb=None, outDir='.', figformat='pdf
             outfileRoot=figroot + '_activityDeg')
 
 
+def findSplits(orbitRoot, baseDir):
+    """Find the split directories (baseDir/orbitRoot_[split]) present on disk.
+
+    Parameters
+    ----------
+    orbitRoot: str
+        The root of the orbit file - l7_5k, mbas_5k, etc.
+    baseDir: str
+        The root directory containing the subset directories. (e.g. '.' often)
+
+    Returns
+    -------
+    list of int
+        The (sorted) integers describing the split directories found.
+    """
+    prefix = os.path.join(baseDir, f'{orbitRoot}_')
+    splits = []
+    for d in glob.glob(prefix + '*'):
+        suffix = d[len(prefix):]
+        if suffix.isdigit() and os.path.isdir(d):
+            splits.append(int(suffix))
+    return sorted(splits)
+
+
 def readAndCombine(orbitRoot, baseDir, splits, metricfile):
     """Read and combine the metric results from split locations, returning a single bundle.
 
@@ -1050,8 +1079,9 @@ def readAndCombine(orbitRoot, baseDir, splits, metricfile):
         The root of the orbit file - l7_5k, mbas_5k, etc.
     baseDir: str
         The root directory containing the subset directories. (e.g. '.' often)
-    splits: np.ndarray or list of ints
+    splits: np.ndarray or list of ints or None
         The integers describing the split directories (e.g. [0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+        If None, the split directories are found on disk with findSplits.
     metricfile: str
         The metric filename.
 
@@ -1062,14 +1092,90 @@ def readAndCombine(orbitRoot, baseDir, splits, metricfile):
 
     Note that this won't work for particularly complex metric values, such as the parent Discovery metrics.
     However, you can read and combine their child metrics, as for these we can propagate the data masks.
+    The parent Discovery metric values (stored as DiscoveryResults) can be combined with
+    readAndCombineDiscovery.
     """
-    subsets = {}
-    for i in splits:
-        subsets[i] = mb.createEmptyMoMetricBundle()
-        ddir = os.path.join(baseDir, f'{orbitRoot}_{i}')
-        subsets[i].read(os.path.join(ddir, metricfile))
-    bundle = combineSubsets(subsets)
-    return bundle
+    if splits is None:
+        splits = findSplits(orbitRoot, baseDir)
+    metricFiles = [os.path.join(baseDir, f'{orbitRoot}_{i}', metricfile) for i in splits]
+    return streamCombine(metricFiles)
+
+
+def _splitInfo(metricName, slicerName, slicerShape, slicerInit):
+    """Collect the information needed to check split metric files can be combined."""
+    orbitFile = slicerInit.get('orbitFile')
+    if orbitFile is not None:
+        orbitFile = os.path.split(orbitFile)[-1]
+    Hrange = slicerInit.get('Hrange')
+    if Hrange is not None:
+        Hrange = np.asarray(Hrange)
+    return {'metricName': metricName, 'slicerName': slicerName, 'shape': tuple(slicerShape),
+            'orbitFile': orbitFile, 'Hrange': Hrange}
+
+
+def _metricFileInfo(filename):
+    """Read just the header information needed to check split metric files can be combined."""
+    if not os.path.isfile(filename):
+        raise IOError('%s not found' % filename)
+    with np.load(filename, allow_pickle=True) as restored:
+        header = restored['header'][()]
+        slicerName = str(restored['slicerName'])
+        slicerInit = restored['slicer_init'][()]
+        slicerShape = restored['slicerShape']
+    return _splitInfo(header.get('metricName'), slicerName, slicerShape, slicerInit)
+
+
+def streamCombine(metricFiles):
+    """Combine the metric values from split metric output files, returning a single bundle.
+
+    Each split must have been calculated with the same orbit file and H values (with the values for the
+    objects not in that split masked), which is checked using only the file headers.
+    The first file provides the slicer and metadata for the combined bundle; the metric values and masks
+    of the remaining files are then copied into it in place, one file at a time
+    (memory-mapped where possible), so only the combined values are held in memory.
+    The first split with an unmasked value for a given object and H value provides the combined value.
+
+    Parameters
+    ----------
+    metricFiles: list of str
+        The split metric files to combine.
+
+    Returns
+    -------
+    ~lsst.sims.maf.bundle
+        A single metric bundle containing the combined data from each of the splits.
+    """
+    if len(metricFiles) == 0:
+        raise ValueError('No metric files to combine.')
+    # The first split is read once: it is both the combined bundle and the template for the checks.
+    joint = mb.createEmptyMoMetricBundle()
+    joint.read(metricFiles[0])
+    first = _splitInfo(joint.metric.name, joint.slicer.slicerName, joint.slicer.shape,
+                       joint.slicer.slicer_init)
+    for f in metricFiles[1:]:
+        info = _metricFileInfo(f)
+        for key in ('metricName', 'slicerName', 'shape', 'orbitFile'):
+            if info[key] != first[key]:
+                raise ValueError('%s has a different %s (%s) than %s (%s)'
+                                 % (f, key, info[key], metricFiles[0], first[key]))
+        if (first['Hrange'] is None) != (info['Hrange'] is None) or \
+                (first['Hrange'] is not None and not np.array_equal(first['Hrange'], info['Hrange'])):
+            raise ValueError('%s has a different Hrange than %s' % (f, metricFiles[0]))
+    data = joint.metricValues.data
+    mask = ma.getmaskarray(joint.metricValues).copy()
+    for f in metricFiles[1:]:
+        values = readNpzArray(f, 'metricValues')
+        if values.shape != data.shape:
+            raise ValueError('%s has metric values with shape %s, not %s' % (f, values.shape, data.shape))
+        valuesMask = readNpzArray(f, 'mask')
+        if valuesMask is None:
+            valuesMask = np.zeros(data.shape, bool)
+        update = mask & ~np.asarray(valuesMask)
+        np.copyto(data, values, where=update)
+        mask &= ~update
+        del values, valuesMask
+    joint.metricValues = ma.MaskedArray(data=data, mask=mask, fill_value=joint.metricValues.fill_value)
+    return joint
 
 
 def combineSubsets(mbSubsets):
@@ -1095,7 +1201,7 @@ def combineSubsets(mbSubsets):
     joint.metric = first.metric
     # Don't just use the slicer shape to define the metricValues, because of CompletenessBundles.
     metricValues = np.zeros(first.metricValues.shape, float)
-    metricValuesMask = np.zeros(first.metricValues.shape, bool)
+    metricValuesMask = np.ones(first.metricValues.shape, bool)
     for i in mbSubsets:
         metricValues += mbSubsets[i].metricValues.filled(0)
         metricValuesMask = np.where(metricValuesMask & mbSubsets[i].metricValues.mask, True, False)
@@ -1104,4 +1210,38 @@ def combineSubsets(mbSubsets):
     joint.runName = first.runName
     joint.fileRoot = first.fileRoot.replace('.npz', '')
     joint.plotDict = first.plotDict
-    return joint
\ No newline at end of file
+    return joint
+
+
+def readAndCombineDiscovery(orbitRoot, baseDir, splits, discoveryfile):
+    """Read and combine the parent Discovery metric values from split locations.
+
+    This will read the (columnar) DiscoveryResults from
+    baseDir/orbitRoot_[split]/discoveryfile
+    memory-mapping each split, and combine them into a single DiscoveryResults object.
+
+    Parameters
+    ----------
+    orbitRoot: str
+        The root of the orbit file - l7_5k, mbas_5k, etc.
+    baseDir: str
+        The root directory containing the subset directories. (e.g. '.' often)
+    splits: np.ndarray or list of ints or None
+        The integers describing the split directories (e.g. [0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+        If None, the split directories are found on disk with findSplits.
+    discoveryfile: str
+        The name of the DiscoveryResults directory (<fileRoot>.discovery).
+
+    Returns
+    -------
+    ~lsst.sims.maf.metricBundles.DiscoveryResults
+        The combined parent Discovery metric values, which can be written to disk
+        or passed to MoMetricBundle.setParentResults to calculate child metrics.
+    """
+    subsets = []
+    if splits is None:
+        splits = findSplits(orbitRoot, baseDir)
+    for i in splits:
+        ddir = os.path.join(baseDir, f'{orbitRoot}_{i}')
+        subsets.append(mb.DiscoveryResults.read(os.path.join(ddir, discoveryfile)))
+    return mb.combineDiscoveryResults(subsets)
@@ -1,7 +1,11 @@
 from builtins import str
 from builtins import object
 import os, warnings
-from sqlalchemy import create_engine
+import sqlite3
+from collections import defaultdict
+from urllib.parse import quote
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine import url
 from sqlalchemy.ext.declarative import declarative_base
@@ -16,6 +20,7 @@ Base = declarative_base()
 
 __all__ = ['MetricRow', 'DisplayRow', 'PlotRow', 'SummaryStatRow', 'ResultsDb']
 
+
 class MetricRow(Base):
     """
     Define contents and format of metric list table.
@@ -25,7 +30,7 @@ class MetricRow(Base):
     __tablename__ = "metrics"
     # Define columns in metric list table.
     metricId = Column(Integer, primary_key=True)
-    metricName = Column(String)
+    metricName = Column(String, index=True)
     slicerName = Column(String)
     simDataName = Column(String)
     sqlConstraint = Column(String)
@@ -45,7 +50,7 @@ class DisplayRow(Base):
     """
     __tablename__ = "displays"
     displayId = Column(Integer, primary_key=True)
-    metricId = Column(Integer, ForeignKey('metrics.metricId'))
+    metricId = Column(Integer, ForeignKey('metrics.metricId'), index=True)
     # Group for displaying metric (in webpages).
     displayGroup = Column(String)
     # Subgroup for displaying metric.
@@ -70,7 +75,7 @@ class PlotRow(Base):
     # Define columns in plot list table.
     plotId = Column(Integer, primary_key=True)
     # Matches metricID in MetricList table.
-    metricId = Column(Integer, ForeignKey('metrics.metricId'))
+    metricId = Column(Integer, ForeignKey('metrics.metricId'), index=True)
     plotType = Column(String)
     plotFile = Column(String)
     metric = relationship("MetricRow", backref=backref('plots', order_by=plotId))
@@ -89,7 +94,7 @@ class SummaryStatRow(Base):
     # Define columns in plot list table.
     statId = Column(Integer, primary_key=True)
     # Matches metricID in MetricList table.
-    metricId = Column(Integer, ForeignKey('metrics.metricId'))
+    metricId = Column(Integer, ForeignKey('metrics.metricId'), index=True)
     summaryName = Column(String)
     summaryValue = Column(Float)
     metric = relationship("MetricRow", backref=backref('summarystats', order_by=statId))
@@ -100,10 +105,20 @@ class SummaryStatRow(Base):
 class ResultsDb(object):
     """The ResultsDb is a sqlite database containing information on the metrics run via MAF,
     the plots created, the display information (such as captions), and any summary statistics output.
+
+    By default, each update is committed to the database immediately. Within a `batchWrites` block
+    (as used by the MetricBundleGroup), updates are instead queued in the session and committed
+    together, in a single transaction, when the block ends (or `flush` is called).
+    The first `batchWrites` block also switches the database to write-ahead logging and adds any
+    missing indexes; `close` switches the database back to the default (rollback) journal.
+
+    Readers (such as showMaf) should use readOnly=True, which does not modify the database file.
     """
-    def __init__(self, outDir= None, database=None, verbose=False):
+    def __init__(self, outDir= None, database=None, verbose=False, readOnly=False):
         """
         Instantiate the results database, creating metrics, plots and summarystats tables.
+
+        If readOnly is True, the (existing) database is opened read-only, and no tables are created.
         """
         # We now require resultsDb to be a sqlite file (for simplicity). Leaving as attribute though.
         self.driver = 'sqlite'
@@ -127,24 +142,125 @@ class ResultsDb(object):
                 database = os.path.join(outDir, database)
             self.database = database
 
-        dbAddress = url.URL(self.driver, database=self.database)
-
-        engine = create_engine(dbAddress, echo=verbose)
+        self.readOnly = readOnly
+        # Write-ahead logging is used while batching writes (see batchWrites).
+        self._wal = False
+        if readOnly:
+            if not os.path.isfile(self.database):
+                raise IOError('%s not found' % self.database)
+            # Open with sqlite's read-only mode, so the database file is never written.
+            roAddress = 'file:%s?mode=ro' % quote(os.path.abspath(self.database))
+            engine = create_engine('sqlite://', echo=verbose,
+                                   creator=lambda: sqlite3.connect(roAddress, uri=True))
+        else:
+            dbAddress = url.URL(self.driver, database=self.database)
+            engine = create_engine(dbAddress, echo=verbose)
+            event.listen(engine, 'connect', self._setSqlitePragmas)
+        self.engine = engine
         self.Session = sessionmaker(bind=engine)
         self.session = self.Session()
-        # Create the tables, if they don't already exist.
+        if not readOnly:
+            # Create the tables, if they don't already exist.
+            try:
+                Base.metadata.create_all(engine)
+            except DatabaseError:
+                raise ValueError("Cannot create a %s database at %s. Check directory exists." %(self.driver,
+                                                                                                self.database))
+        self.slen = 1024
+        # Write updates immediately, unless in a batchWrites block.
+        self.batch = False
+        # Cache of metricIds, keyed by (metricName, slicerName, simDataName, metricMetadata, sqlConstraint).
+        self._metricIds = {}
+
+    def _setSqlitePragmas(self, dbapiConnection, connectionRecord):
+        # With write-ahead logging, each commit does not need to sync the database file.
+        if self._wal:
+            cursor = dbapiConnection.cursor()
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.close()
+
+    def _setJournalMode(self, mode):
+        """Set the journal mode of the database file, returning True if this succeeded.
+        The journal mode can't be changed while other connections are using the database.
+        """
+        self.session.commit()
         try:
-            Base.metadata.create_all(engine)
+            with self.engine.connect() as conn:
+                if mode.upper() != 'WAL':
+                    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                result = conn.execute('PRAGMA journal_mode=%s' % mode).scalar()
         except DatabaseError:
-            raise ValueError("Cannot create a %s database at %s. Check directory exists." %(self.driver,
-                                                                                            self.database))
-        self.slen = 1024
+            return False
+        return str(result).upper() == mode.upper()
+
+    def _startWriting(self):
+        """Switch to write-ahead logging and add any missing indexes, before (batched) writes.
+        """
+        if self.readOnly or self._wal:
+            return
+        self._wal = self._setJournalMode('WAL')
+        self._addIndexes(self.engine)
+
+    def _addIndexes(self, engine):
+        """Add the indexes on the lookup columns to tables in existing databases, if they are missing.
+        """
+        inspector = inspect(engine)
+        for table in Base.metadata.sorted_tables:
+            existing = set([index['name'] for index in inspector.get_indexes(table.name)])
+            for index in table.indexes:
+                if index.name not in existing:
+                    try:
+                        index.create(engine)
+                    except DatabaseError:
+                        # Probably a read-only database; the indexes are not required.
+                        pass
+
+    def _commit(self):
+        """Commit the session, unless updates are being batched.
+        """
+        if not self.batch:
+            self.session.commit()
+
+    def flush(self):
+        """
+        Commit all queued updates to the database, in a single transaction.
+        """
+        self.session.commit()
+
+    @contextmanager
+    def batchWrites(self):
+        """
+        Context manager to queue all updates within the block, committing them together at the end.
+
+        Examples
+        --------
+        >>> with resultsDb.batchWrites():
+        ...     for bundle in bundles:
+        ...         bundle.writeDb(resultsDb)
+        """
+        previous = self.batch
+        if not previous:
+            self._startWriting()
+        self.batch = True
+        try:
+            yield self
+        finally:
+            self.batch = previous
+            self.flush()
 
     def close(self):
         """
         Close connection to database.
+
+        If write-ahead logging was used, the log is checkpointed into the database file and the
+        database is switched back to the default journal (unless it is still in use elsewhere).
         """
+        self.flush()
+        if self._wal:
+            if self._setJournalMode('DELETE'):
+                self._wal = False
         self.session.close()
+        self.engine.dispose()
 
     def updateMetric(self, metricName, slicerName, simDataName, sqlConstraint,
                   metricMetadata, metricDataFile):
@@ -172,6 +288,9 @@ class ResultsDb(object):
         if metricDataFile is None:
             metricDataFile = 'NULL'
         # Check if metric has already been added to database.
+        key = (metricName, slicerName, simDataName, metricMetadata, sqlConstraint)
+        if key in self._metricIds:
+            return self._metricIds[key]
         prev = self.session.query(MetricRow).filter_by(metricName=metricName,
                                                        slicerName=slicerName,
                                                        simDataName=simDataName,
@@ -182,9 +301,12 @@ class ResultsDb(object):
                                    sqlConstraint=sqlConstraint, metricMetadata=metricMetadata,
                                    metricDataFile=metricDataFile)
             self.session.add(metricinfo)
-            self.session.commit()
+            # Send the new row to the database (within the current transaction) to get its metricId.
+            self.session.flush()
+            self._commit()
         else:
             metricinfo = prev[0]
+        self._metricIds[key] = metricinfo.metricId
         return metricinfo.metricId
 
     def updateDisplay(self, metricId, displayDict, overwrite=True):
@@ -225,7 +347,7 @@ class ResultsDb(object):
                                  displayGroup=displayGroup, displaySubgroup=displaySubgroup,
                                  displayOrder=displayOrder, displayCaption=displayCaption)
         self.session.add(displayinfo)
-        self.session.commit()
+        self._commit()
 
     def updatePlot(self, metricId, plotType, plotFile):
         """
@@ -244,7 +366,7 @@ class ResultsDb(object):
                 self.session.delete(p)
         plotinfo = PlotRow(metricId=metricId, plotType=plotType, plotFile=plotFile)
         self.session.add(plotinfo)
-        self.session.commit()
+        self._commit()
 
     def updateSummaryStat(self, metricId, summaryName, summaryValue):
         """
@@ -274,7 +396,7 @@ class ResultsDb(object):
                                                  summaryName=summaryName + ' ' + sSuffix,
                                                  summaryValue=value['value'])
                     self.session.add(summarystat)
-                    self.session.commit()
+                self._commit()
             else:
                 warnings.warn('Warning! Cannot save non-conforming summary statistic.')
         # Most summary statistics will be simple floats.
@@ -283,7 +405,7 @@ class ResultsDb(object):
                 summarystat = SummaryStatRow(metricId=metricId, summaryName=summaryName,
                                              summaryValue=summaryValue)
                 self.session.add(summarystat)
-                self.session.commit()
+                self._commit()
             else:
                 warnings.warn('Warning! Cannot save summary statistic that is not a simple float or int')
 
@@ -325,6 +447,23 @@ class ResultsDb(object):
             metricId.append(m.metricId)
         return metricId
 
+    def _queryByMetricId(self, query, metricId, orderBy):
+        """Return the rows of a query (starting with MetricRow) for each of the metricIds in turn.
+
+        The rows are fetched with a few queries for many metricIds at once, rather than one per metricId,
+        but are returned in the same order: by metricId (in the order of the list), then by orderBy.
+        """
+        metricId = [int(mid) for mid in metricId]
+        rows = defaultdict(list)
+        # Sqlite limits the number of parameters in a single query.
+        chunk = 500
+        for i in range(0, len(metricId), chunk):
+            for row in query.filter(MetricRow.metricId.in_(metricId[i:i + chunk])).order_by(orderBy):
+                rows[row[0].metricId].append(row)
+        for mid in metricId:
+            for row in rows.get(mid, []):
+                yield row
+
     def getAllMetricIds(self):
         """
         Return a list of all metricIds.
@@ -345,15 +484,14 @@ class ResultsDb(object):
         if not hasattr(metricId, '__iter__'):
             metricId = [metricId,]
         summarystats = []
-        for mid in metricId:
-            # Join the metric table and the summarystat table, based on the metricID (the second filter)
-            query = (self.session.query(MetricRow, SummaryStatRow).filter(MetricRow.metricId == mid)
-                     .filter(MetricRow.metricId == SummaryStatRow.metricId))
-            if summaryName is not None:
-                query = query.filter(SummaryStatRow.summaryName == summaryName)
-            for m, s in query:
-                summarystats.append((m.metricId, m.metricName, m.slicerName, m.metricMetadata,
-                                     s.summaryName, s.summaryValue))
+        # Join the metric table and the summarystat table, based on the metricID.
+        query = (self.session.query(MetricRow, SummaryStatRow)
+                 .filter(MetricRow.metricId == SummaryStatRow.metricId))
+        if summaryName is not None:
+            query = query.filter(SummaryStatRow.summaryName == summaryName)
+        for m, s in self._queryByMetricId(query, metricId, SummaryStatRow.statId):
+            summarystats.append((m.metricId, m.metricName, m.slicerName, m.metricMetadata,
+                                 s.summaryName, s.summaryValue))
         # Convert to numpy array.
         dtype = np.dtype([('metricId', int), ('metricName', np.str_, self.slen),
                           ('slicerName', np.str_, self.slen), ('metricMetadata', np.str_, self.slen),
@@ -371,15 +509,13 @@ class ResultsDb(object):
         if not hasattr(metricId, '__iter__'):
             metricId = [metricId,]
         plotFiles = []
-        for mid in metricId:
-            # Join the metric table and the plot table based on the metricID (the second filter does the join)
-            query = (self.session.query(MetricRow, PlotRow).filter(MetricRow.metricId == mid)
-                     .filter(MetricRow.metricId == PlotRow.metricId))
-            for m, p in query:
-                # The plotFile typically ends with .pdf (but the rest of name can have '.' or '_')
-                thumbfile = 'thumb.' + '.'.join(p.plotFile.split('.')[:-1]) + '.png'
-                plotFiles.append((m.metricId, m.metricName, m.metricMetadata,
-                                  p.plotType, p.plotFile, thumbfile))
+        # Join the metric table and the plot table based on the metricID.
+        query = self.session.query(MetricRow, PlotRow).filter(MetricRow.metricId == PlotRow.metricId)
+        for m, p in self._queryByMetricId(query, metricId, PlotRow.plotId):
+            # The plotFile typically ends with .pdf (but the rest of name can have '.' or '_')
+            thumbfile = 'thumb.' + '.'.join(p.plotFile.split('.')[:-1]) + '.png'
+            plotFiles.append((m.metricId, m.metricName, m.metricMetadata,
+                              p.plotType, p.plotFile, thumbfile))
         # Convert to numpy array.
         dtype = np.dtype([('metricId', int), ('metricName', np.str_, self.slen),
                           ('metricMetadata', np.str_, self.slen),
@@ -444,16 +580,14 @@ class ResultsDb(object):
         if not hasattr(metricId, '__iter__'):
             metricId = [metricId,]
         metricInfo = []
-        for mId in metricId:
-            # Query for all rows in metrics and displays that match any of the metricIds.
-            query = (self.session.query(MetricRow, DisplayRow).filter(MetricRow.metricId==mId)
-                     .filter(MetricRow.metricId==DisplayRow.metricId))
-            for m, d in query:
-                baseMetricName = m.metricName.split('_')[0]
-                mInfo = (m.metricId, m.metricName, baseMetricName, m.slicerName,
-                        m.sqlConstraint, m.metricMetadata, m.metricDataFile,
-                        d.displayGroup, d.displaySubgroup, d.displayOrder, d.displayCaption)
-                metricInfo.append(mInfo)
+        # Query for all rows in metrics and displays that match any of the metricIds.
+        query = self.session.query(MetricRow, DisplayRow).filter(MetricRow.metricId == DisplayRow.metricId)
+        for m, d in self._queryByMetricId(query, metricId, DisplayRow.displayId):
+            baseMetricName = m.metricName.split('_')[0]
+            mInfo = (m.metricId, m.metricName, baseMetricName, m.slicerName,
+                    m.sqlConstraint, m.metricMetadata, m.metricDataFile,
+                    d.displayGroup, d.displaySubgroup, d.displayOrder, d.displayCaption)
+            metricInfo.append(mInfo)
         # Convert to numpy array.
         dtype = np.dtype([('metricId', int), ('metricName', np.str_, self.slen),
                           ('baseMetricNames', np.str_, self.slen),
@@ -2,7 +2,7 @@ import os
 import numpy as np
 import healpy as hp
 from lsst.utils import getPackageDir
-from lsst.sims.maf.utils import radec2pix
+from lsst.sims.maf.utils import radec2pix, crowdingErrorPerSeeing
 from . import BaseMap
 
 __all__ = ['StellarDensityMap']
@@ -11,6 +11,8 @@ class StellarDensityMap(BaseMap):
     """
     Return the cumulative stellar luminosity function for each slicepoint. Units of stars per sq degree.
     Uses a healpix map of nside=64. Uses the nearest healpix point for other ra,dec values.
+    Also adds the crowding error (for one arcsecond seeing) at each magnitude of the luminosity function,
+    for use by the crowding metrics.
 
     Parameters
     ----------
@@ -35,6 +37,7 @@ class StellarDensityMap(BaseMap):
         self.starMap = starMap['starDensity'].copy()
         self.starMapBins = starMap['bins'].copy()
         self.starmapNside = hp.npix2nside(np.size(self.starMap[:,0]))
+        self.starCrowdErr = crowdingErrorPerSeeing(self.starMapBins[1:], self.starMap)
 
     def run(self, slicePoints):
         self._readMap()
@@ -43,11 +46,13 @@ class StellarDensityMap(BaseMap):
         if 'nside' in slicePoints:
             if slicePoints['nside'] == self.starmapNside:
                 slicePoints[f'starLumFunc_{self.filtername}'] = self.starMap
+                slicePoints[f'starCrowdErr_{self.filtername}'] = self.starCrowdErr
                 nsideMatch = True
         if not nsideMatch:
             # Compute the healpix for each slicepoint on the nside=64 grid
             indx = radec2pix(self.starmapNside, slicePoints['ra'], slicePoints['dec'])
             slicePoints[f'starLumFunc_{self.filtername}'] = self.starMap[indx,:]
+            slicePoints[f'starCrowdErr_{self.filtername}'] = self.starCrowdErr[indx,:]
 
         slicePoints[f'starMapBins_{self.filtername}'] = self.starMapBins
         return slicePoints
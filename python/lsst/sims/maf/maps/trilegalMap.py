@@ -3,6 +3,7 @@ import numpy as np
 import healpy as hp
 from lsst.utils import getPackageDir
 from lsst.sims.utils import _hpid2RaDec, _equatorialFromGalactic, _buildTree, _xyz_from_ra_dec
+from lsst.sims.maf.utils import crowdingErrorPerSeeing
 from . import BaseMap
 
 __all__ = ['TrilegalDensityMap']
@@ -11,6 +12,8 @@ __all__ = ['TrilegalDensityMap']
 class TrilegalDensityMap(BaseMap):
     """
     Return the cumulative stellar luminosity function for each slicepoint. Units of stars per sq degree.
+    Also adds the crowding error (for one arcsecond seeing) at each magnitude of the luminosity function,
+    for use by the crowding metrics.
 
     Parameters
     ----------
@@ -36,6 +39,7 @@ class TrilegalDensityMap(BaseMap):
         self.starMap = starMap['starDensity'].copy()
         self.starMapBins = starMap['bins'].copy()
         self.starmapNside = hp.npix2nside(np.size(self.starMap[:, 0]))
+        self.starCrowdErr = crowdingErrorPerSeeing(self.starMapBins[1:], self.starMap)
         # note, the trilegal maps are in galactic coordinates, and nested healpix.
         gal_l, gal_b = _hpid2RaDec(self.nside, np.arange(hp.nside2npix(self.nside)), nest=True)
 
@@ -51,5 +55,6 @@ class TrilegalDensityMap(BaseMap):
         dist, indices = self.tree.query(list(zip(x, y, z)))
 
         slicePoints['starLumFunc_%s' % self.filtername] = self.starMap[indices, :]
+        slicePoints['starCrowdErr_%s' % self.filtername] = self.starCrowdErr[indices, :]
         slicePoints['starMapBins_%s' % self.filtername] = self.starMapBins
         return slicePoints
@@ -28,6 +28,15 @@ def createEmptyMetricBundle():
     return MetricBundle(metrics.BaseMetric(), slicers.BaseSlicer(), '')
 
 
+def _reduceName(reduceFunc):
+    """Return the name of reduceFunc without its 'reduce' prefix (the key used in metric.reduceFuncs).
+    """
+    name = reduceFunc.__name__
+    if name.startswith('reduce'):
+        name = name[len('reduce'):]
+    return name
+
+
 class MetricBundle(object):
     """The MetricBundle is defined by a combination of a (single) metric, slicer and
     constraint - together these define a unique combination of an opsim benchmark.
@@ -42,8 +51,13 @@ class MetricBundle(object):
     Plotting parameters and display parameters (for showMaf) are saved in the MetricBundle,
     as well as additional metadata such as the opsim run name, and relevant stackers and maps
     to apply when calculating the metric values.
+
+    MetricBundleGroup.readAll(lazy=True) leaves the metric values (and the slicer with the
+    slicePoints) on disk until they are first used.
     """
     colInfo = ColInfo()
+    # The file to read the metricValues and slicer from, when first needed (see read).
+    _lazyFile = None
 
     def __init__(self, metric, slicer, constraint=None, sqlconstraint=None,
                  stackerList=None, runName='opsim', metadata=None,
@@ -127,9 +141,50 @@ class MetricBundle(object):
         self.metricValues = None
         self.summaryValues = None
 
+    @property
+    def metricValues(self):
+        if self._lazyFile is not None:
+            self._readLazy()
+        return self._metricValues
+
+    @metricValues.setter
+    def metricValues(self, metricValues):
+        # Setting the values replaces any values still to be read from disk.
+        self._lazyFile = None
+        self._metricValues = metricValues
+
+    @property
+    def slicer(self):
+        if self._lazyFile is not None:
+            self._readLazy()
+        return self._slicer
+
+    @slicer.setter
+    def slicer(self, slicer):
+        if self._lazyFile is not None:
+            self._readLazy()
+        self._slicer = slicer
+
+    def _readLater(self, filename):
+        """Read the metricValues and slicer from filename (replacing the current slicer)
+        when they are first used."""
+        self._lazyFile = filename
+
+    def _readLazy(self):
+        """Read the metricValues and slicer from the file set by _readLater."""
+        filename = self._lazyFile
+        if filename is None:
+            return
+        metricValues, slicer, header = slicers.BaseSlicer().readData(filename)
+        metricValues.fill_value = slicer.badval
+        self._slicer = slicer
+        self._metricValues = metricValues
+        self._lazyFile = None
+
     def _resetMetricBundle(self):
         """Reset all properties of MetricBundle.
         """
+        self._lazyFile = None
         self.metric = None
         self.slicer = None
         self.constraint = None
@@ -486,22 +541,24 @@ class MetricBundle(object):
         if self.summaryValues is None:
             self.summaryValues = {}
         if self.summaryMetrics is not None:
-            # Build array of metric values, to use for (most) summary statistics.
-            rarr_std = np.array(list(zip(self.metricValues.compressed())),
-                                dtype=[('metricdata', self.metricValues.dtype)])
+            # Arrays of metric values to use for the summary statistics (with a SliceContext, so that
+            # summary metrics which use the same array can share the sorted values, mean, etc.).
+            # Most summary statistics use the unmasked metric values (key None).
+            summaryData = {}
             for m in self.summaryMetrics:
                 # The summary metric colname should already be set to 'metricdata', but in case it's not:
                 m.colname = 'metricdata'
                 summaryName = m.name.replace(' metricdata', '').replace(' None', '')
-                if hasattr(m, 'maskVal'):
-                    # summary metric requests to use the mask value, as specified by itself,
-                    #  rather than skipping masked vals.
-                    rarr = np.array(list(zip(self.metricValues.filled(m.maskVal))),
-                                    dtype=[('metricdata', self.metricValues.dtype)])
-                else:
-                    rarr = rarr_std
+                # A summary metric can request to use the mask value, as specified by itself,
+                #  rather than skipping masked vals.
+                key = getattr(m, 'maskVal', None)
+                if key not in summaryData:
+                    summaryData[key] = self._summaryData(key)
+                rarr, sliceContext = summaryData[key]
                 if np.size(rarr) == 0:
                     summaryVal = self.slicer.badval
+                elif m.useSliceContext:
+                    summaryVal = m.run(rarr, sliceContext=sliceContext)
                 else:
                     summaryVal = m.run(rarr)
                 self.summaryValues[summaryName] = summaryVal
@@ -511,6 +568,18 @@ class MetricBundle(object):
                                                       self.runName, self.constraint, self.metadata, None)
                     resultsDb.updateSummaryStat(metricId, summaryName=summaryName, summaryValue=summaryVal)
 
+    def _summaryData(self, maskVal=None):
+        """Build the structured array of metric values (and its SliceContext) used by summary metrics.
+        If maskVal is None, masked metric values are skipped; otherwise they are filled with maskVal.
+        """
+        if maskVal is None:
+            values = self.metricValues.compressed()
+        else:
+            values = self.metricValues.filled(maskVal)
+        rarr = np.empty(len(values), dtype=[('metricdata', self.metricValues.dtype)])
+        rarr['metricdata'] = values
+        return rarr, metrics.SliceContext(rarr)
+
     def reduceMetric(self, reduceFunc, reducePlotDict=None, reduceDisplayDict=None):
         """Run 'reduceFunc' (any function that operates on self.metricValues).
         Typically reduceFunc will be the metric reduce functions, as they are tailored to expect the
@@ -533,8 +602,38 @@ class MetricBundle(object):
            New metric bundle, inheriting metadata from this metric bundle, but containing the new
            metric values calculated with the 'reduceFunc'.
         """
+        newmetricBundle = self._setupReduceBundle(reduceFunc, reducePlotDict, reduceDisplayDict)
+        newmetricBundle.metricValues.data[:] = self._reduceValues([reduceFunc])[0]
+        return newmetricBundle
+
+    def reduceMetrics(self, reduceFuncs):
+        """Run all of 'reduceFuncs' on self.metricValues, in a single pass through the metric values.
+
+        Reduce functions which the metric also implements in a vectorized form (see
+        BaseMetric.vectorReduceFuncs) are calculated for all slicePoints at once; the others are
+        calculated together, slicePoint by slicePoint.
+
+        Parameters
+        ----------
+        reduceFuncs : list of Func
+            The functions that will operate on self.metricValues (typically metric.reduce* functions).
+
+        Returns
+        -------
+        list of MetricBundle
+           New metric bundles (one for each reduceFunc, in the same order), inheriting metadata
+           from this metric bundle, but containing the new metric values calculated with each reduceFunc.
+        """
+        newmetricBundles = [self._setupReduceBundle(reduceFunc) for reduceFunc in reduceFuncs]
+        for newmetricBundle, values in zip(newmetricBundles, self._reduceValues(reduceFuncs)):
+            newmetricBundle.metricValues.data[:] = values
+        return newmetricBundles
+
+    def _setupReduceBundle(self, reduceFunc, reducePlotDict=None, reduceDisplayDict=None):
+        """Set up the new metricBundle which will hold the results of reduceFunc.
+        """
         # Generate a name for the metric values processed by the reduceFunc.
-        rName = reduceFunc.__name__.replace('reduce', '')
+        rName = _reduceName(reduceFunc)
         reduceName = self.metric.name + '_' + rName
         # Set up metricBundle to store new metric values, and add plotDict/displayDict.
         newmetric = deepcopy(self.metric)
@@ -573,12 +672,32 @@ class MetricBundle(object):
         newmetricBundle.metricValues = ma.MaskedArray(data=np.empty(len(self.slicer), 'float'),
                                                       mask=self.metricValues.mask,
                                                       fill_value=self.slicer.badval)
-        # Fill the reduced metric data using the reduce function.
-        for i, (mVal, mMask) in enumerate(zip(self.metricValues.data, self.metricValues.mask)):
-            if not mMask:
-                newmetricBundle.metricValues.data[i] = reduceFunc(mVal)
         return newmetricBundle
 
+    def _reduceValues(self, reduceFuncs):
+        """Calculate the reduced values of each reduceFunc, at all unmasked slicePoints.
+        Values at masked slicePoints are left unset.
+        """
+        good = np.where(~ma.getmaskarray(self.metricValues))[0]
+        values = self.metricValues.data[good]
+        results = [np.empty(len(self.slicer), 'float') for reduceFunc in reduceFuncs]
+        loopFuncs = []
+        for result, reduceFunc in zip(results, reduceFuncs):
+            # Use the metric's vectorized version of this reduce function, if it has one.
+            rName = _reduceName(reduceFunc)
+            vectorFunc = getattr(self.metric, 'vectorReduceFuncs', {}).get(rName)
+            if vectorFunc is not None and self.metric.reduceFuncs.get(rName) == reduceFunc:
+                if len(good) > 0:
+                    result[good] = vectorFunc(values)
+            else:
+                loopFuncs.append((result, reduceFunc))
+        # Calculate all of the other reduce functions together, for each slicePoint.
+        if len(loopFuncs) > 0:
+            for i, mVal in zip(good, values):
+                for result, reduceFunc in loopFuncs:
+                    result[i] = reduceFunc(mVal)
+        return results
+
     def plot(self, plotHandler=None, plotFunc=None, outfileSuffix=None, savefig=False):
         """
         Create all plots available from the slicer. plotHandler holds the output directory info, etc.
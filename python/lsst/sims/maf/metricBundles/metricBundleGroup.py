@@ -1,6 +1,10 @@
 from __future__ import print_function
 from builtins import object
 import os
+import copy
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import numpy as np
 import numpy.ma as ma
 import matplotlib.pyplot as plt
@@ -10,8 +14,9 @@ import lsst.sims.maf.db as db
 import lsst.sims.maf.utils as utils
 from lsst.sims.maf.plots import PlotHandler
 import lsst.sims.maf.maps as maps
+import lsst.sims.maf.metrics as metrics
 from lsst.sims.maf.stackers import BaseDitherStacker
-from .metricBundle import MetricBundle, createEmptyMetricBundle
+from .metricBundle import MetricBundle, createEmptyMetricBundle, _reduceName
 import warnings
 
 __all__ = ['makeBundlesDictFromList', 'MetricBundleGroup']
@@ -35,6 +40,51 @@ def makeBundlesDictFromList(bundleList):
     return bDict
 
 
+# Slicer attributes which are only used to slice the simData (and can be large or unpicklable),
+# so are not sent to the plotting processes.
+_sliceLookupAttrs = ('_sliceSimData', 'opsimtree', 'sliceLookup', 'simIdxs', 'left', 'lefts',
+                     'camera', 'chipNames')
+
+
+def _plotCopy(bundle):
+    """Return a shallow copy of a MetricBundle, with only what is needed to plot it.
+
+    The stackers, maps and the slicer lookup attributes are dropped, so that the copy is
+    smaller to send to a plotting process.
+    """
+    # Copy the slicer first, as this reads the bundle (if it is still on disk).
+    slicer = copy.copy(bundle.slicer)
+    plotBundle = copy.copy(bundle)
+    plotBundle.stackerList = []
+    plotBundle.mapsList = []
+    plotBundle.slicer = slicer
+    for attr in _sliceLookupAttrs:
+        plotBundle.slicer.__dict__.pop(attr, None)
+    return plotBundle
+
+
+def _initPlotProcess():
+    """Use the non-interactive Agg backend in the plotting processes.
+    """
+    plt.switch_backend('Agg')
+
+
+def _plotBundle(bundle, plotHandlerKwargs, outfileSuffix, savefig):
+    """Make and save the plots of a MetricBundle, in a plotting process of MetricBundleGroup.plotCurrent.
+
+    Returns the information about each saved figure (for the resultsDb), and any error message.
+    """
+    plotHandler = PlotHandler(resultsDb=None, savefig=savefig, **plotHandlerKwargs)
+    message = None
+    try:
+        bundle.plot(plotHandler=plotHandler, outfileSuffix=outfileSuffix, savefig=savefig)
+    except ValueError as ve:
+        message = 'Plotting failed for metricBundle %s.' % (bundle.fileRoot)
+        message += ' Error message: %s' % (ve)
+    plt.close('all')
+    return plotHandler.savedFigs, message
+
+
 class MetricBundleGroup(object):
     """The MetricBundleGroup exists to calculate the metric values for a group of
     MetricBundles.
@@ -109,6 +159,8 @@ class MetricBundleGroup(object):
         if not isinstance(dbObj, db.Database):
             warnings.warn('Warning: dbObj should be an instantiated Database (or child) object.')
         self.dbObj = dbObj
+        # The time column: simData is kept in time order, so slices can be time-ordered without sorting.
+        self.timeCol = getattr(self.dbObj, 'mjdCol', 'observationStartMJD')
         # Set the table we're going to be querying.
         self.dbTable = dbTable
         if self.dbTable is None and self.dbObj is not None:
@@ -125,6 +177,14 @@ class MetricBundleGroup(object):
         for bk in bundleDict:
             self.hasRun[bk] = False
 
+    def _batchResultsDb(self):
+        """Queue the resultsDb updates within a step of the processing (such as calculating summary
+        statistics), so that they are written to the resultsDb together, at the end of that step.
+        """
+        if self.resultsDb is None:
+            return nullcontext()
+        return self.resultsDb.batchWrites()
+
     def _checkCompatible(self, metricBundle1, metricBundle2):
         """Check if two MetricBundles are "compatible".
         Compatible indicates that the sql constraints, the slicers, and the maps are the same, and
@@ -316,14 +376,15 @@ class MetricBundleGroup(object):
         # which can be run/metrics calculated/ together.
         self._findCompatibleLists()
 
-        for compatibleList in self.compatibleLists:
-            if self.verbose:
-                print('Running: ', compatibleList)
-            self._runCompatible(compatibleList)
-            if self.verbose:
-                print('Completed metric generation.')
-            for key in compatibleList:
-                self.hasRun[key] = True
+        with self._batchResultsDb():
+            for compatibleList in self.compatibleLists:
+                if self.verbose:
+                    print('Running: ', compatibleList)
+                self._runCompatible(compatibleList)
+                if self.verbose:
+                    print('Completed metric generation.')
+                for key in compatibleList:
+                    self.hasRun[key] = True
         # Run the reduce methods.
         if self.verbose:
             print('Running reduce methods.')
@@ -367,6 +428,10 @@ class MetricBundleGroup(object):
         # Note that we do NOT run the stackers at this point (this must be done in each 'compatible' group).
         self.simData = utils.getSimData(self.dbObj, constraint, self.dbCols,
                                         groupBy='default', tableName=self.dbTable)
+        # Make sure the visits are in time order (they generally already are).
+        if self.timeCol in self.simData.dtype.names:
+            if np.any(np.diff(self.simData[self.timeCol]) < 0):
+                self.simData = self.simData[np.argsort(self.simData[self.timeCol], kind='mergesort')]
 
         if self.verbose:
             print("Found %i visits" % (self.simData.size))
@@ -444,6 +509,19 @@ class MetricBundleGroup(object):
         for b in bDict.values():
             b._setupMetricValues()
 
+        # Metrics which use the slice context share a SliceContext at each slicePoint.
+        useContext = any(b.metric.useSliceContext for b in bDict.values())
+        # If the slicer returns sorted indexes of time-ordered simData, the slices are also time-ordered.
+        sortedCols = []
+        if slicer.sortedIdxs and self.timeCol in self.simData.dtype.names:
+            if np.all(np.diff(self.simData[self.timeCol]) >= 0):
+                sortedCols.append(self.timeCol)
+
+        def runMetric(metric, slicedata, slicePoint, sliceContext):
+            if metric.useSliceContext:
+                return metric.run(slicedata, slicePoint=slicePoint, sliceContext=sliceContext)
+            return metric.run(slicedata, slicePoint=slicePoint)
+
         # Set up an ordered dictionary to be the cache if needed:
         # (Currently using OrderedDict, it might be faster to use 2 regular Dicts instead)
         if slicer.cacheSize > 0:
@@ -459,6 +537,7 @@ class MetricBundleGroup(object):
                 for b in bDict.values():
                     b.metricValues.mask[i] = True
             else:
+                sliceContext = metrics.SliceContext(slicedata, sortedCols) if useContext else None
                 # There is data! Should we use our data cache?
                 if cache:
                     # Make the data idxs hashable.
@@ -477,7 +556,8 @@ class MetricBundleGroup(object):
                         if useCache:
                             b.metricValues.data[i] = b.metricValues.data[cacheDict[cacheKey]]
                         else:
-                            b.metricValues.data[i] = b.metric.run(slicedata, slicePoint=slice_i['slicePoint'])
+                            b.metricValues.data[i] = runMetric(b.metric, slicedata, slice_i['slicePoint'],
+                                                               sliceContext)
                     # If we are above the cache size, drop the oldest element from the cache dict.
                     if len(cacheDict) > slicer.cacheSize:
                         del cacheDict[list(cacheDict.keys())[0]]
@@ -485,7 +565,8 @@ class MetricBundleGroup(object):
                 # Not using memoize, just calculate things normally
                 else:
                     for b in bDict.values():
-                        b.metricValues.data[i] = b.metric.run(slicedata, slicePoint=slice_i['slicePoint'])
+                        b.metricValues.data[i] = runMetric(b.metric, slicedata, slice_i['slicePoint'],
+                                                           sliceContext)
         # Mask data where metrics could not be computed (according to metric bad value).
         for b in bDict.values():
             if b.metricValues.dtype.name == 'object':
@@ -533,24 +614,25 @@ class MetricBundleGroup(object):
         """
         # Create a temporary dictionary to hold the reduced metricbundles.
         reduceBundleDict = {}
-        for b in self.currentBundleDict.values():
-            # If there are no reduce functions associated with the metric, skip this metricBundle.
-            if len(b.metric.reduceFuncs) > 0:
-                # Apply reduce functions, creating a new metricBundle in the process (new metric values).
-                for reduceFunc in b.metric.reduceFuncs.values():
-                    newmetricbundle = b.reduceMetric(reduceFunc)
-                    # Add the new metricBundle to our metricBundleGroup dictionary.
-                    name = newmetricbundle.metric.name
-                    if name in self.bundleDict:
-                        name = newmetricbundle.fileRoot
-                    reduceBundleDict[name] = newmetricbundle
-                    if self.saveEarly:
-                        newmetricbundle.write(outDir=self.outDir, resultsDb=self.resultsDb)
-                    else:
-                        newmetricbundle.writeDb(resultsDb=self.resultsDb)
-                # Remove summaryMetrics from top level metricbundle if desired.
-                if updateSummaries:
-                    b.summaryMetrics = []
+        with self._batchResultsDb():
+            for b in self.currentBundleDict.values():
+                # If there are no reduce functions associated with the metric, skip this metricBundle.
+                if len(b.metric.reduceFuncs) > 0:
+                    # Apply reduce functions, creating new metricBundles in the process (new metric values).
+                    # All of the reduce functions are calculated together, in one pass through the values.
+                    for newmetricbundle in b.reduceMetrics(list(b.metric.reduceFuncs.values())):
+                        # Add the new metricBundle to our metricBundleGroup dictionary.
+                        name = newmetricbundle.metric.name
+                        if name in self.bundleDict:
+                            name = newmetricbundle.fileRoot
+                        reduceBundleDict[name] = newmetricbundle
+                        if self.saveEarly:
+                            newmetricbundle.write(outDir=self.outDir, resultsDb=self.resultsDb)
+                        else:
+                            newmetricbundle.writeDb(resultsDb=self.resultsDb)
+                    # Remove summaryMetrics from top level metricbundle if desired.
+                    if updateSummaries:
+                        b.summaryMetrics = []
         # Add the new metricBundles to the MetricBundleGroup dictionary.
         self.bundleDict.update(reduceBundleDict)
         # And add to to the currentBundleDict too, so we run as part of 'summaryCurrent'.
@@ -569,11 +651,12 @@ class MetricBundleGroup(object):
     def summaryCurrent(self):
         """Run summary statistics on all the metricBundles in the currently active set of MetricBundles.
         """
-        for b in self.currentBundleDict.values():
-            b.computeSummaryStats(self.resultsDb)
+        with self._batchResultsDb():
+            for b in self.currentBundleDict.values():
+                b.computeSummaryStats(self.resultsDb)
 
     def plotAll(self, savefig=True, outfileSuffix=None, figformat='pdf', dpi=600, trimWhitespace=True,
-                thumbnail=True, closefigs=True):
+                thumbnail=True, closefigs=True, nProcs=1, plotCache=False):
         """Generate all the plots for all the metricBundles in bundleDict.
 
         Generating all ploots, for all MetricBundles, at this point, assumes that
@@ -598,6 +681,14 @@ class MetricBundleGroup(object):
         closefigs : bool, opt
             Close the matplotlib figures after they are saved to disk. If many figures are
             generated, closing the figures saves significant memory. Default True.
+        nProcs : int, opt
+            Number of processes to use to make and save the plots. If more than 1, each MetricBundle
+            is plotted (with the Agg backend) in a pool of nProcs processes, and the information about
+            the saved figures is then written to the resultsDb by this process. The figures are always
+            closed in this case. Default 1.
+        plotCache : bool, opt
+            If True, skip remaking figures which are already in self.outDir, made from the same
+            metric values, plotDict and figure format (see PlotHandler). Default False.
         """
         for constraint in self.constraints:
             if self.verbose:
@@ -605,10 +696,11 @@ class MetricBundleGroup(object):
 
             self.setCurrent(constraint)
             self.plotCurrent(savefig=savefig, outfileSuffix=outfileSuffix, figformat=figformat, dpi=dpi,
-                             trimWhitespace=trimWhitespace, thumbnail=thumbnail, closefigs=closefigs)
+                             trimWhitespace=trimWhitespace, thumbnail=thumbnail, closefigs=closefigs,
+                             nProcs=nProcs, plotCache=plotCache)
 
     def plotCurrent(self, savefig=True, outfileSuffix=None, figformat='pdf', dpi=600, trimWhitespace=True,
-                    thumbnail=True, closefigs=True):
+                    thumbnail=True, closefigs=True, nProcs=1, plotCache=False):
         """Generate the plots for the currently active set of MetricBundles.
 
         Parameters
@@ -630,23 +722,73 @@ class MetricBundleGroup(object):
         closefigs : bool, opt
             Close the matplotlib figures after they are saved to disk. If many figures are
             generated, closing the figures saves significant memory. Default True.
+        nProcs : int, opt
+            Number of processes to use to make and save the plots. If more than 1, each MetricBundle
+            is plotted (with the Agg backend) in a pool of nProcs processes, and the information about
+            the saved figures is then written to the resultsDb by this process. The figures are always
+            closed in this case. Default 1.
+        plotCache : bool, opt
+            If True, skip remaking figures which are already in self.outDir, made from the same
+            metric values, plotDict and figure format (see PlotHandler). Default False.
         """
         plotHandler = PlotHandler(outDir=self.outDir, resultsDb=self.resultsDb,
                                   savefig=savefig, figformat=figformat, dpi=dpi,
-                                  trimWhitespace=trimWhitespace, thumbnail=thumbnail)
+                                  trimWhitespace=trimWhitespace, thumbnail=thumbnail,
+                                  plotCache=plotCache)
+        if nProcs > 1 and len(self.currentBundleDict) > 1:
+            plotHandlerKwargs = {'outDir': self.outDir, 'figformat': figformat, 'dpi': dpi,
+                                 'trimWhitespace': trimWhitespace, 'thumbnail': thumbnail,
+                                 'plotCache': plotCache}
+            self._plotParallel(plotHandler, plotHandlerKwargs, outfileSuffix, savefig, nProcs)
+            if self.verbose:
+                print('Plotting complete.')
+            return
 
-        for b in self.currentBundleDict.values():
-            try:
-                b.plot(plotHandler=plotHandler, outfileSuffix=outfileSuffix, savefig=savefig)
-            except ValueError as ve:
-                message = 'Plotting failed for metricBundle %s.' % (b.fileRoot)
-                message += ' Error message: %s' % (ve)
-                warnings.warn(message)
-            if closefigs:
-                plt.close('all')
+        with self._batchResultsDb():
+            for b in self.currentBundleDict.values():
+                try:
+                    b.plot(plotHandler=plotHandler, outfileSuffix=outfileSuffix, savefig=savefig)
+                except ValueError as ve:
+                    message = 'Plotting failed for metricBundle %s.' % (b.fileRoot)
+                    message += ' Error message: %s' % (ve)
+                    warnings.warn(message)
+                if closefigs:
+                    plt.close('all')
+        plotHandler.writePlotCache()
         if self.verbose:
             print('Plotting complete.')
 
+    def _plotParallel(self, plotHandler, plotHandlerKwargs, outfileSuffix, savefig, nProcs):
+        """Plot the current MetricBundles in a pool of nProcs processes.
+
+        Each process gets a copy of a MetricBundle (without its stackers, maps or slicer lookup
+        attributes), and returns the information about the figures it saved. This is then written
+        to the resultsDb in a single batch, in the same order as plotting the MetricBundles in turn.
+        A MetricBundle which cannot be sent to a plotting process is plotted here instead.
+        """
+        pool = multiprocessing.Pool(processes=nProcs, initializer=_initPlotProcess)
+        try:
+            results = [(b, pool.apply_async(_plotBundle, (_plotCopy(b), plotHandlerKwargs,
+                                                          outfileSuffix, savefig)))
+                       for b in self.currentBundleDict.values()]
+            with self._batchResultsDb():
+                for b, result in results:
+                    try:
+                        savedFigs, message = result.get()
+                    except Exception as e:
+                        warnings.warn('Could not plot metricBundle %s in a separate process (%s); '
+                                      'plotting it here instead.' % (b.fileRoot, e))
+                        savedFigs, message = _plotBundle(b, plotHandlerKwargs, outfileSuffix, savefig)
+                    if self.resultsDb is not None:
+                        plotHandler.writeResultsDb(savedFigs)
+                    plotHandler.savedFigs.extend(savedFigs)
+                    if message is not None:
+                        warnings.warn(message)
+            plotHandler.writePlotCache(plotHandler.savedFigs)
+        finally:
+            pool.close()
+            pool.join()
+
     def writeAll(self):
         """Save all the MetricBundles to disk.
 
@@ -664,49 +806,74 @@ class MetricBundleGroup(object):
                 print('Re-saving metric bundles.')
             else:
                 print('Saving metric bundles.')
-        for b in self.currentBundleDict.values():
-            b.write(outDir=self.outDir, resultsDb=self.resultsDb)
+        with self._batchResultsDb():
+            for b in self.currentBundleDict.values():
+                b.write(outDir=self.outDir, resultsDb=self.resultsDb)
 
-    def readAll(self):
+    def readAll(self, lazy=False):
         """Attempt to read all MetricBundles from disk.
 
         You must set the metrics/slicer/constraint/runName for a metricBundle appropriately;
         then this method will search for files in the location self.outDir/metricBundle.fileRoot.
         Reads all the files associated with all metricbundles in self.bundleDict.
+
+        Parameters
+        ----------
+        lazy : bool, opt
+            If True, only find the files now: the metricValues (and slicer) of each metricBundle
+            are read from its file when they are first used, so only the metricBundles which are
+            used are read. Use loadAll to read the remaining files in a pool of threads.
+            Default False.
         """
         reduceBundleDict = {}
         removeBundles = []
         for b in self.bundleDict:
             bundle = self.bundleDict[b]
             filename = os.path.join(self.outDir, bundle.fileRoot + '.npz')
-            try:
-                # Create a temporary metricBundle to read the data into.
-                #  (we don't use b directly, as this overrides plotDict/etc).
-                tmpBundle = createEmptyMetricBundle()
-                tmpBundle.read(filename)
-                # Copy the tmpBundle metricValues into bundle.
-                bundle.metricValues = tmpBundle.metricValues
-                # And copy the slicer into b, to get slicePoints.
-                bundle.slicer = tmpBundle.slicer
-                if self.verbose:
-                    print('Read %s from disk.' % (bundle.fileRoot))
-            except IOError:
-                warnings.warn('Warning: file %s not found, bundle not restored.' % filename)
-                removeBundles.append(b)
+            if lazy:
+                if os.path.isfile(filename):
+                    # Read the metricValues and slicer (to get slicePoints) into bundle when needed.
+                    # (This is set after the reduce bundles are set up, so they do not read it.)
+                    lazyFilename = filename
+                    if self.verbose:
+                        print('Found %s on disk.' % (bundle.fileRoot))
+                else:
+                    lazyFilename = None
+                    warnings.warn('Warning: file %s not found, bundle not restored.' % filename)
+                    removeBundles.append(b)
+            else:
+                try:
+                    # Create a temporary metricBundle to read the data into.
+                    #  (we don't use b directly, as this overrides plotDict/etc).
+                    tmpBundle = createEmptyMetricBundle()
+                    tmpBundle.read(filename)
+                    # Copy the tmpBundle metricValues into bundle.
+                    bundle.metricValues = tmpBundle.metricValues
+                    # And copy the slicer into b, to get slicePoints.
+                    bundle.slicer = tmpBundle.slicer
+                    if self.verbose:
+                        print('Read %s from disk.' % (bundle.fileRoot))
+                except IOError:
+                    warnings.warn('Warning: file %s not found, bundle not restored.' % filename)
+                    removeBundles.append(b)
 
             # Look to see if this is a complex metric, with associated 'reduce' functions,
             # and read those in too.
             if len(bundle.metric.reduceFuncs) > 0:
                 origMetricName = bundle.metric.name
                 for reduceFunc in bundle.metric.reduceFuncs.values():
-                    reduceName = origMetricName + '_' + reduceFunc.__name__.replace('reduce', '')
+                    reduceName = origMetricName + '_' + _reduceName(reduceFunc)
                     # Borrow the fileRoot in b (we'll reset it appropriately afterwards).
                     bundle.metric.name = reduceName
                     bundle._buildFileRoot()
                     filename = os.path.join(self.outDir, bundle.fileRoot + '.npz')
-                    tmpBundle = createEmptyMetricBundle()
                     try:
-                        tmpBundle.read(filename)
+                        if lazy:
+                            if not os.path.isfile(filename):
+                                raise IOError('%s not found' % filename)
+                        else:
+                            tmpBundle = createEmptyMetricBundle()
+                            tmpBundle.read(filename)
                         # This won't necessarily recreate the plotDict and displayDict exactly
                         # as they would have been made if you calculated the reduce metric from scratch.
                         # Perhaps update these metric reduce dictionaries after reading them in?
@@ -720,14 +887,21 @@ class MetricBundleGroup(object):
                                                        mapsList=bundle.mapsList,
                                                        fileRoot=bundle.fileRoot, plotFuncs=bundle.plotFuncs)
                         newmetricBundle.metric.name = reduceName
-                        newmetricBundle.metricValues = ma.copy(tmpBundle.metricValues)
+                        if lazy:
+                            # The metricValues (and slicer) are read from the reduce metric file.
+                            newmetricBundle._readLater(filename)
+                        else:
+                            newmetricBundle.metricValues = ma.copy(tmpBundle.metricValues)
                         # Add the new metricBundle to our metricBundleGroup dictionary.
                         name = newmetricBundle.metric.name
                         if name in self.bundleDict:
                             name = newmetricBundle.fileRoot
                         reduceBundleDict[name] = newmetricBundle
                         if self.verbose:
-                            print('Read %s from disk.' % (newmetricBundle.fileRoot))
+                            if lazy:
+                                print('Found %s on disk.' % (newmetricBundle.fileRoot))
+                            else:
+                                print('Read %s from disk.' % (newmetricBundle.fileRoot))
                     except IOError:
                         warnings.warn('Warning: file %s not found, bundle not restored ("reduce" metric).'
                                       % filename)
@@ -738,9 +912,36 @@ class MetricBundleGroup(object):
                     bundle.metric.name = origMetricName
                     bundle._buildFileRoot()
 
+            if lazy and lazyFilename is not None:
+                bundle._readLater(lazyFilename)
+
         # Add the reduce bundles into the bundleDict.
         self.bundleDict.update(reduceBundleDict)
         # And remove the bundles which were not found on disk, so we don't try to make (blank) plots.
         for b in removeBundles:
             del self.bundleDict[b]
 
+    def loadAll(self, nThreads=4):
+        """Read the metricValues of all MetricBundles left on disk by readAll(lazy=True).
+
+        The files are read in a pool of threads (numpy releases the GIL while reading
+        and decompressing the arrays).
+
+        Parameters
+        ----------
+        nThreads : int, opt
+            The number of threads to read the files with. Default 4.
+        """
+        toLoad = [b for b in self.bundleDict.values() if b._lazyFile is not None]
+        if len(toLoad) == 0:
+            return
+        if nThreads is None or nThreads <= 1:
+            for bundle in toLoad:
+                bundle._readLazy()
+        else:
+            with ThreadPoolExecutor(max_workers=nThreads) as executor:
+                # list() raises any exception from the reads.
+                list(executor.map(lambda bundle: bundle._readLazy(), toLoad))
+        if self.verbose:
+            print('Read %d metricBundles from disk.' % len(toLoad))
+
@@ -0,0 +1,289 @@
+import os
+import json
+import numpy as np
+import numpy.ma as ma
+
+from lsst.sims.maf.utils import getDateVersion
+
+__all__ = ['DiscoveryResults', 'combineDiscoveryResults']
+
+
+class DiscoveryResults(object):
+    """Columnar (pickle-free) storage for the output of a parent DiscoveryMetric.
+
+    The DiscoveryMetric returns a dictionary of arrays ('start', 'end', 'trackletNights') for every
+    (object, H) pair, which normally ends up in a masked object array that can only be saved with pickle.
+    DiscoveryResults instead flattens these into three flat arrays, with CSR-style offsets indexed by
+    the flattened (object, H) position k = objIdx * nH + Hidx.
+    The values for a given (object, H) pair are start[startOffsets[k]:startOffsets[k+1]] (and similarly
+    end) and trackletNights[nightOffsets[k]:nightOffsets[k+1]].
+
+    Results are written as a directory of .npy files plus a json header, so that they can be read back
+    with memory-mapping and without allowing pickles.
+    Indexing the object with [objIdx, Hidx] returns the same dictionary the DiscoveryMetric would have
+    returned (as views into the flat arrays), or None if the value was masked, so these can be passed
+    directly to the child metrics (Discovery_N_Chances, Discovery_Time, etc.).
+
+    Parameters
+    ----------
+    start : numpy.ndarray
+        Flat array of the discovery opportunity start indexes, for all (object, H) pairs.
+    end : numpy.ndarray
+        Flat array of the discovery opportunity end indexes, for all (object, H) pairs.
+    trackletNights : numpy.ndarray
+        Flat array of the nights with good tracklets, for all (object, H) pairs.
+    startOffsets : numpy.ndarray
+        Offsets into start/end for each flattened (object, H) pair. Length nObj * nH + 1.
+    nightOffsets : numpy.ndarray
+        Offsets into trackletNights for each flattened (object, H) pair. Length nObj * nH + 1.
+    mask : numpy.ndarray
+        Boolean mask of shape (nObj, nH); True where the parent metric value was masked.
+    Hvals : numpy.ndarray
+        The H values corresponding to the second axis of mask.
+    objIds : numpy.ndarray, opt
+        The object ids corresponding to the first axis of mask. Default None.
+    header : dict, opt
+        Additional (json-serializable) information about the metric values. Default None.
+    """
+    # The names of the arrays stored on disk (each as <name>.npy).
+    _arrayNames = ['start', 'end', 'trackletNights', 'startOffsets', 'nightOffsets', 'mask', 'Hvals']
+    suffix = '.discovery'
+
+    def __init__(self, start, end, trackletNights, startOffsets, nightOffsets, mask, Hvals,
+                 objIds=None, header=None):
+        self.start = start
+        self.end = end
+        self.trackletNights = trackletNights
+        self.startOffsets = startOffsets
+        self.nightOffsets = nightOffsets
+        self.mask = mask
+        self.Hvals = Hvals
+        self.objIds = objIds
+        if header is None:
+            header = {}
+        self.header = header
+        self.shape = self.mask.shape
+        if len(self.startOffsets) != self.mask.size + 1 or len(self.nightOffsets) != self.mask.size + 1:
+            raise ValueError('Offsets must have length nObj * nH + 1 (%d), but have length %d and %d.'
+                             % (self.mask.size + 1, len(self.startOffsets), len(self.nightOffsets)))
+
+    @classmethod
+    def fromMetricValues(cls, metricValues, Hvals, objIds=None, header=None):
+        """Pack the (masked, object) metricValues of a DiscoveryMetric into columnar form.
+
+        Parameters
+        ----------
+        metricValues : numpy.ma.MaskedArray
+            The metric values from the parent DiscoveryMetric, shape (nObj, nH).
+        Hvals : numpy.ndarray
+            The H values of the slicer.
+        objIds : numpy.ndarray, opt
+            The object ids of the slicer orbits. Default None.
+        header : dict, opt
+            Additional information to save with the metric values. Default None.
+
+        Returns
+        -------
+        DiscoveryResults
+        """
+        mask = ma.getmaskarray(metricValues)
+        flatData = metricValues.data.ravel()
+        flatMask = mask.ravel()
+        nStart = np.zeros(flatData.size, int)
+        nNights = np.zeros(flatData.size, int)
+        valid = np.where(~flatMask)[0]
+        for k in valid:
+            nStart[k] = len(flatData[k]['start'])
+            nNights[k] = len(flatData[k]['trackletNights'])
+        startOffsets = np.concatenate([[0], np.cumsum(nStart)])
+        nightOffsets = np.concatenate([[0], np.cumsum(nNights)])
+        if len(valid) > 0:
+            start = np.concatenate([flatData[k]['start'] for k in valid]).astype(int)
+            end = np.concatenate([flatData[k]['end'] for k in valid]).astype(int)
+            trackletNights = np.concatenate([flatData[k]['trackletNights'] for k in valid]).astype(float)
+        else:
+            start = np.zeros(0, int)
+            end = np.zeros(0, int)
+            trackletNights = np.zeros(0, float)
+        return cls(start, end, trackletNights, startOffsets, nightOffsets, mask,
+                   np.asarray(Hvals, float), objIds=objIds, header=header)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        """Return the parent metric value (dictionary of start/end/trackletNights) for [objIdx, Hidx].
+        """
+        i, j = idx
+        if self.mask[i, j]:
+            return None
+        k = i * self.shape[1] + j
+        s0, s1 = self.startOffsets[k], self.startOffsets[k + 1]
+        n0, n1 = self.nightOffsets[k], self.nightOffsets[k + 1]
+        return {'start': self.start[s0:s1], 'end': self.end[s0:s1],
+                'trackletNights': self.trackletNights[n0:n1]}
+
+    def nChances(self):
+        """Return the total number of discovery opportunities for each (object, H) pair.
+
+        Returns
+        -------
+        numpy.ma.MaskedArray
+            The number of discovery chances, shape (nObj, nH) (equivalent to Discovery_N_Chances
+            without nightStart/nightEnd).
+        """
+        nChances = np.diff(self.startOffsets).reshape(self.shape)
+        return ma.MaskedArray(data=nChances, mask=np.array(self.mask), fill_value=0)
+
+    def toMetricValues(self):
+        """Unpack the columnar values back into a masked object array, as the DiscoveryMetric creates.
+
+        Returns
+        -------
+        numpy.ma.MaskedArray
+        """
+        data = np.empty(self.shape, 'object')
+        for i, j in zip(*np.where(~np.asarray(self.mask))):
+            data[i, j] = self[i, j]
+        return ma.MaskedArray(data=data, mask=np.array(self.mask), fill_value=0)
+
+    def write(self, outfilename):
+        """Write the columnar values to disk, as a directory of .npy files plus a json header.
+
+        Parameters
+        ----------
+        outfilename : str
+            The output directory name. The suffix '.discovery' is added if not already present.
+
+        Returns
+        -------
+        str
+            The name of the output directory.
+        """
+        if not outfilename.endswith(self.suffix):
+            outfilename = outfilename + self.suffix
+        if not os.path.isdir(outfilename):
+            os.makedirs(outfilename)
+        for name in self._arrayNames:
+            np.save(os.path.join(outfilename, name + '.npy'), np.asarray(getattr(self, name)))
+        if self.objIds is not None:
+            objIds = np.asarray(self.objIds)
+            if objIds.dtype == 'object':
+                objIds = objIds.astype(str)
+            np.save(os.path.join(outfilename, 'objIds.npy'), objIds)
+        header = {}
+        header.update(self.header)
+        date, versionInfo = getDateVersion()
+        header['dateRan'] = date
+        header.update(versionInfo)
+        header['shape'] = [int(s) for s in self.shape]
+        with open(os.path.join(outfilename, 'header.json'), 'w') as f:
+            json.dump(header, f, default=_jsonDefault)
+        return outfilename
+
+    @classmethod
+    def read(cls, infilename, mmap=True):
+        """Read columnar discovery values from disk.
+
+        Parameters
+        ----------
+        infilename : str
+            The directory containing the discovery values.
+        mmap : bool, opt
+            If True (default), memory-map the flat arrays rather than reading them into memory.
+
+        Returns
+        -------
+        DiscoveryResults
+        """
+        if not os.path.isdir(infilename):
+            raise IOError('%s not found' % infilename)
+        mmapMode = 'r' if mmap else None
+        arrays = {}
+        for name in cls._arrayNames:
+            arrays[name] = np.load(os.path.join(infilename, name + '.npy'), mmap_mode=mmapMode,
+                                   allow_pickle=False)
+        objFile = os.path.join(infilename, 'objIds.npy')
+        if os.path.isfile(objFile):
+            objIds = np.load(objFile, allow_pickle=False)
+        else:
+            objIds = None
+        with open(os.path.join(infilename, 'header.json'), 'r') as f:
+            header = json.load(f)
+        return cls(objIds=objIds, header=header, **arrays)
+
+
+def _jsonDefault(obj):
+    """Convert numpy types for json; anything else (e.g. functions in plotDicts) becomes its name."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return getattr(obj, '__name__', str(obj))
+
+
+def _gatherSegments(offsets, keys, newOffsets):
+    """Build the source indexes to copy segments offsets[k]:offsets[k+1] (for k in keys) into the
+    locations newOffsets[k]:newOffsets[k+1]. Returns (destination idx, source idx).
+    """
+    counts = offsets[keys + 1] - offsets[keys]
+    total = counts.sum()
+    if total == 0:
+        return np.zeros(0, int), np.zeros(0, int)
+    # Position within each segment.
+    within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    src = np.repeat(offsets[keys], counts) + within
+    dest = np.repeat(newOffsets[keys], counts) + within
+    return dest, src
+
+
+def combineDiscoveryResults(resultsList):
+    """Combine DiscoveryResults calculated on separate subsets of the observations (shards).
+
+    Each shard must use the same orbits and H values (as with the split outputs of run_moving_calc.py),
+    with the values for objects not in that shard masked. The first shard with an unmasked value for a
+    given (object, H) pair provides the value for that pair.
+
+    Parameters
+    ----------
+    resultsList : list of DiscoveryResults
+        The discovery results from each shard (possibly memory-mapped).
+
+    Returns
+    -------
+    DiscoveryResults
+    """
+    first = resultsList[0]
+    for r in resultsList[1:]:
+        if r.shape != first.shape or np.any(np.asarray(r.Hvals) != np.asarray(first.Hvals)):
+            raise ValueError('DiscoveryResults must have the same shape and H values to be combined.')
+        if first.objIds is not None and r.objIds is not None:
+            if np.any(np.asarray(r.objIds) != np.asarray(first.objIds)):
+                raise ValueError('DiscoveryResults must have the same objIds to be combined.')
+    nk = int(np.prod(first.shape))
+    # Find which shard supplies each (object, H) pair.
+    source = np.zeros(nk, int) - 1
+    for s, r in enumerate(resultsList):
+        use = (source < 0) & ~np.asarray(r.mask).ravel()
+        source[use] = s
+    nStart = np.zeros(nk, int)
+    nNights = np.zeros(nk, int)
+    for s, r in enumerate(resultsList):
+        keys = np.where(source == s)[0]
+        nStart[keys] = np.diff(r.startOffsets)[keys]
+        nNights[keys] = np.diff(r.nightOffsets)[keys]
+    startOffsets = np.concatenate([[0], np.cumsum(nStart)])
+    nightOffsets = np.concatenate([[0], np.cumsum(nNights)])
+    start = np.zeros(startOffsets[-1], int)
+    end = np.zeros(startOffsets[-1], int)
+    trackletNights = np.zeros(nightOffsets[-1], float)
+    for s, r in enumerate(resultsList):
+        keys = np.where(source == s)[0]
+        dest, src = _gatherSegments(np.asarray(r.startOffsets), keys, startOffsets)
+        start[dest] = r.start[src]
+        end[dest] = r.end[src]
+        dest, src = _gatherSegments(np.asarray(r.nightOffsets), keys, nightOffsets)
+        trackletNights[dest] = r.trackletNights[src]
+    mask = (source < 0).reshape(first.shape)
+    return DiscoveryResults(start, end, trackletNights, startOffsets, nightOffsets, mask,
+                            np.array(first.Hvals), objIds=first.objIds, header=dict(first.header))
@@ -6,7 +6,7 @@ import numpy as np
 import numpy.ma as ma
 import matplotlib.pyplot as plt
 
-from lsst.sims.maf.metrics import BaseMoMetric
+from lsst.sims.maf.metrics import BaseMoMetric, DiscoveryMetric
 from lsst.sims.maf.metrics import MoCompletenessMetric, ValueAtHMetric
 from lsst.sims.maf.slicers import MoObjSlicer
 from lsst.sims.maf.stackers import BaseMoStacker, MoMagStacker
@@ -14,6 +14,7 @@ from lsst.sims.maf.plots import PlotHandler
 from lsst.sims.maf.plots import MetricVsH
 
 from .metricBundle import MetricBundle
+from .moDiscoveryResults import DiscoveryResults
 
 __all__ = ['MoMetricBundle', 'MoMetricBundleGroup', 'createEmptyMoMetricBundle', 'makeCompletenessBundle']
 
@@ -29,7 +30,7 @@ def createEmptyMoMetricBundle():
     return MoMetricBundle(BaseMoMetric(), MoObjSlicer(), None)
 
 
-def makeCompletenessBundle(bundle, completenessMetric, Hmark=None, resultsDb=None):
+def makeCompletenessBundle(bundle, completenessMetric, Hmark=None, resultsDb=None, summaryValue=None):
     """
     Make a mock metric bundle from a bundle which had MoCompleteness or MoCumulativeCompleteness summary
     metrics run. This lets us use the plotHandler + plots.MetricVsH to generate plots.
@@ -46,13 +47,19 @@ def makeCompletenessBundle(bundle, completenessMetric, Hmark=None, resultsDb=Non
         The Hmark value to add to the plotting dictionary of the new mock bundle. Default None.
     resultsDb : ~lsst.sims.maf.db.ResultsDb, opt
         The resultsDb in which to record the summary statistic value at Hmark. Default None.
+    summaryValue : numpy.ndarray, opt
+        The already-calculated value of completenessMetric on the bundle (for example, from
+        MoCompletenessAtTimeMetric.summarize). If None (default), completenessMetric is run on the bundle.
 
     Returns
     -------
     ~lsst.sims.maf.metricBundles.MoMetricBundle
     """
     bundle.setSummaryMetrics(completenessMetric)
-    bundle.computeSummaryStats(resultsDb)
+    if summaryValue is None:
+        bundle.computeSummaryStats(resultsDb)
+    else:
+        bundle.setSummaryValue(completenessMetric.name, summaryValue, resultsDb=resultsDb)
     summaryName = completenessMetric.name
     # Make up the bundle, including the metric values.
     completeness = ma.MaskedArray(data=bundle.summaryValues[summaryName]['value'],
@@ -143,6 +150,8 @@ class MoMetricBundle(MetricBundle):
         # This is where we store the metric values and summary stats.
         self.metricValues = None
         self.summaryValues = None
+        # Previously calculated (parent) metric values, if available.
+        self.parentResults = None
 
     def _resetMetricBundle(self):
         """Reset all properties of MetricBundle.
@@ -163,6 +172,7 @@ class MoMetricBundle(MetricBundle):
         self.childMetrics = None
         self.metricValues = None
         self.summaryValues = None
+        self.parentResults = None
 
     def _buildMetadata(self, metadata):
         """If no metadata is provided, auto-generate it from the obsFile + constraint.
@@ -213,18 +223,100 @@ class MoMetricBundle(MetricBundle):
         if self.summaryMetrics is not None:
             # Build array of metric values, to use for (most) summary statistics.
             for m in self.summaryMetrics:
-                summaryName = m.name
                 summaryVal = m.run(self.metricValues, self.slicer.slicePoints['H'])
-                self.summaryValues[summaryName] = summaryVal
-                # Add summary metric info to results database, if applicable.
-                if resultsDb:
-                    metricId = resultsDb.updateMetric(self.metric.name, self.slicer.slicerName,
-                                                      self.runName, self.constraint, self.metadata, None)
-                    resultsDb.updateSummaryStat(metricId, summaryName=summaryName, summaryValue=summaryVal)
+                self.setSummaryValue(m.name, summaryVal, resultsDb=resultsDb)
+
+    def setSummaryValue(self, summaryName, summaryVal, resultsDb=None):
+        """
+        Store an (already calculated) summary statistic value, and add it to the resultsDb if applicable.
+        """
+        if self.summaryValues is None:
+            self.summaryValues = {}
+        self.summaryValues[summaryName] = summaryVal
+        # Add summary metric info to results database, if applicable.
+        if resultsDb:
+            metricId = resultsDb.updateMetric(self.metric.name, self.slicer.slicerName,
+                                              self.runName, self.constraint, self.metadata, None)
+            resultsDb.updateSummaryStat(metricId, summaryName=summaryName, summaryValue=summaryVal)
 
     def reduceMetric(self, reduceFunc, reducePlotDict=None, reduceDisplayDict=None):
         raise NotImplementedError
 
+    def setParentResults(self, parentResults):
+        """Use previously calculated (parent) DiscoveryMetric values instead of recalculating them.
+
+        When set, MoMetricBundleGroup will take the parent metric values from parentResults and only
+        calculate the child metrics.
+
+        Parameters
+        ----------
+        parentResults : ~lsst.sims.maf.metricBundles.DiscoveryResults or str
+            The stored parent metric values, or the name of the directory containing them.
+        """
+        if isinstance(parentResults, str):
+            parentResults = DiscoveryResults.read(parentResults)
+        if list(parentResults.shape) != list(self.slicer.shape):
+            raise ValueError('Parent results have shape %s, but the slicer has shape %s.'
+                             % (parentResults.shape, self.slicer.shape))
+        self.parentResults = parentResults
+
+    def _discoveryHeader(self, comment=''):
+        """Build the header information saved with columnar discovery values.
+        """
+        header = {'metricName': self.metric.name,
+                  'simDataName': self.runName,
+                  'constraint': self.constraint,
+                  'metadata': self.metadata + comment,
+                  'displayDict': self.displayDict,
+                  'plotDict': self.plotDict,
+                  'slicerName': self.slicer.slicerName}
+        for key in ['orbitFile', 'obsFile']:
+            header[key] = getattr(self.slicer, key, None)
+        for key in ['nObsPerNight', 'tMin', 'tMax', 'nNightsPerWindow', 'tWindow', 'snrLimit']:
+            header[key] = getattr(self.metric, key, None)
+        return header
+
+    def write(self, comment='', outDir='.', outfileSuffix=None, resultsDb=None):
+        """Write metricValues (and associated metadata) to disk.
+
+        DiscoveryMetric (parent) values are written in the columnar DiscoveryResults format
+        (a <fileRoot>.discovery directory), all other metric values are written as for MetricBundle.
+
+        Parameters
+        ----------
+        comment : Optional[str]
+            Any additional comments to add to the output file
+        outDir : Optional[str]
+            The output directory
+        outfileSuffix : Optional[str]
+            Additional suffix to add to the output files (typically a numerical suffix for movies)
+        resultsD : Optional[ResultsDb]
+            Results database to store information on the file output
+        """
+        if not isinstance(self.metric, DiscoveryMetric):
+            super().write(comment=comment, outDir=outDir, outfileSuffix=outfileSuffix, resultsDb=resultsDb)
+            return
+        if outfileSuffix is not None:
+            outfile = self.fileRoot + '_' + outfileSuffix + DiscoveryResults.suffix
+        else:
+            outfile = self.fileRoot + DiscoveryResults.suffix
+        if self.parentResults is not None:
+            results = self.parentResults
+            results.header = self._discoveryHeader(comment)
+        else:
+            try:
+                objIds = self.slicer.orbits['objId'].values
+            except (AttributeError, KeyError):
+                objIds = None
+            results = DiscoveryResults.fromMetricValues(self.metricValues, self.slicer.slicePoints['H'],
+                                                        objIds=objIds, header=self._discoveryHeader(comment))
+        results.write(os.path.join(outDir, outfile))
+        if resultsDb is not None:
+            metricId = resultsDb.updateMetric(self.metric.name, self.slicer.slicerName,
+                                              self.runName, self.constraint,
+                                              self.metadata, outfile)
+            resultsDb.updateDisplay(metricId, self.displayDict)
+
 
 class MoMetricBundleGroup(object):
     def __init__(self, bundleDict, outDir='.', resultsDb=None, verbose=True):
@@ -381,6 +473,13 @@ class MoMetricBundleGroup(object):
             b._setupMetricValues()
             for cb in b.childBundles.values():
                 cb._setupMetricValues()
+        # Run the stackers once over all observations; only those that depend on H are run per object.
+        # Keep the observations without the stacker columns, to restore when these metrics are done.
+        obs = self.slicer.obs
+        if self.slicer.runObsStackers(uniqStackers):
+            HStackers = [s for s in uniqStackers if s.Hdependent]
+        else:
+            HStackers = uniqStackers
         # Calculate the metric values.
         for i, slicePoint in enumerate(self.slicer):
             ssoObs = slicePoint['obs']
@@ -388,20 +487,24 @@ class MoMetricBundleGroup(object):
                 # Run stackers to add extra columns (that depend on Hval)
                 with warnings.catch_warnings():
                     warnings.simplefilter('ignore')
-                    for s in uniqStackers:
+                    for s in HStackers:
                         ssoObs = s.run(ssoObs, slicePoint['orbit']['H'], Hval)
                 # Run all the parent metrics.
                 for k in compatibleList:
                     b = self.bundleDict[k]
-                    # Mask the parent metric (and then child metrics) if there was no data.
-                    if len(ssoObs) == 0:
+                    # Mask the parent metric (and then child metrics) if there was no data,
+                    # or if the stored parent value is masked.
+                    if len(ssoObs) == 0 or (b.parentResults is not None and b.parentResults.mask[i, j]):
                         b.metricValues.mask[i][j] = True
                         for cb in list(b.childBundles.values()):
                             cb.metricValues.mask[i][j] = True
                     # Otherwise, calculate the metric value for the parent, and then child.
                     else:
-                        # Calculate for the parent.
-                        mVal = b.metric.run(ssoObs, slicePoint['orbit'], Hval)
+                        # Calculate for the parent (or use the stored parent values).
+                        if b.parentResults is not None:
+                            mVal = b.parentResults[i, j]
+                        else:
+                            mVal = b.metric.run(ssoObs, slicePoint['orbit'], Hval)
                         # Mask if the parent metric returned a bad value.
                         if mVal == b.metric.badval:
                             b.metricValues.mask[i][j] = True
@@ -416,6 +519,7 @@ class MoMetricBundleGroup(object):
                                     cb.metricValues.mask[i][j] = True
                                 else:
                                     cb.metricValues.data[i][j] = childVal
+        self.slicer.obs = obs
         for k in compatibleList:
             b = self.bundleDict[k]
             b.computeSummaryStats(self.resultsDb)
@@ -121,9 +121,20 @@ class BaseMetric(with_metaclass(MetricRegistry, object)):
         If not set, will be derived by introspection.
     badval : float
         The value indicating "bad" values calculated by the metric.
+
+    Metrics which return a vector or object at each slicePoint can define 'reduce*' methods, which
+    reduce the metric value at a single slicePoint to a float. A metric can also define a vectorized
+    version of any of these, as a 'vectorReduce*' method (e.g. vectorReduceMean for reduceMean): this
+    receives the metric values at all (unmasked) slicePoints at once, and returns a numpy array of the
+    reduced values. The MetricBundle uses the vectorized version where it is available.
+
+    Metrics which set the class attribute useSliceContext to True must accept a sliceContext keyword
+    in run; the MetricBundleGroup then passes a SliceContext, shared between all of the metrics
+    calculated at the same slicePoint, which caches common preprocessing (sorting, per-filter groups, etc.).
     """
     colRegistry = ColRegistry()
     colInfo = ColInfo()
+    useSliceContext = False
 
     def __init__(self, col=None, metricName=None, maps=None, units=None,
                  metricDtype=None, badval=-666, maskVal=None):
@@ -151,11 +162,15 @@ class BaseMetric(with_metaclass(MetricRegistry, object)):
         # Set up dictionary of reduce functions (may be empty).
         self.reduceFuncs = {}
         self.reduceOrder = {}
+        # And the vectorized versions of these reduce functions, where available.
+        self.vectorReduceFuncs = {}
         for i, r in enumerate(inspect.getmembers(self, predicate=inspect.ismethod)):
             if r[0].startswith('reduce'):
                 reducename = r[0].replace('reduce', '', 1)
                 self.reduceFuncs[reducename] = r[1]
                 self.reduceOrder[reducename] = i
+            elif r[0].startswith('vectorReduce'):
+                self.vectorReduceFuncs[r[0].replace('vectorReduce', '', 1)] = r[1]
         # Identify type of metric return value.
         if metricDtype is not None:
             self.metricDtype = metricDtype
@@ -1,5 +1,6 @@
 import numpy as np
 from .baseMetric import BaseMetric
+from .sliceContext import SliceContext
 import lsst.sims.maf.utils as mafUtils
 import lsst.sims.utils as utils
 from scipy.optimize import curve_fit
@@ -39,6 +40,8 @@ class ParallaxMetric(BaseMetric):
     badval : float, opt
         The value to return when the metric value cannot be calculated. Default -666.
     """
+    useSliceContext = True
+
     def __init__(self, metricName='parallax', m5Col='fiveSigmaDepth',
                  filterCol='filter', seeingCol='seeingFwhmGeom', rmag=20.,
                  SedTemplate='flat', badval=-666,
@@ -89,15 +92,11 @@ class ParallaxMetric(BaseMetric):
         sigma = np.sqrt(1./(1./sigma_ra**2+1./sigma_dec**2))*1e3
         return sigma
 
-    def run(self, dataslice, slicePoint=None):
-        filters = np.unique(dataslice[self.filterCol])
-        if hasattr(filters[0], 'decode'):
-            filters = [str(f.decode('utf-8')) for f in filters]
-        snr = np.zeros(len(dataslice), dtype='float')
+    def run(self, dataslice, slicePoint=None, sliceContext=None):
+        if sliceContext is None:
+            sliceContext = SliceContext(dataslice)
         # compute SNR for all observations
-        for filt in filters:
-            good = np.where(dataslice[self.filterCol] == filt)
-            snr[good] = mafUtils.m52snr(self.mags[str(filt)], dataslice[self.m5Col][good])
+        snr = sliceContext.snr(self.mags, self.m5Col, self.filterCol)
         position_errors = np.sqrt(mafUtils.astrom_precision(dataslice[self.seeingCol],
                                                             snr)**2+self.atm_err**2)
         sigma = self._final_sigma(position_errors, dataslice['ra_pi_amp'], dataslice['dec_pi_amp'])
@@ -142,6 +141,8 @@ class ProperMotionMetric(BaseMetric):
     badval : float, opt
         The value to return when the metric value cannot be calculated. Default -666.
     """
+    useSliceContext = True
+
     def __init__(self, metricName='properMotion',
                  m5Col='fiveSigmaDepth', mjdCol='observationStartMJD',
                  filterCol='filter', seeingCol='seeingFwhmGeom', rmag=20.,
@@ -159,6 +160,7 @@ class ProperMotionMetric(BaseMetric):
         self.mjdCol = mjdCol
         self.seeingCol = seeingCol
         self.m5Col = m5Col
+        self.filterCol = filterCol
         filters = ['u', 'g', 'r', 'i', 'z', 'y']
         self.mags = {}
         if SedTemplate == 'flat':
@@ -183,19 +185,17 @@ class ProperMotionMetric(BaseMetric):
             self.comment += 'obtained on the first and last days of the survey). '
             self.comment += 'Values closer to 1 indicate more optimal scheduling.'
 
-    def run(self, dataslice, slicePoint=None):
-        filters = np.unique(dataslice['filter'])
-        filters = [str(f) for f in filters]
+    def run(self, dataslice, slicePoint=None, sliceContext=None):
+        if sliceContext is None:
+            sliceContext = SliceContext(dataslice)
+        snr = sliceContext.snr(self.mags, self.m5Col, self.filterCol)
         precis = np.zeros(dataslice.size, dtype='float')
-        for f in filters:
-            observations = np.where(dataslice['filter'] == f)
-            if np.size(observations[0]) < 2:
+        for f, observations in sliceContext.filterGroups(self.filterCol).items():
+            if np.size(observations) < 2:
                 precis[observations] = self.badval
             else:
-                snr = mafUtils.m52snr(self.mags[f],
-                                      dataslice[self.m5Col][observations])
                 precis[observations] = mafUtils.astrom_precision(
-                    dataslice[self.seeingCol][observations], snr)
+                    dataslice[self.seeingCol][observations], snr[observations])
                 precis[observations] = np.sqrt(precis[observations]**2 + self.atm_err**2)
         good = np.where(precis != self.badval)
         result = mafUtils.sigma_slope(dataslice[self.mjdCol][good], precis[good])
@@ -261,6 +261,8 @@ class ParallaxCoverageMetric(BaseMetric):
     -----
     Uses the ParallaxFactor stacker to calculate ra_pi_amp and dec_pi_amp.
     """
+    useSliceContext = True
+
     def __init__(self, metricName='ParallaxCoverageMetric', m5Col='fiveSigmaDepth',
                  mjdCol='observationStartMJD', filterCol='filter', seeingCol='seeingFwhmGeom',
                  rmag=20., SedTemplate='flat',
@@ -321,17 +323,13 @@ class ParallaxCoverageMetric(BaseMetric):
         aveRad = np.average(radius, weights=weights)
         return aveRad
 
-    def run(self, dataSlice, slicePoint=None):
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
         if np.size(dataSlice) < 2:
             return self.badval
-
-        filters = np.unique(dataSlice[self.filterCol])
-        filters = [str(f) for f in filters]
-        snr = np.zeros(len(dataSlice), dtype='float')
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
         # compute SNR for all observations
-        for filt in filters:
-            inFilt = np.where(dataSlice[self.filterCol] == filt)
-            snr[inFilt] = mafUtils.m52snr(self.mags[str(filt)], dataSlice[self.m5Col][inFilt])
+        snr = sliceContext.snr(self.mags, self.m5Col, self.filterCol)
 
         weights = self._computeWeights(dataSlice, snr)
         aveR = self._weightedR(dataSlice['ra_pi_amp'], dataSlice['dec_pi_amp'], weights)
@@ -375,6 +373,8 @@ class ParallaxDcrDegenMetric(BaseMetric):
         are bad. Experience with fitting Monte Carlo simulations suggests the astrometric fits start
         becoming poor around a correlation of 0.7.
     """
+    useSliceContext = True
+
     def __init__(self, metricName='ParallaxDcrDegenMetric', seeingCol='seeingFwhmGeom',
                  m5Col='fiveSigmaDepth', atm_err=0.01, rmag=20., SedTemplate='flat',
                  filterCol='filter', tol=0.05, **kwargs):
@@ -407,7 +407,7 @@ class ParallaxDcrDegenMetric(BaseMetric):
         result = a*x[0, :] + b*x[1, :]
         return result
 
-    def run(self, dataSlice, slicePoint=None):
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
         # The idea here is that we calculate position errors (in RA and Dec) for all observations.
         # Then we generate arrays of the parallax offsets (delta RA parallax = ra_pi_amp, etc)
         #  and the DCR offsets (delta RA DCR = ra_dcr_amp, etc), and just add them together into one
@@ -416,10 +416,9 @@ class ParallaxDcrDegenMetric(BaseMetric):
         # (i.e. the curve_fit result is [a=1, b=1] for the function _positions above)
         # then we should be able to disentangle the parallax and DCR offsets when fitting 'for real'.
         # compute SNR for all observations
-        snr = np.zeros(len(dataSlice), dtype='float')
-        for filt in self.filters:
-            inFilt = np.where(dataSlice[self.filterCol] == filt)
-            snr[inFilt] = mafUtils.m52snr(self.mags[filt], dataSlice[self.m5Col][inFilt])
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        snr = sliceContext.snr(self.mags, self.m5Col, self.filterCol)
         # Compute the centroiding uncertainties
         # Note that these centroiding uncertainties depend on the physical size of the PSF, thus
         # we are using seeingFwhmGeom for these metrics, not seeingFwhmEff.
@@ -1,6 +1,6 @@
 import numpy as np
-from scipy.interpolate import interp1d
 from lsst.sims.maf.metrics import BaseMetric
+from lsst.sims.maf.utils import crowdingErrorPerSeeing
 import healpy as hp
 
 # Modifying from Knut Olson's fork at:
@@ -33,16 +33,41 @@ def _compCrowdError(magVector, lumFunc, seeing, singleMag=None):
 
     Equation from Olsen, Blum, & Rigaut 2003, AJ, 126, 452
     """
-    lumAreaArcsec = 3600.0 ** 2
-    lumVector = 10 ** (-0.4 * magVector)
-    coeff = np.sqrt(np.pi / lumAreaArcsec) * seeing / 2.
-    myInt = (np.add.accumulate((lumVector ** 2 * lumFunc)[::-1]))[::-1]
-    temp = np.sqrt(myInt) / lumVector
+    crowdError = crowdingErrorPerSeeing(magVector, lumFunc)
     if singleMag is not None:
-        interp = interp1d(magVector, temp)
-        temp = interp(singleMag)
-    crowdError = coeff * temp
-    return crowdError
+        crowdError = _interpCrowdError(magVector, crowdError, singleMag)
+    return seeing * crowdError
+
+
+def _interpCrowdError(magVector, crowdError, mag):
+    """Linearly interpolate the crowding error table to mag (which must be within magVector)."""
+    if np.any(mag < magVector[0]) or np.any(mag > magVector[-1]):
+        raise ValueError('Magnitude %s is outside the range of the luminosity function (%.2f to %.2f)'
+                         % (mag, magVector[0], magVector[-1]))
+    return np.interp(mag, magVector, crowdError)
+
+
+def _crowdErrorTable(slicePoint, filtername):
+    """Return the magnitudes and the crowding error (for one arcsecond seeing) at this slicePoint.
+
+    The crowding error table is precomputed for all slicePoints by the stellar density maps;
+    if it is not available, it is calculated from the luminosity function at this slicePoint.
+    """
+    # Set magVector to the same length as starLumFunc (lower edge of mag bins)
+    magVector = slicePoint[f'starMapBins_{filtername}'][1:]
+    crowdError = slicePoint.get(f'starCrowdErr_{filtername}')
+    if crowdError is None:
+        crowdError = crowdingErrorPerSeeing(magVector, slicePoint[f'starLumFunc_{filtername}'])
+    return magVector, crowdError
+
+
+def _crowdMag(magVector, crowdError, crowding_error):
+    """Find the magnitude at which the crowding error reaches crowding_error."""
+    # Locate at which point crowding error is greater than user-defined limit
+    aboveCrowd = np.where(crowdError >= crowding_error)[0]
+    if np.size(aboveCrowd) == 0:
+        return max(magVector)
+    return magVector[max(aboveCrowd[0]-1, 0)]
 
 
 class CrowdingM5Metric(BaseMetric):
@@ -80,22 +105,10 @@ class CrowdingM5Metric(BaseMetric):
         super().__init__(col=cols, maps=maps, units=units, metricName=metricName, **kwargs)
 
     def run(self, dataSlice, slicePoint=None):
-        # Set magVector to the same length as starLumFunc (lower edge of mag bins)
-        magVector = slicePoint[f'starMapBins_{self.filtername}'][1:]
-        # Pull up density of stars at this point in the sky
-        lumFunc = slicePoint[f'starLumFunc_{self.filtername}']
+        magVector, crowdError = _crowdErrorTable(slicePoint, self.filtername)
         # Calculate the crowding error using the best seeing value (in any filter?)
-        crowdError = _compCrowdError(magVector, lumFunc,
-                                     seeing=min(dataSlice[self.seeingCol]))
-        # Locate at which point crowding error is greater than user-defined limit
-        aboveCrowd = np.where(crowdError >= self.crowding_error)[0]
-
-        if np.size(aboveCrowd) == 0:
-            result = max(magVector)
-        else:
-            crowdMag = magVector[max(aboveCrowd[0]-1, 0)]
-            result = crowdMag
-
+        crowdError = min(dataSlice[self.seeingCol]) * crowdError
+        result = _crowdMag(magVector, crowdError, self.crowding_error)
         return result
 
 
@@ -142,20 +155,6 @@ class NstarsMetric(BaseMetric):
     def run(self, dataSlice, slicePoint=None):
 
         pix_area = hp.nside2pixarea(slicePoint['nside'], degrees=True)
-        # Set magVector to the same length as starLumFunc (lower edge of mag bins)
-        magVector = slicePoint[f'starMapBins_{self.filtername}'][1:]
-        # Pull up density of stars at this point in the sky
-        lumFunc = slicePoint[f'starLumFunc_{self.filtername}']
-        # Calculate the crowding error using the best seeing value (in any filter?)
-        crowdError = _compCrowdError(magVector, lumFunc,
-                                     seeing=min(dataSlice[self.seeingCol]))
-        # Locate at which point crowding error is greater than user-defined limit
-        aboveCrowd = np.where(crowdError >= self.crowding_error)[0]
-
-        if np.size(aboveCrowd) == 0:
-            crowdMag = max(magVector)
-        else:
-            crowdMag = magVector[max(aboveCrowd[0]-1, 0)]
 
         # Compute the coadded depth, and the mag where that depth hits the error specified
         coadded_depth = 1.25 * np.log10(np.sum(10.**(.8*dataSlice[self.m5Col])))
@@ -165,6 +164,10 @@ class NstarsMetric(BaseMetric):
         if self.ignore_crowding:
             min_mag = mag_limit
         else:
+            magVector, crowdError = _crowdErrorTable(slicePoint, self.filtername)
+            # Calculate the crowding error using the best seeing value (in any filter?)
+            crowdError = min(dataSlice[self.seeingCol]) * crowdError
+            crowdMag = _crowdMag(magVector, crowdError, self.crowding_error)
             min_mag = np.min([crowdMag, mag_limit])
 
         # Interpolate to the number of stars
@@ -201,10 +204,8 @@ class CrowdingMagUncertMetric(BaseMetric):
                          metricName=metricName, **kwargs)
 
     def run(self, dataSlice, slicePoint=None):
-        magVector = slicePoint[f'starMapBins_{self.filtername}'][1:]
-        lumFunc = slicePoint[f'starLumFunc_{self.filtername}']
-        # Magnitude uncertainty given crowding
-        dmagCrowd = _compCrowdError(magVector, lumFunc,
-                                    dataSlice[self.seeingCol], singleMag=self.rmag)
+        magVector, crowdError = _crowdErrorTable(slicePoint, self.filtername)
+        # Magnitude uncertainty given crowding, for each visit
+        dmagCrowd = dataSlice[self.seeingCol] * _interpCrowdError(magVector, crowdError, self.rmag)
         result = np.mean(dmagCrowd)
         return result
@@ -1,5 +1,6 @@
 import numpy as np
 from .baseMetric import BaseMetric
+from .sliceContext import SliceContext
 import lsst.sims.maf.utils as mafUtils
 import lsst.sims.utils as utils
 
@@ -15,6 +16,7 @@ class DcrPrecisionMetric(BaseMetric):
     atm_err : float
         Minimum error in photometry centroids introduced by the atmosphere (arcseconds). Default 0.01.
     """
+    useSliceContext = True
 
     def __init__(self, metricName='DCRprecision', seeingCol='seeingFwhmGeom',
                  m5Col='fiveSigmaDepth', HACol='HA', PACol='paraAngle',
@@ -38,12 +40,10 @@ class DcrPrecisionMetric(BaseMetric):
         super(DcrPrecisionMetric, self).__init__(cols, metricName=metricName, units=units,
                                                  **kwargs)
 
-    def run(self, dataSlice, slicePoint=None):
-
-        snr = np.zeros(len(dataSlice), dtype='float')
-        for filt in self.filters:
-            inFilt = np.where(dataSlice[self.filterCol] == filt)
-            snr[inFilt] = mafUtils.m52snr(self.mags[filt], dataSlice[self.m5Col][inFilt])
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        snr = sliceContext.snr(self.mags, self.m5Col, self.filterCol)
 
         position_errors = np.sqrt(mafUtils.astrom_precision(dataSlice[self.seeingCol], snr)**2 +
                                   self.atm_err**2)
@@ -1,9 +1,11 @@
 import numpy as np
+import numpy.ma as ma
 import warnings
 
 from .moMetrics import BaseMoMetric
 
-__all__ = ['integrateOverH', 'ValueAtHMetric', 'MeanValueAtHMetric',
+__all__ = ['integrateOverH', 'completenessOverH', 'completenessOverTime',
+           'ValueAtHMetric', 'MeanValueAtHMetric',
            'MoCompletenessMetric', 'MoCompletenessAtTimeMetric']
 
 
@@ -14,6 +16,7 @@ def integrateOverH(Mvalues, Hvalues, Hindex = 0.33):
     ----------
     Mvalues : numpy.ndarray
         The metric values at each H value.
+        If multi-dimensional, the last axis must correspond to Hvalues (and each row is integrated).
     Hvalues : numpy.ndarray
         The H values corresponding to each Mvalue (must be the same length).
     Hindex : float, opt
@@ -29,10 +32,74 @@ def integrateOverH(Mvalues, Hvalues, Hindex = 0.33):
     # dndh = differential size distribution (number in this bin)
     dndh = np.power(10., Hindex*(Hvalues-Hvalues.min()))
     # dn = cumulative size distribution (number in this bin and brighter)
-    intVals = np.cumsum(Mvalues*dndh)/np.cumsum(dndh)
+    intVals = np.cumsum(Mvalues*dndh, axis=-1)/np.cumsum(dndh)
     return intVals
 
 
+def completenessOverH(metricValues, threshold=1):
+    """Calculate the (differential) fraction of the population with metric value >= threshold, at each H.
+
+    Parameters
+    ----------
+    metricValues : numpy.ma.MaskedArray
+        The metric values (such as Discovery_N_Chances), shape (nSso, nH). Masked values count as 0.
+    threshold : float, opt
+        The threshold value to count as 'found'. Default 1.
+
+    Returns
+    -------
+    numpy.ndarray
+        The differential completeness at each H value.
+    """
+    nSsos = metricValues.shape[0]
+    found = np.count_nonzero(ma.filled(metricValues, 0) >= threshold, axis=0)
+    return found / float(nSsos)
+
+
+def completenessOverTime(discoveryTimes, Hvalues, times, Hindex=0.33):
+    """Calculate the completeness as a function of both H and time, in a single pass over the
+    discovery times of all objects.
+
+    The discovery times are assigned to the time bins all at once (with sorted bin edges), and the
+    cumulative count of discovered objects is then accumulated along the time axis.
+    As with np.histogram, discoveries must fall within [times[0], times[-1]] to be counted.
+
+    Parameters
+    ----------
+    discoveryTimes : numpy.ma.MaskedArray
+        The discovery time (such as from the Discovery_Time metric) of each object, shape (nSso, nH).
+        Masked values are not counted as discovered.
+    Hvalues : numpy.ndarray
+        The H values corresponding to the second axis of discoveryTimes.
+    times : numpy.ndarray
+        The (increasing) times at which to evaluate the completeness.
+    Hindex : float, opt
+        The power-law index expected for the H value distribution, used for the cumulative completeness.
+        Default 0.33.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The differential and cumulative completeness, each with shape (nTimes, nH).
+    """
+    times = np.asarray(times, float)
+    nTimes = len(times)
+    nSsos, nH = discoveryTimes.shape
+    found = ~ma.getmaskarray(discoveryTimes)
+    tvals = ma.getdata(discoveryTimes)[found]
+    hidx = np.nonzero(found)[1]
+    # Index of the time bin for each discovery; the last bin edge is inclusive, as in np.histogram.
+    tidx = np.searchsorted(times, tvals, side='right')
+    tidx = np.where(tvals == times[-1], nTimes - 1, tidx)
+    counts = np.bincount(hidx * (nTimes + 1) + tidx, minlength=nH * (nTimes + 1)).reshape(nH, nTimes + 1)
+    # Discoveries before times[0] (bin 0) or after times[-1] (bin nTimes) are not counted.
+    nFound = np.zeros((nH, nTimes), float)
+    nFound[:, 1:] = np.cumsum(counts[:, 1:nTimes], axis=1)
+    differential = nFound.swapaxes(0, 1) / float(nSsos)
+    cumulative = integrateOverH(differential, np.asarray(Hvalues, float), Hindex)
+    return differential, cumulative
+
+
 class ValueAtHMetric(BaseMoMetric):
     """Return the metric value at a given H value.
 
@@ -148,15 +215,11 @@ class MoCompletenessMetric(BaseMoMetric):
         self.Hindex = Hindex
 
     def run(self, metricValues, Hvals):
-        nSsos = metricValues.shape[0]
         nHval = len(Hvals)
         metricValH = metricValues.swapaxes(0, 1)
         if nHval == metricValues.shape[1]:
             # Hvals array is probably the same as the cloned H array.
-            completeness = np.zeros(len(Hvals), float)
-            for i, H in enumerate(Hvals):
-                completeness[i] = np.where(metricValH[i].filled(0) >= self.threshold)[0].size
-            completeness = completeness / float(nSsos)
+            completeness = completenessOverH(metricValues, self.threshold)
         else:
             # The Hvals are spread more randomly among the objects (we probably used one per object).
             hrange = Hvals.max() - Hvals.min()
@@ -248,18 +311,29 @@ class MoCompletenessAtTimeMetric(BaseMoMetric):
         if len(Hvals) != discoveryTimes.shape[1]:
             warnings.warn("This summary metric expects cloned H distribution. Cannot calculate summary.")
             return
-        nSsos = discoveryTimes.shape[0]
-        timesinH = discoveryTimes.swapaxes(0, 1)
-        completenessH = np.empty([len(Hvals), len(self.times)], float)
-        for i, H in enumerate(Hvals):
-            n, b = np.histogram(timesinH[i].compressed(), bins=self.times)
-            completenessH[i][0] = 0
-            completenessH[i][1:] = n.cumsum()
-        completenessH = completenessH / float(nSsos)
-        completeness = completenessH.swapaxes(0, 1)
+        differential, cumulative = completenessOverTime(discoveryTimes, Hvals, self.times, self.Hindex)
         if self.cumulative:
-            for i, t in enumerate(self.times):
-                completeness[i] = integrateOverH(completeness[i], Hvals)
+            return self.summarize(cumulative, Hvals)
+        return self.summarize(differential, Hvals)
+
+    def summarize(self, completeness, Hvals):
+        """Pick out the completeness over time at self.Hval, from completeness at all times and H values.
+
+        This allows the completeness (from completenessOverTime) to be calculated once and shared
+        between several MoCompletenessAtTimeMetrics with different Hval or cumulative values.
+
+        Parameters
+        ----------
+        completeness : numpy.ndarray
+            The differential or cumulative (matching self.cumulative) completeness, shape (nTimes, nH).
+        Hvals : numpy.ndarray
+            The H values corresponding to the second axis of completeness.
+
+        Returns
+        -------
+        numpy.ndarray
+            The summary value (names and completeness values at each time).
+        """
         # To save the summary statistic, we must pick out a given H value.
         if self.Hval is None:
             Hidx = len(Hvals) // 2
@@ -2,7 +2,7 @@ import numpy as np
 from .baseMetric import BaseMetric
 from lsst.sims.maf.utils import m52snr
 import lsst.sims.utils as utils
-import scipy
+import scipy.stats
 
 __all__ = ['PeriodicDetectMetric']
 
@@ -17,15 +17,18 @@ class PeriodicDetectMetric(BaseMetric):
 
     period : float (2) or array
         The period of the star (days). Can be a single value, or an array. If an array, amplitude and starMag
-        should be arrays of equal length.
+        should be arrays of equal length (or single values).
     amplitude : floar (0.1)
-        The amplitude of the stellar variablility (mags).
+        The amplitude of the stellar variablility (mags). Can be a single value for all periods.
     starMag : float (20.)
-        The mean magnitude of the star in r (mags).
+        The mean magnitude of the star in r (mags). Can be a single value for all periods.
     sig_level : float (0.05)
         The value to use to compare to the p-value when deciding if we can reject the null hypothesis.
     SedTemplate : str ('F')
         The stellar SED template to use to generate realistic colors (default is an F star, so RR Lyrae-like)
+    maxBlockValues : int (1000000)
+        The maximum number of (period, visit) light curve values to evaluate at once.
+        All periods are evaluated together (in blocks of this size) for each slice.
 
     Returns
     -------
@@ -35,30 +38,37 @@ class PeriodicDetectMetric(BaseMetric):
     """
     def __init__(self, mjdCol='observationStartMJD', periods=2., amplitudes=0.1, m5Col='fiveSigmaDepth',
                  metricName='PeriodicDetectMetric', filterCol='filter', starMags=20, sig_level=0.05, 
-                 SedTemplate='F', **kwargs):
+                 SedTemplate='F', maxBlockValues=1000000, **kwargs):
 
         self.mjdCol = mjdCol
         self.m5Col = m5Col
         self.filterCol = filterCol
-        if np.size(periods) == 1:
-            self.periods = [periods]
-            # Using the same magnitude for all filters. Could expand to fit the mean in each filter.
-            self.starMags = [starMags]
-            self.amplitudes = [amplitudes]
-        else:
-            self.periods = periods
-            self.starMags = starMags
-            self.amplitudes = amplitudes
+        # Evaluate every (period, amplitude, starMag) combination; scalar amplitudes and starMags
+        # (using the same magnitude for all filters) apply to all periods.
+        self.periods = np.asarray(periods, float).ravel()
+        try:
+            self.amplitudes = np.broadcast_to(np.asarray(amplitudes, float), self.periods.shape)
+            self.starMags = np.broadcast_to(np.asarray(starMags, float), self.periods.shape)
+        except ValueError:
+            raise ValueError('amplitudes and starMags must be single values or match the shape of periods.')
         self.sig_level = sig_level
         self.SedTemplate = SedTemplate
+        self.maxBlockValues = maxBlockValues
+        # Calculate the stellar magnitudes in each filter once (only once per unique r magnitude).
+        uMags, magIdx = np.unique(self.starMags, return_inverse=True)
+        uStellarMags = [utils.stellarMags(self.SedTemplate, rmag=rmag) for rmag in uMags]
+        self.mags = {}
+        for filtername in uStellarMags[0]:
+            self.mags[filtername] = np.array([m[filtername] for m in uStellarMags])[magIdx]
 
         super(PeriodicDetectMetric, self).__init__([mjdCol, m5Col, filterCol], metricName=metricName,
                                                    units='N Detected (0, %i)' % np.size(periods), **kwargs)
 
     def run(self, dataSlice, slicePoint=None):
-        result = 0
         n_pts = np.size(dataSlice[self.mjdCol])
-        n_filt = np.size(np.unique(dataSlice[self.filterCol]))
+        # Group the visits by filter (once), so all periods can be evaluated together.
+        u_filters, filtIdx = np.unique(dataSlice[self.filterCol], return_inverse=True)
+        n_filt = np.size(u_filters)
 
         # If we had a correct model with phase, amplitude, period, mean_mags, then chi_squared/DoF would be ~1 with 3+n_filt free parameters.
         # The mean is one free parameter
@@ -66,30 +76,38 @@ class PeriodicDetectMetric(BaseMetric):
         p2 = 3.+n_filt
         chi_sq_2 = 1.*(n_pts-p2)
 
-        u_filters = np.unique(dataSlice[self.filterCol])
-
-        if n_pts > p2:
-            for period, starMag, amplitude in zip(self.periods, self.starMags, self.amplitudes):
-                chi_sq_1 = 0
-                mags = utils.stellarMags(self.SedTemplate, rmag=starMag)
-                for filtername in u_filters:
-                    in_filt = np.where(dataSlice[self.filterCol] == filtername)[0]
-                    lc = amplitude*np.sin(dataSlice[self.mjdCol][in_filt]*(np.pi*2)/period) + mags[filtername]
-                    snr = m52snr(lc, dataSlice[self.m5Col][in_filt])
-                    delta_m = 2.5*np.log10(1.+1./snr)
-                    weights = 1./(delta_m**2)
-                    weighted_mean = np.sum(weights*lc)/np.sum(weights)
-                    chi_sq_1 += np.sum(((lc - weighted_mean)**2/delta_m**2))
-                # Yes, I'm fitting magnitudes rather than flux. At least I feel kinda bad about it.
-                # F-test for nested models Regression problems:  https://en.wikipedia.org/wiki/F-test
-                f_numerator = (chi_sq_1 - chi_sq_2)/(p2-p1)
-                f_denom = 1.  # This is just reduced chi-squared for the more complicated model, so should be 1.
-                f_val = f_numerator/f_denom
-                # Has DoF (p2-p1, n-p2)
-                # https://stackoverflow.com/questions/21494141/how-do-i-do-a-f-test-in-python/21503346
-                p_value = scipy.stats.f.sf(f_val, p2-p1, n_pts-p2)
-                if np.isfinite(p_value):
-                    if p_value < self.sig_level:
-                        result += 1
+        if n_pts <= p2:
+            return 0
 
-        return result
+        order = np.argsort(filtIdx, kind='mergesort')
+        filtIdx = filtIdx[order]
+        filtStart = np.searchsorted(filtIdx, np.arange(n_filt))
+        times = dataSlice[self.mjdCol][order]
+        m5 = dataSlice[self.m5Col][order]
+        # Stellar magnitude of each star (rows), in the filter of each visit (columns).
+        allMags = np.array([self.mags[filtername] for filtername in u_filters])[filtIdx].T
+        result = 0
+        # Evaluate the periods in blocks, to limit the size of the (period, visit) arrays.
+        blockSize = max(1, self.maxBlockValues // n_pts)
+        for i in range(0, len(self.periods), blockSize):
+            periods = self.periods[i:i + blockSize, np.newaxis]
+            amplitudes = self.amplitudes[i:i + blockSize, np.newaxis]
+            mags = allMags[i:i + blockSize]
+            # Light curves of every (period, visit), and their weighted chi-squared relative to a constant.
+            lc = amplitudes * np.sin(times * (np.pi*2) / periods) + mags
+            snr = m52snr(lc, m5)
+            delta_m = 2.5*np.log10(1.+1./snr)
+            weights = 1./(delta_m**2)
+            weighted_mean = (np.add.reduceat(weights*lc, filtStart, axis=1) /
+                             np.add.reduceat(weights, filtStart, axis=1))
+            chi_sq_1 = np.sum((lc - weighted_mean[:, filtIdx])**2 / delta_m**2, axis=1)
+            # Yes, I'm fitting magnitudes rather than flux. At least I feel kinda bad about it.
+            # F-test for nested models Regression problems:  https://en.wikipedia.org/wiki/F-test
+            f_numerator = (chi_sq_1 - chi_sq_2)/(p2-p1)
+            f_denom = 1.  # This is just reduced chi-squared for the more complicated model, so should be 1.
+            f_val = f_numerator/f_denom
+            # Has DoF (p2-p1, n-p2)
+            # https://stackoverflow.com/questions/21494141/how-do-i-do-a-f-test-in-python/21503346
+            p_value = scipy.stats.f.sf(f_val, p2-p1, n_pts-p2)
+            result += np.sum(np.isfinite(p_value) & (p_value < self.sig_level))
+        return int(result)
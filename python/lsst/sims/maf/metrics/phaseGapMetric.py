@@ -4,12 +4,26 @@ from lsst.sims.maf.utils import m52snr
 
 __all__ = ['PhaseGapMetric', 'PeriodicQualityMetric']
 
+
+def _phaseBlocks(times, periods, maxBlockValues):
+    """Generate the phases of times, for all periods, in blocks of (period, visit) values.
+
+    Yields (slice, phases), where phases is the (nPeriods in block, nVisits) array of phases (0-1)
+    for the periods periods[slice]; each block holds at most maxBlockValues values (at least one period).
+    """
+    periods = np.asarray(periods, float)
+    blockSize = max(1, maxBlockValues // max(1, np.size(times)))
+    for i in range(0, len(periods), blockSize):
+        p = periods[i:i + blockSize, np.newaxis]
+        yield slice(i, i + len(p)), (times % p) / p
+
+
 class PhaseGapMetric(BaseMetric):
     """
     Measure the maximum gap in phase coverage for observations of periodic variables.
     """
     def __init__(self, col='observationStartMJD', nPeriods=5, periodMin=3., periodMax=35., nVisitsMin=3,
-                 metricName='Phase Gap', **kwargs):
+                 metricName='Phase Gap', maxBlockValues=1000000, **kwargs):
         """
         Construct an instance of a PhaseGapMetric class
 
@@ -18,8 +32,10 @@ class PhaseGapMetric(BaseMetric):
         :param periodMin: Minimum period to test (days)
         :param periodMax: Maximimum period to test (days)
         :param nVistisMin: minimum number of visits necessary before looking for the phase gap
+        :param maxBlockValues: maximum number of (period, visit) phases to calculate at once
         """
         self.periodMin = periodMin
+        self.maxBlockValues = maxBlockValues
         self.periodMax = periodMax
         self.nPeriods = nPeriods
         self.nVisitsMin = nVisitsMin
@@ -43,15 +59,14 @@ class PhaseGapMetric(BaseMetric):
             periods = periods/np.max(periods)*(self.periodMax-self.periodMin)+self.periodMin
         maxGap = np.zeros(self.nPeriods, float)
 
-        for i, period in enumerate(periods):
-            # For each period, calculate the phases.
-            phases = (dataSlice[self.colname] % period)/period
-            phases = np.sort(phases)
+        # Calculate the phases for blocks of periods at once.
+        for block, phases in _phaseBlocks(dataSlice[self.colname], periods, self.maxBlockValues):
+            phases = np.sort(phases, axis=1)
             # Find the largest gap in coverage.
-            gaps = np.diff(phases)
-            start_to_end = np.array([1.0 - phases[-1] + phases[0]], float)
-            gaps = np.concatenate([gaps, start_to_end])
-            maxGap[i] = np.max(gaps)
+            gaps = np.diff(phases, axis=1)
+            start_to_end = 1.0 - phases[:, -1:] + phases[:, :1]
+            gaps = np.concatenate([gaps, start_to_end], axis=1)
+            maxGap[block] = np.max(gaps, axis=1)
 
         return {'periods':periods, 'maxGaps':maxGap}
 
@@ -83,42 +98,53 @@ class PhaseGapMetric(BaseMetric):
 
 #  To fit a periodic source well, you need to cover the full phase, and fit the amplitude.
 class PeriodicQualityMetric(BaseMetric):
+    """
+    Measure how well the phase and amplitude of a periodic source are covered, for a star of magnitude starMag.
+
+    1 is perfectly balanced phase coverage (and amplitude SNR), 0 is no effective coverage.
+    The period can also be an array of periods, in which case the quality for the worst (lowest quality)
+    period is returned.
+    """
     def __init__(self, mjdCol='observationStartMJD', period=2., m5Col='fiveSigmaDepth',
-                 metricName='PhaseCoverageMetric', starMag=20, **kwargs):
+                 metricName='PhaseCoverageMetric', starMag=20, maxBlockValues=1000000, **kwargs):
         self.mjdCol = mjdCol
         self.m5Col = m5Col
         self.period = period
         self.starMag = starMag
+        self.maxBlockValues = maxBlockValues
         super(PeriodicQualityMetric, self).__init__([mjdCol, m5Col], metricName=metricName,
                                                     units='Fraction, 0-1', **kwargs)
 
-    def _calc_phase(self, dataSlice):
+    def _calc_phase(self, phases, snr):
         """1 is perfectly balanced phase coverage, 0 is no effective coverage.
         """
-        angles = dataSlice[self.mjdCol] % self.period
-        angles = angles/self.period * 2.*np.pi
+        angles = phases * 2.*np.pi
         x = np.cos(angles)
         y = np.sin(angles)
 
-        snr = m52snr(self.starMag, dataSlice[self.m5Col])
-        x_ave = np.average(x, weights=snr)
-        y_ave = np.average(y, weights=snr)
+        x_ave = np.dot(x, snr) / np.sum(snr)
+        y_ave = np.dot(y, snr) / np.sum(snr)
 
         vector_off = np.sqrt(x_ave**2+y_ave**2)
         return 1.-vector_off
 
-    def _calc_amp(self, dataSlice):
+    def _calc_amp(self, phases, snr):
         """Fractional SNR on the amplitude, testing for a variety of possible phases
         """
-        phases = np.arange(0, np.pi, np.pi/8.)
-        snr = m52snr(self.starMag, dataSlice[self.m5Col])
-        amp_snrs = np.sin(dataSlice[self.mjdCol]/self.period*2*np.pi + phases[:, np.newaxis])*snr
-        amp_snr = np.min(np.sqrt(np.sum(amp_snrs**2, axis=1)))
+        offsets = np.arange(0, np.pi, np.pi/8.)
+        amp_snrs = np.sin(phases[:, np.newaxis, :]*2*np.pi + offsets[:, np.newaxis])*snr
+        amp_snr = np.min(np.sqrt(np.sum(amp_snrs**2, axis=2)), axis=1)
 
         max_snr = np.sqrt(np.sum(snr**2))
         return amp_snr/max_snr
 
     def run(self, dataSlice, slicePoint=None):
-        amplitude_fraction = self._calc_amp(dataSlice)
-        phase_fraction = self._calc_phase(dataSlice)
-        return amplitude_fraction * phase_fraction
+        periods = np.atleast_1d(self.period)
+        snr = m52snr(self.starMag, dataSlice[self.m5Col])
+        quality = np.zeros(len(periods), float)
+        # The amplitude calculation uses 8 phase offsets per (period, visit).
+        for block, phases in _phaseBlocks(dataSlice[self.mjdCol], periods, self.maxBlockValues // 8):
+            amplitude_fraction = self._calc_amp(phases, snr)
+            phase_fraction = self._calc_phase(phases, snr)
+            quality[block] = amplitude_fraction * phase_fraction
+        return np.min(quality)
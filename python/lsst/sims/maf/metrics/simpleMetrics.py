@@ -40,7 +40,11 @@ class Coaddm5Metric(BaseMetric):
 class MaxMetric(BaseMetric):
     """Calculate the maximum of a simData column slice.
     """
-    def run(self, dataSlice, slicePoint=None):
+    useSliceContext = True
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is not None:
+            return sliceContext.minMax(self.colname)[1]
         return np.max(dataSlice[self.colname])
 
 class AbsMaxMetric(BaseMetric):
@@ -52,7 +56,11 @@ class AbsMaxMetric(BaseMetric):
 class MeanMetric(BaseMetric):
     """Calculate the mean of a simData column slice.
     """
-    def run(self, dataSlice, slicePoint=None):
+    useSliceContext = True
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is not None:
+            return sliceContext.mean(self.colname)
         return np.mean(dataSlice[self.colname])
 
 class AbsMeanMetric(BaseMetric):
@@ -64,7 +72,11 @@ class AbsMeanMetric(BaseMetric):
 class MedianMetric(BaseMetric):
     """Calculate the median of a simData column slice.
     """
-    def run(self, dataSlice, slicePoint=None):
+    useSliceContext = True
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is not None:
+            return np.median(sliceContext.sortedCol(self.colname))
         return np.median(dataSlice[self.colname])
 
 class AbsMedianMetric(BaseMetric):
@@ -76,19 +88,32 @@ class AbsMedianMetric(BaseMetric):
 class MinMetric(BaseMetric):
     """Calculate the minimum of a simData column slice.
     """
-    def run(self, dataSlice, slicePoint=None):
+    useSliceContext = True
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is not None:
+            return sliceContext.minMax(self.colname)[0]
         return np.min(dataSlice[self.colname])
 
 class FullRangeMetric(BaseMetric):
     """Calculate the range of a simData column slice.
     """
-    def run(self, dataSlice, slicePoint=None):
+    useSliceContext = True
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is not None:
+            minVal, maxVal = sliceContext.minMax(self.colname)
+            return maxVal - minVal
         return np.max(dataSlice[self.colname])-np.min(dataSlice[self.colname])
 
 class RmsMetric(BaseMetric):
     """Calculate the standard deviation of a simData column slice.
     """
-    def run(self, dataSlice, slicePoint=None):
+    useSliceContext = True
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is not None:
+            return sliceContext.std(self.colname)
         return np.std(dataSlice[self.colname])
 
 class SumMetric(BaseMetric):
@@ -166,8 +191,14 @@ class RobustRmsMetric(BaseMetric):
     """Use the inter-quartile range of the data to estimate the RMS.  
     Robust since this calculation does not include outliers in the distribution.
     """
-    def run(self, dataSlice, slicePoint=None):
-        iqr = np.percentile(dataSlice[self.colname],75)-np.percentile(dataSlice[self.colname],25)
+    useSliceContext = True
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is not None:
+            q25, q75 = sliceContext.percentile(self.colname, [25, 75])
+            iqr = q75 - q25
+        else:
+            iqr = np.percentile(dataSlice[self.colname],75)-np.percentile(dataSlice[self.colname],25)
         rms = iqr/1.349 #approximation
         return rms
 
@@ -232,12 +263,17 @@ class FracBelowMetric(BaseMetric):
 class PercentileMetric(BaseMetric):
     """Find the value of a column at a given percentile.
     """
+    useSliceContext = True
+
     def __init__(self, col=None, percentile=90, metricName=None, **kwargs):
         if metricName is None:
             metricName = '%.0fth%sile %s' %(percentile, '%', col)
         super(PercentileMetric, self).__init__(col=col, metricName=metricName, **kwargs)
         self.percentile = percentile
-    def run(self, dataSlice, slicePoint=None):
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is not None:
+            return sliceContext.percentile(self.colname, self.percentile)
         pval = np.percentile(dataSlice[self.colname], self.percentile)
         return pval
 
@@ -245,6 +281,8 @@ class NoutliersNsigmaMetric(BaseMetric):
     """Calculate the # of visits less than nSigma below the mean (nSigma<0) or
     more than nSigma above the mean of 'col'.
     """
+    useSliceContext = True
+
     def __init__(self, col=None, nSigma=3., metricName=None, **kwargs):
         self.nSigma = nSigma
         self.col = col
@@ -253,9 +291,13 @@ class NoutliersNsigmaMetric(BaseMetric):
         super(NoutliersNsigmaMetric, self).__init__(col=col, metricName=metricName, **kwargs)
         self.metricDtype = 'int'
 
-    def run(self, dataSlice, slicePoint=None):
-        med = np.mean(dataSlice[self.colname])
-        std = np.std(dataSlice[self.colname])
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is not None:
+            med = sliceContext.mean(self.colname)
+            std = sliceContext.std(self.colname)
+        else:
+            med = np.mean(dataSlice[self.colname])
+            std = np.std(dataSlice[self.colname])
         boundary = med + self.nSigma*std
         # If nsigma is positive, look for outliers above median.
         if self.nSigma >=0:
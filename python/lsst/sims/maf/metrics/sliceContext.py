@@ -0,0 +1,151 @@
+import numpy as np
+from lsst.sims.maf.utils import m52snr, segmentByNight
+
+__all__ = ['SliceContext']
+
+
+class SliceContext(object):
+    """Cache of the per-slice preprocessing (sorting, grouping) shared between metrics.
+
+    Many metrics start by sorting the dataSlice by time, finding the unique nights, or splitting
+    the visits by filter. When a MetricBundleGroup runs a compatible list of metrics, it builds one
+    SliceContext for each slicePoint and passes it to every metric which sets useSliceContext = True,
+    so that each of these steps is done only once per slicePoint. MetricBundle.computeSummaryStats
+    similarly shares one SliceContext of the metric values between the summary metrics.
+    Each value is calculated on first request, then cached for the following metrics.
+    Metrics must treat the returned arrays as read-only.
+
+    Parameters
+    ----------
+    dataSlice : numpy.ndarray
+        The data at this slicePoint (as passed to metric.run).
+    sortedCols : list of str, opt
+        Columns which are already known to be in increasing order in the dataSlice (such as the time
+        column, when the slicer returns sorted indexes of time-ordered simData), so do not need sorting.
+        Default None.
+    """
+    def __init__(self, dataSlice, sortedCols=None):
+        self.dataSlice = dataSlice
+        if sortedCols is None:
+            sortedCols = []
+        self.sortedCols = sortedCols
+        self._cache = {}
+
+    def _cached(self, key, func, *args):
+        if key not in self._cache:
+            self._cache[key] = func(*args)
+        return self._cache[key]
+
+    def sortOrder(self, col):
+        """Return the indexes which sort the dataSlice by col (as np.argsort).
+        """
+        if col in self.sortedCols:
+            return self._cached(('sortOrder', col), np.arange, len(self.dataSlice))
+        return self._cached(('sortOrder', col), np.argsort, self.dataSlice[col])
+
+    def sortedCol(self, col, orderCol=None):
+        """Return the values of col, sorted by the values of orderCol (default, col itself).
+        """
+        if orderCol is None:
+            orderCol = col
+        if orderCol in self.sortedCols:
+            return self.dataSlice[col]
+        return self._cached(('sortedCol', col, orderCol),
+                            lambda: self.dataSlice[col][self.sortOrder(orderCol)])
+
+    def sortedValid(self, col):
+        """Return the sorted values of col, without any NaN values (which np.sort places at the end).
+        """
+        return self._cached(('sortedValid', col), self._sortedValid, col)
+
+    def _sortedValid(self, col):
+        values = self.sortedCol(col)
+        if values.dtype.kind in 'fc':
+            return values[:np.searchsorted(values, np.nan)]
+        return values
+
+    def minMax(self, col):
+        """Return the minimum and maximum of col (as np.min, np.max, so NaN if there are any NaN values).
+        """
+        return self._cached(('minMax', col), self._minMax, col)
+
+    def _minMax(self, col):
+        values = self.sortedCol(col)
+        if len(self.sortedValid(col)) < len(values):
+            return np.nan, np.nan
+        return values[0], values[-1]
+
+    def percentile(self, col, q):
+        """Return the q-th percentile(s) of col (as np.percentile), using the sorted values.
+        """
+        return np.percentile(self.sortedCol(col), q)
+
+    def mean(self, col):
+        """Return the mean of col (as np.mean).
+        """
+        return self._cached(('mean', col), np.mean, self.dataSlice[col])
+
+    def std(self, col):
+        """Return the standard deviation of col (as np.std), using the cached mean.
+        """
+        return self._cached(('std', col), self._std, col)
+
+    def _std(self, col):
+        deviation = self.dataSlice[col] - self.mean(col)
+        return np.sqrt(np.mean(deviation * deviation))
+
+    def unique(self, col):
+        """Return the unique values of col, and the number of visits with each value (as np.unique).
+        """
+        return self._cached(('unique', col), lambda: np.unique(self.dataSlice[col], return_counts=True))
+
+    def nightSegments(self, timeCol, nightCol):
+        """Return the order, unique nights and night boundaries of the visits (see utils.segmentByNight).
+        """
+        return self._cached(('nightSegments', timeCol, nightCol), segmentByNight,
+                            self.dataSlice[timeCol], self.dataSlice[nightCol])
+
+    def filterGroups(self, filterCol):
+        """Return a dictionary of the (sorted) indexes of the visits in each filter.
+        """
+        return self._cached(('filterGroups', filterCol), self._filterGroups, filterCol)
+
+    def _filterGroups(self, filterCol):
+        filters = self.dataSlice[filterCol]
+        order = np.argsort(filters, kind='mergesort')
+        uFilters, starts = np.unique(filters[order], return_index=True)
+        ends = np.concatenate([starts[1:], [len(order)]])
+        groups = {}
+        for f, s, e in zip(uFilters, starts, ends):
+            if hasattr(f, 'decode'):
+                f = f.decode('utf-8')
+            groups[str(f)] = order[s:e]
+        return groups
+
+    def snr(self, mags, m5Col, filterCol):
+        """Return the SNR of each visit, for a source with magnitude mags[filter] in each filter.
+
+        As when the metrics calculate the SNR themselves, a KeyError is raised if a visit is in
+        a filter which is not in mags.
+
+        Parameters
+        ----------
+        mags : dict
+            The magnitude of the source in each filter.
+        m5Col : str
+            The column with the five sigma limiting magnitude of each visit.
+        filterCol : str
+            The column with the filter of each visit.
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        key = ('snr', m5Col, filterCol, tuple(sorted((str(f), float(m)) for f, m in mags.items())))
+        return self._cached(key, self._snr, mags, m5Col, filterCol)
+
+    def _snr(self, mags, m5Col, filterCol):
+        snr = np.zeros(len(self.dataSlice), dtype='float')
+        for f, idxs in self.filterGroups(filterCol).items():
+            snr[idxs] = m52snr(mags[f], self.dataSlice[m5Col][idxs])
+        return snr
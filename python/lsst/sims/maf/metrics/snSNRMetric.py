@@ -1,14 +1,35 @@
 import numpy as np
 import matplotlib.pylab as plt
-import numpy.lib.recfunctions as rf
 import yaml
 from scipy import interpolate
 import lsst.sims.maf.metrics as metrics
-from lsst.sims.maf.utils.snUtils import GenerateFakeObservations
-from collections import Iterable
+from collections import OrderedDict
+from collections.abc import Iterable
 import time
 
 
+def _lookupTable(interp):
+    """Compile a (linear) scipy interp1d reference interpolator into its sorted knots, evaluated with
+    np.interp. This gives the same values, without the overhead of calling the interp1d object.
+    Other interpolators are returned unchanged.
+    """
+    if not isinstance(interp, interpolate.interp1d) or interp._kind != 'linear' or interp.y.ndim != 1 \
+            or interp.bounds_error or isinstance(interp.fill_value, str):
+        return interp
+    if isinstance(interp.fill_value, tuple):
+        below, above = interp.fill_value
+    else:
+        below = above = interp.fill_value
+    x = np.array(interp.x, dtype=float)
+    y = np.array(interp.y, dtype=float)
+    below = float(np.asarray(below))
+    above = float(np.asarray(above))
+
+    def lookup(values):
+        return np.interp(values, x, y, left=below, right=above)
+    return lookup
+
+
 class SNSNRMetric(metrics.BaseMetric):
 
     """
@@ -33,13 +54,18 @@ class SNSNRMetric(metrics.BaseMetric):
     z : float,opt
        redshift for this study
        Default : 0.01
+    fakesCacheSize : int, opt
+       number of fake observation SNR results to keep, keyed on the season parameters they are
+       generated from (band, season, cadence, MJD_min, season_length, Nvisits, m5).
+       Default : 100
     """
 
     def __init__(self, metricName='SNSNRMetric',
                  mjdCol='observationStartMJD', RaCol='fieldRA', DecCol='fieldDec',
                  filterCol='filter', m5Col='fiveSigmaDepth', exptimeCol='visitExposureTime',
                  nightCol='night', obsidCol='observationId', nexpCol='numExposures',
-                 vistimeCol='visitTime', coadd=True, lim_sn=None, names_ref=None, season=1, z=0.01, **kwargs):
+                 vistimeCol='visitTime', coadd=True, lim_sn=None, names_ref=None, season=1, z=0.01,
+                 fakesCacheSize=100, **kwargs):
 
         self.mjdCol = mjdCol
         self.m5Col = m5Col
@@ -74,6 +100,13 @@ class SNSNRMetric(metrics.BaseMetric):
 
         # These are reference LC
         self.lim_sn = lim_sn
+        # Compile the reference flux and m5-to-flux interpolators once, as lookup tables.
+        if lim_sn is not None:
+            self.ref_fluxes = [_lookupTable(f) for f in lim_sn.fluxes]
+            self.ref_mag_to_flux = [_lookupTable(f) for f in lim_sn.mag_to_flux]
+        # Cache of the SNR of fake observations.
+        self.fakesCacheSize = fakesCacheSize
+        self.fakes_cache = OrderedDict()
 
         self.display = False
 
@@ -207,15 +240,8 @@ class SNSNRMetric(metrics.BaseMetric):
 
         # Define MJDs to consider for metric estimation
         # basically: step of one day between MJDmin and MJDmax
-        dates = None
-
-        for val in self.info_season:
-            if dates is None:
-                dates = np.arange(
-                    val['MJD_min']+self.shift, val['MJD_max']+1., 1.)
-            else:
-                dates = np.concatenate(
-                    (dates, np.arange(val['MJD_min']+self.shift, val['MJD_max']+1., 1.)))
+        dates = np.concatenate([np.arange(val['MJD_min']+self.shift, val['MJD_max']+1., 1.)
+                                for val in self.info_season])
 
         # SN  DayMax: dates-shift where shift is chosen in the input yaml file
         T0_lc = dates-self.shift
@@ -229,32 +255,35 @@ class SNSNRMetric(metrics.BaseMetric):
         phase_max = self.shift/(1.+self.z)
         flag = (phase >= self.min_rf_phase) & (phase <= phase_max)
 
-        # tile m5, MJDs, and seasons to estimate all fluxes and SNR at once
-        m5_vals = np.tile(dataSlice[self.m5Col], (len(time_for_lc), 1))
-        season_vals = np.tile(dataSlice[self.seasonCol], (len(time_for_lc), 1))
+        # m5 and seasons broadcast against all the LC points, to estimate all fluxes and SNR at once
+        m5_vals = dataSlice[self.m5Col]
+        season_vals = dataSlice[self.seasonCol]
 
         # estimate fluxes and snr in SNR function
-        fluxes_tot, snr = self.snr(
+        fluxes_tot, snr_tab = self.snr(
             time_for_lc, m5_vals, flag, season_vals, T0_lc)
 
         # now save the results in a record array
-        _, idx = np.unique(snr['season'], return_inverse=True)
+        _, idx = np.unique(snr_tab['season'], return_inverse=True)
         infos = self.info_season[idx]
 
-        vars_info = ['cadence', 'season_length', 'MJD_min']
-        snr = rf.append_fields(
-            snr, vars_info, [infos[name] for name in vars_info])
-        snr = rf.append_fields(snr, 'DayMax', T0_lc)
-        snr = rf.append_fields(snr, 'MJD', dates)
-        snr = rf.append_fields(snr, 'm5_eff', np.mean(
-            np.ma.array(m5_vals, mask=~flag), axis=1))
-        global_info = [(fieldRA, fieldDec, band, m5,
-                        Nvisits, exptime)]*len(snr)
-        names = ['fieldRA', 'fieldDec', 'band',
-                 'm5', 'Nvisits', 'ExposureTime']
-        global_info = np.rec.fromrecords(global_info, names=names)
-        snr = rf.append_fields(
-            snr, names, [global_info[name] for name in names])
+        # mean m5 of the LC points passing the phase cut (nan if there are none)
+        nflag = np.sum(flag, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            m5_eff = np.sum(np.where(flag, m5_vals, 0.), axis=1) / nflag
+
+        columns = OrderedDict()
+        for name in snr_tab.dtype.names:
+            columns[name] = snr_tab[name]
+        for name in ['cadence', 'season_length', 'MJD_min']:
+            columns[name] = infos[name]
+        columns['DayMax'] = T0_lc
+        columns['MJD'] = dates
+        columns['m5_eff'] = m5_eff
+        for name, val in zip(['fieldRA', 'fieldDec', 'band', 'm5', 'Nvisits', 'ExposureTime'],
+                             [fieldRA, fieldDec, band, m5, Nvisits, exptime]):
+            columns[name] = np.repeat(val, len(dates))
+        snr = np.rec.fromarrays(list(columns.values()), names=list(columns.keys()))
 
         if output_q is not None:
             output_q.put({j: snr})
@@ -323,46 +352,25 @@ class SNSNRMetric(metrics.BaseMetric):
           season (float) : season num.
         """
 
-        seasons = np.ma.array(season_vals, mask=~flag)
-
         fluxes_tot = {}
-        snr_tab = None
+        columns = OrderedDict()
 
         for ib, name in enumerate(self.names_ref):
-            fluxes = self.lim_sn.fluxes[ib](time_lc)
+            fluxes = self.ref_fluxes[ib](time_lc)
             if name not in fluxes_tot.keys():
                 fluxes_tot[name] = fluxes
             else:
                 fluxes_tot[name] = np.concatenate((fluxes_tot[name], fluxes))
 
-            flux_5sigma = self.lim_sn.mag_to_flux[ib](m5_vals)
+            # the 5-sigma flux only depends on the observation, so evaluate it once per observation
+            flux_5sigma = self.ref_mag_to_flux[ib](m5_vals)
             snr = fluxes**2/flux_5sigma**2
-            snr_season = 5.*np.sqrt(np.sum(snr*flag, axis=1))
+            columns['SNR_'+name] = 5.*np.sqrt(np.sum(snr*flag, axis=1))
 
-            if snr_tab is None:
-                snr_tab = np.asarray(np.copy(snr_season), dtype=[
-                    ('SNR_'+name, 'f8')])
-            else:
-                snr_tab = rf.append_fields(
-                    snr_tab, 'SNR_'+name, np.copy(snr_season))
-            """    
-            snr_tab = rf.append_fields(
-                snr_tab, 'season', np.mean(seasons, axis=1))
-          """
-            snr_tab = rf.append_fields(
-                snr_tab, 'season', self.get_season(T0_lc))
-
-        # check if any masked value remaining
-        # this would correspond to case where no obs point has been selected
-        # ie no points with phase in [phase_min,phase_max]
-        # this happens when internight gaps are large (typically larger than shift)
-        idmask = np.where(snr_tab.mask)
-        if len(idmask) > 0:
-            tofill = np.copy(snr_tab['season'])
-            season_recover = self.get_season(
-                T0_lc[np.where(snr_tab.mask)])
-            tofill[idmask] = season_recover
-            snr_tab = np.ma.filled(snr_tab, fill_value=tofill)
+        # T0 values which do not fall within a season (no obs point selected, which happens when
+        # internight gaps are large) have an undefined (nan) season.
+        columns['season'] = np.ma.filled(self.get_season(T0_lc).astype(float), np.nan)
+        snr_tab = np.rec.fromarrays(list(columns.values()), names=list(columns.keys()))
 
         return fluxes_tot, snr_tab
 
@@ -406,18 +414,26 @@ class SNSNRMetric(metrics.BaseMetric):
 
         """
 
-        # generate fake observations
-        fake_obs = None
-
-        # idx = (dataSlice[self.seasonCol] == season)
         band = np.unique(dataSlice[self.filterCol])[0]
+        # The fakes only depend on these season parameters (and the band), so their SNR can be reused.
+        cols = ['season', 'cadence', 'MJD_min', 'season_length', 'Nvisits', 'm5']
+        key = (band, tuple(tuple(float(val[c]) for c in cols) for val in self.info_season))
+        if key in self.fakes_cache:
+            snr_fakes = self.fakes_cache.pop(key)
+            self.fakes_cache[key] = snr_fakes
+            snr_fakes = snr_fakes.copy()
+            snr_fakes['fieldRA'] = np.mean(dataSlice[self.RaCol])
+            snr_fakes['fieldDec'] = np.mean(dataSlice[self.DecCol])
+            return snr_fakes
+
+        # generate fake observations and estimate SNR vs MJD
         fake_obs = self.gen_fakes(dataSlice, band)
+        snr_fakes = self.snr_slice(fake_obs)
 
-        # estimate SNR vs MJD
-
-        snr_fakes = self.snr_slice(
-            fake_obs[fake_obs['filter'] == band])
-
+        if self.fakesCacheSize > 0:
+            self.fakes_cache[key] = snr_fakes.copy()
+            if len(self.fakes_cache) > self.fakesCacheSize:
+                self.fakes_cache.popitem(last=False)
         return snr_fakes
 
     def gen_fakes(self, slice_sel, band):
@@ -450,37 +466,33 @@ class SNSNRMetric(metrics.BaseMetric):
         fieldRA = np.mean(slice_sel[self.RaCol])
         fieldDec = np.mean(slice_sel[self.DecCol])
         Tvisit = 30.
+        Exposure_Time = 30.
 
-        fake_obs = None
+        # One fake observation every 'cadence' days over each season
+        # (as GenerateFakeObservations, for all seasons at once).
+        mjds = []
         for val in self.info_season:
-            cadence = val['cadence']
             mjd_min = val['MJD_min']
-            mjd_max = val['MJD_max']
-            season_length = val['season_length']
-            Nvisits = val['Nvisits']
-            m5 = val['m5']
-
-            # build the configuration file
-
-            config_fake = {}
-            config_fake['Ra'] = fieldRA
-            config_fake['Dec'] = fieldDec
-            config_fake['bands'] = [band]
-            config_fake['Cadence'] = [cadence]
-            config_fake['MJD_min'] = [mjd_min]
-            config_fake['season_length'] = season_length
-            config_fake['Nvisits'] = [Nvisits]
-            m5_nocoadd = m5-1.25*np.log10(float(Nvisits)*Tvisit/30.)
-            config_fake['m5'] = [m5_nocoadd]
-            config_fake['seasons'] = [val['season']]
-            config_fake['Exposure_Time'] = [30.]
-            config_fake['shift_days'] = 0.
-            fake_obs_season = GenerateFakeObservations(
-                config_fake).Observations
-            if fake_obs is None:
-                fake_obs = fake_obs_season
-            else:
-                fake_obs = np.concatenate((fake_obs, fake_obs_season))
+            mjd_max = mjd_min + val['season_length']
+            mjds.append(np.arange(mjd_min, mjd_max+val['cadence'], val['cadence']))
+        nfakes = [len(mjd) for mjd in mjds]
+        Nvisits = self.info_season['Nvisits'].astype(float)
+        m5_nocoadd = self.info_season['m5']-1.25*np.log10(Nvisits*Tvisit/30.)
+        m5_coadded = m5_nocoadd+1.25*np.log10(Nvisits*Exposure_Time/30.)
+
+        fake_obs = np.zeros(np.sum(nfakes), dtype=[(self.mjdCol, 'f8'), (self.RaCol, 'f8'),
+                                                     (self.DecCol, 'f8'), (self.filterCol, 'U1'),
+                                                     (self.m5Col, 'f8'), (self.nexpCol, 'f8'),
+                                                     (self.exptimeCol, 'f8'), (self.seasonCol, 'f8')])
+        fake_obs[self.mjdCol] = np.concatenate(mjds)
+        fake_obs[self.RaCol] = fieldRA
+        fake_obs[self.DecCol] = fieldDec
+        fake_obs[self.filterCol] = band
+        fake_obs[self.m5Col] = np.repeat(m5_coadded, nfakes)
+        fake_obs[self.nexpCol] = np.repeat(Nvisits, nfakes)
+        fake_obs[self.exptimeCol] = np.repeat(Nvisits*Exposure_Time, nfakes)
+        fake_obs[self.seasonCol] = np.repeat(self.info_season['season'], nfakes)
+        fake_obs.sort(order=self.mjdCol)
         return fake_obs
 
     def plot(self, snr_obs, snr_fakes):
@@ -636,17 +648,15 @@ class SNSNRMetric(metrics.BaseMetric):
             sel_fakes.sort(order='MJD')
             r = [ra, dec, season, band]
             names = [self.RaCol, self.DecCol, 'season', 'band']
+            mjd_min = np.max(
+                [np.min(sel_obs['MJD']), np.min(sel_fakes['MJD'])])
+            mjd_max = np.min(
+                [np.max(sel_obs['MJD']), np.max(sel_fakes['MJD'])])
+            mjd = np.arange(mjd_min, mjd_max, 1.)
             for sim in self.names_ref:
-                fakes = interpolate.interp1d(
-                    sel_fakes['MJD'], sel_fakes['SNR_'+sim])
-                obs = interpolate.interp1d(sel_obs['MJD'], sel_obs['SNR_'+sim])
-                mjd_min = np.max(
-                    [np.min(sel_obs['MJD']), np.min(sel_fakes['MJD'])])
-                mjd_max = np.min(
-                    [np.max(sel_obs['MJD']), np.max(sel_fakes['MJD'])])
-                mjd = np.arange(mjd_min, mjd_max, 1.)
-
-                diff_res = obs(mjd)-fakes(mjd)
+                # linear interpolation of the SNR (mjd is within the range of both)
+                diff_res = np.interp(mjd, sel_obs['MJD'], sel_obs['SNR_'+sim]) - \
+                    np.interp(mjd, sel_fakes['MJD'], sel_fakes['SNR_'+sim])
 
                 idx = diff_res >= 0
                 r += [len(diff_res[idx])/len(diff_res)]
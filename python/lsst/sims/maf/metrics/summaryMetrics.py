@@ -2,6 +2,7 @@ import numpy as np
 import healpy as hp
 from scipy import interpolate
 from .baseMetric import BaseMetric
+from .sliceContext import SliceContext
 
 # A collection of metrics which are primarily intended to be used as summary statistics.
 
@@ -34,6 +35,8 @@ class fONv(BaseMetric):
     metricName : str, opt
         Name of the summary metric. Default fONv.
     """
+    useSliceContext = True
+
     def __init__(self, col='metricdata', Asky=18000., nside=128, Nvisit=825,
                  norm=False, metricName='fONv',  **kwargs):
         """Asky = square degrees """
@@ -46,7 +49,7 @@ class fONv(BaseMetric):
         self.npix_Asky = np.int(np.ceil(self.Asky / self.scale))
         self.norm = norm
 
-    def run(self, dataSlice, slicePoint=None):
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
         result = np.empty(2, dtype=[('name', np.str_, 20), ('value', float)])
         result['name'][0] = "MedianNvis"
         result['name'][1] = "MinNvis"
@@ -57,8 +60,9 @@ class fONv(BaseMetric):
             result['value'][1] = self.badval
             return result
         # Otherwise, calculate median and mean Nvis:
-        name = dataSlice.dtype.names[0]
-        nvis_sorted = np.sort(dataSlice[name])
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        nvis_sorted = sliceContext.sortedCol(dataSlice.dtype.names[0])
         # Find the Asky's worth of healpixels with the largest # of visits.
         nvis_Asky = nvis_sorted[-self.npix_Asky:]
         result['value'][0] = np.median(nvis_Asky)
@@ -92,6 +96,8 @@ class fOArea(BaseMetric):
     metricName : str, opt
         Name of the summary metric. Default fOArea.
     """
+    useSliceContext = True
+
     def __init__(self, col='metricdata', Nvisit=825, Asky = 18000.0, nside=128,
                   norm=False, metricName='fOArea',  **kwargs):
         """Asky = square degrees """
@@ -102,9 +108,10 @@ class fOArea(BaseMetric):
         self.scale = hp.nside2pixarea(self.nside, degrees=True)
         self.norm = norm
 
-    def run(self, dataSlice, slicePoint=None):
-        name = dataSlice.dtype.names[0]
-        nvis_sorted = np.sort(dataSlice[name])
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        nvis_sorted = sliceContext.sortedCol(dataSlice.dtype.names[0])
         # Identify the healpixels with more than Nvisits.
         nvis_min = nvis_sorted[np.where(nvis_sorted >= self.Nvisit)]
         if len(nvis_min) == 0:
@@ -134,6 +141,8 @@ class TableFractionMetric(BaseMetric):
     12        1 < P
     Note the 1st and last elements do NOT obey the numpy histogram conventions.
     """
+    useSliceContext = True
+
     def __init__(self, col='metricdata',  nbins=10, maskVal=0.):
         """
         colname = the column name in the metric data (i.e. 'metricdata' usually).
@@ -142,16 +151,22 @@ class TableFractionMetric(BaseMetric):
         super(TableFractionMetric, self).__init__(col=col, maskVal=maskVal, metricDtype='float')
         self.nbins = nbins
 
-    def run(self, dataSlice, slicePoint=None):
-        # Calculate histogram of completeness values that fall between 0-1.
-        goodVals = np.where((dataSlice[self.colname] > 0) & (dataSlice[self.colname] < 1)  )
-        bins = np.arange(self.nbins+1.)/self.nbins
-        hist, b = np.histogram(dataSlice[self.colname][goodVals], bins=bins)
-        # Fill in values for exact 0, exact 1 and >1.
-        zero = np.size(np.where(dataSlice[self.colname] == 0)[0])
-        one = np.size(np.where(dataSlice[self.colname] == 1)[0])
-        overone = np.size(np.where(dataSlice[self.colname] > 1)[0])
-        hist = np.concatenate((np.array([zero]), hist, np.array([one]), np.array([overone])))
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        values = sliceContext.sortedValid(self.colname)
+        # Count the completeness values in each bin between 0-1 (as np.histogram, bins include their
+        # lower edge), as well as the values exactly 0, exactly 1 and >1, from the sorted values.
+        b = np.arange(self.nbins+1.)/self.nbins
+        edges = np.concatenate([np.searchsorted(values, [0, 1], side='left'),
+                                np.searchsorted(values, b, side='left'),
+                                np.searchsorted(values, [0, 1], side='right'), [len(values)]])
+        zeroStart, oneStart = edges[:2]
+        binEdges = edges[2:-3]
+        zeroEnd, oneEnd, end = edges[-3:]
+        binEdges[0] = zeroEnd
+        binEdges[-1] = oneStart
+        hist = np.concatenate([[zeroEnd - zeroStart], np.diff(binEdges), [oneEnd - oneStart], [end - oneEnd]])
         # Create labels for each value
         binNames = ['0 == P']
         binNames.append('0 < P < 0.1')
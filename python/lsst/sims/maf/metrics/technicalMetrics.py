@@ -1,6 +1,7 @@
 from builtins import zip
 import numpy as np
 from .baseMetric import BaseMetric
+from .sliceContext import SliceContext
 
 __all__ = ['NChangesMetric',
            'MinTimeBetweenStatesMetric', 'NStateChangesFasterThanMetric',
@@ -138,6 +139,8 @@ class TeffMetric(BaseMetric):
     """
     Effective time equivalent for a given set of visits.
     """
+    useSliceContext = True
+
     def __init__(self, m5Col='fiveSigmaDepth', filterCol='filter', metricName='tEff',
                  fiducialDepth=None, teffBase=30.0, normed=False, **kwargs):
         self.m5Col = m5Col
@@ -168,11 +171,11 @@ class TeffMetric(BaseMetric):
         if self.normed:
             self.comment += ' Normalized by the total amount of time actual on-sky.'
 
-    def run(self, dataSlice, slicePoint=None):
-        filters = np.unique(dataSlice[self.filterCol])
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
         teff = 0.0
-        for f in filters:
-            match = np.where(dataSlice[self.filterCol] == f)[0]
+        for f, match in sliceContext.filterGroups(self.filterCol).items():
             teff += (10.0**(0.8*(dataSlice[self.m5Col][match] - self.depth[f]))).sum()
         teff *= self.teffBase
         if self.normed:
@@ -287,6 +290,34 @@ class CompletenessMetric(BaseMetric):
         """
         return completeness[-1]
 
+    def _vectorReduceFilter(self, completeness, f):
+        """Return the completeness in filter f, at all slicePoints at once."""
+        if f in self.filters:
+            return np.vstack(completeness)[:, np.where(self.filters == f)[0][0]]
+        else:
+            return np.ones(len(completeness), float)
+
+    def vectorReduceu(self, completeness):
+        return self._vectorReduceFilter(completeness, 'u')
+
+    def vectorReduceg(self, completeness):
+        return self._vectorReduceFilter(completeness, 'g')
+
+    def vectorReducer(self, completeness):
+        return self._vectorReduceFilter(completeness, 'r')
+
+    def vectorReducei(self, completeness):
+        return self._vectorReduceFilter(completeness, 'i')
+
+    def vectorReducez(self, completeness):
+        return self._vectorReduceFilter(completeness, 'z')
+
+    def vectorReducey(self, completeness):
+        return self._vectorReduceFilter(completeness, 'y')
+
+    def vectorReduceJoint(self, completeness):
+        return np.vstack(completeness)[:, -1]
+
 
 class FilterColorsMetric(BaseMetric):
     """
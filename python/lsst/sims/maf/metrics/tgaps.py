@@ -1,9 +1,44 @@
 import numpy as np
 from .baseMetric import BaseMetric
+from .sliceContext import SliceContext
 
 __all__ = ['TgapsMetric', 'NightgapsMetric', 'NVisitsPerNightMetric', 'MaxGapMetric']
 
 
+def _countGapsBelow(values, edge, inclusive=False):
+    """Count the pairs (i < j) of sorted values with values[j] - values[i] < edge (or <= edge).
+
+    For each j, the gaps values[j] - values[i] decrease as i increases, so the pairs within the edge form
+    a contiguous range of i; its start is found with a (vectorized) binary search that evaluates the gaps
+    exactly as np.diff would, without creating all of the pairwise gaps.
+    """
+    upper = np.arange(values.size)
+    lower = np.zeros(values.size, int)
+    hi = upper.copy()
+    active = lower < hi
+    while np.any(active):
+        mid = (lower + hi) // 2
+        gaps = values - values[mid]
+        within = (gaps <= edge) if inclusive else (gaps < edge)
+        hi = np.where(active & within, mid, hi)
+        lower = np.where(active & ~within, mid + 1, lower)
+        active = lower < hi
+    return np.sum(upper - lower)
+
+
+def _histogramAllGaps(values, bins):
+    """Histogram the gaps between all pairs of sorted values, as np.histogram would,
+    but without creating the (n^2) array of all of the gaps.
+    """
+    if np.ndim(bins) == 0:
+        # Match the bins np.histogram would create, from the range of the gaps.
+        bins = np.histogram_bin_edges([np.min(np.diff(values)), values[-1] - values[0]], bins)
+    # Count the gaps below each bin edge (the last bin includes its upper edge).
+    below = np.array([_countGapsBelow(values, edge) for edge in bins[:-1]] +
+                     [_countGapsBelow(values, bins[-1], inclusive=True)])
+    return np.diff(below)
+
+
 class TgapsMetric(BaseMetric):
     """Histogram the times of the gaps between observations.
 
@@ -28,6 +63,7 @@ class TgapsMetric(BaseMetric):
     Returns a histogram at each slice point; these histograms can be combined and plotted using the
     'SummaryHistogram plotter'.
      """
+    useSliceContext = True
 
     def __init__(self, timesCol='observationStartMJD', allGaps=False, bins=np.arange(0, 120.0, 5.0)/60./24.,
                  units='days', **kwargs):
@@ -37,18 +73,17 @@ class TgapsMetric(BaseMetric):
         super(TgapsMetric, self).__init__(col=[self.timesCol], metricDtype='object', units=units, **kwargs)
         self.allGaps = allGaps
 
-    def run(self, dataSlice, slicePoint=None):
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
         if dataSlice.size < 2:
             return self.badval
-        times = np.sort(dataSlice[self.timesCol])
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        times = sliceContext.sortedCol(self.timesCol)
         if self.allGaps:
-            allDiffs = []
-            for i in np.arange(1,times.size,1):
-                allDiffs.append((times-np.roll(times,i))[i:])
-            dts = np.concatenate(allDiffs)
+            result = _histogramAllGaps(times, self.bins)
         else:
             dts = np.diff(times)
-        result, bins = np.histogram(dts, self.bins)
+            result, bins = np.histogram(dts, self.bins)
         return result
 
 
@@ -76,6 +111,7 @@ class NightgapsMetric(BaseMetric):
     Returns a histogram at each slice point; these histograms can be combined and plotted using the
     'SummaryHistogram plotter'.
      """
+    useSliceContext = True
 
     def __init__(self, nightCol='night', allGaps=False, bins=np.arange(0, 10, 1),
                  units='nights', **kwargs):
@@ -86,18 +122,20 @@ class NightgapsMetric(BaseMetric):
                                               units=units, **kwargs)
         self.allGaps = allGaps
 
-    def run(self, dataSlice, slicePoint=None):
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
         if dataSlice.size < 2:
             return self.badval
-        nights = np.sort(np.unique(dataSlice[self.nightCol]))
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        nights, counts = sliceContext.unique(self.nightCol)
         if self.allGaps:
-            allDiffs = []
-            for i in np.arange(1, nights.size,1):
-                allDiffs.append((nights-np.roll(nights,i))[i:])
-            dnights = np.concatenate(allDiffs)
+            if nights.size < 2:
+                # There are no gaps; this is what np.histogram would give for an empty array.
+                return np.histogram([], self.bins)[0]
+            result = _histogramAllGaps(nights, self.bins)
         else:
             dnights = np.diff(nights)
-        result, bins = np.histogram(dnights, self.bins)
+            result, bins = np.histogram(dnights, self.bins)
         return result
 
 
@@ -118,6 +156,7 @@ class NVisitsPerNightMetric(BaseMetric):
     Returns a histogram at each slice point; these histograms can be combined and plotted using the
     'SummaryHistogram plotter'.
      """
+    useSliceContext = True
 
     def __init__(self, nightCol='night', bins=np.arange(0, 10, 1), units='#', **kwargs):
         # Pass the same bins to the plotter.
@@ -126,8 +165,10 @@ class NVisitsPerNightMetric(BaseMetric):
         super(NVisitsPerNightMetric, self).__init__(col=[self.nightCol], metricDtype='object',
                                                     units=units, **kwargs)
 
-    def run(self, dataSlice, slicePoint=None):
-        n, counts = np.unique(dataSlice[self.nightCol], return_counts=True)
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        n, counts = sliceContext.unique(self.nightCol)
         result, bins = np.histogram(counts, self.bins)
         return result
 
@@ -136,14 +177,17 @@ class MaxGapMetric(BaseMetric):
     """Find the maximum gap in observations. Useful for making sure there is an image within the last year that would
     make a good template image.
     """
+    useSliceContext = True
 
     def __init__(self, mjdCol='observationStartMJD', **kwargs):
         self.mjdCol = mjdCol
         units = 'Days'
         super(MaxGapMetric, self).__init__(col=[self.mjdCol], units=units, **kwargs)
 
-    def run(self, dataSlice, slicePoint=None):
-        gaps = np.diff(np.sort(dataSlice[self.mjdCol]))
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        gaps = np.diff(sliceContext.sortedCol(self.mjdCol))
         if np.size(gaps) > 0:
             result = np.max(gaps)
         else:
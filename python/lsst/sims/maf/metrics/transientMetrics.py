@@ -1,8 +1,8 @@
-from builtins import zip
 import numpy as np
 from .baseMetric import BaseMetric
+from .sliceContext import SliceContext
 
-__all__ = ['TransientMetric']
+__all__ = ['TransientMetric', 'MultiTransientMetric']
 
 class TransientMetric(BaseMetric):
     """
@@ -68,6 +68,7 @@ class TransientMetric(BaseMetric):
         'partialLC', then the max number of possible transients is taken to be
         the integer floor
     """
+    useSliceContext = True
     def __init__(self, metricName='TransientDetectMetric', mjdCol='observationStartMJD',
                  m5Col='fiveSigmaDepth', filterCol='filter',
                  transDuration=10., peakTime=5., riseSlope=0., declineSlope=0.,
@@ -102,7 +103,8 @@ class TransientMetric(BaseMetric):
         Parameters
         ----------
         time : numpy.ndarray
-            The times of the observations.
+            The times of the observations (relative to the start of the light curve).
+            May be 2-dimensional (phase shift, visit), in which case filters applies along the last axis.
         filters : numpy.ndarray
             The filters of the observations.
 
@@ -111,31 +113,38 @@ class TransientMetric(BaseMetric):
         numpy.ndarray
             The magnitudes of the object at each time, in each filter.
         """
-        lcMags = np.zeros(time.size, dtype=float)
-        rise = np.where(time <= self.peakTime)
-        lcMags[rise] += self.riseSlope * time[rise] - self.riseSlope * self.peakTime
-        decline = np.where(time > self.peakTime)
-        lcMags[decline] += self.declineSlope * (time[decline] - self.peakTime)
+        lcMags = np.where(time <= self.peakTime,
+                          self.riseSlope * time - self.riseSlope * self.peakTime,
+                          self.declineSlope * (time - self.peakTime))
+        peakMags = np.zeros(np.shape(filters)[-1], dtype=float)
         for key in self.peaks:
-            fMatch = np.where(filters == key)
-            lcMags[fMatch] += self.peaks[key]
+            peakMags[np.where(filters == key)] = self.peaks[key]
+        lcMags += peakMags
         return lcMags
 
-    def run(self, dataSlice, slicePoint=None):
-        """"
-        Calculate the detectability of a transient with the specified lightcurve.
+    def detectedFraction(self, mjd, m5, filters, surveyStart=None):
+        """
+        Calculate the fraction of transients detected, for visits sorted in time.
+
+        All phase shifts are evaluated at once, as (phase shift, visit) arrays, and the per-light curve
+        checks are done with reductions over the (contiguous) visits in each light curve.
 
         Parameters
         ----------
-        dataSlice : numpy.array
-            Numpy structured array containing the data related to the visits provided by the slicer.
-        slicePoint : dict, optional
-            Dictionary containing information about the slicepoint currently active in the slicer.
+        mjd : numpy.ndarray
+            The times of the visits, sorted in increasing order.
+        m5 : numpy.ndarray
+            The five sigma limiting magnitudes of the visits.
+        filters : numpy.ndarray
+            The filters of the visits.
+        surveyStart : float, optional
+            MJD for the survey start date. Default None uses self.surveyStart, or the first visit if
+            that is also None.
 
         Returns
         -------
         float
-            The total number of transients that could be detected.
+            The fraction of transients that could be detected.
         """
         # Total number of transients that could go off back-to-back
         if self.countMethod == 'partialLC':
@@ -143,79 +152,134 @@ class TransientMetric(BaseMetric):
         else:
             _nTransMax = np.floor(self.surveyDuration / (self.transDuration / 365.25))
         tshifts = np.arange(self.nPhaseCheck) * self.transDuration / float(self.nPhaseCheck)
-        nDetected = 0
-        nTransMax = 0
-        for tshift in tshifts:
-            # Compute the total number of back-to-back transients are possible to detect
-            # given the survey duration and the transient duration.
-            nTransMax += _nTransMax
-            if tshift != 0:
-                nTransMax -= 1
-            if self.surveyStart is None:
-                surveyStart = dataSlice[self.mjdCol].min()
-            time = (dataSlice[self.mjdCol] - surveyStart + tshift) % self.transDuration
-
-            # Which lightcurve does each point belong to
-            lcNumber = np.floor((dataSlice[self.mjdCol] - surveyStart) / self.transDuration)
-
-            lcMags = self.lightCurve(time, dataSlice[self.filterCol])
-
-            # How many criteria needs to be passed
-            detectThresh = 0
-
-            # Flag points that are above the SNR limit
-            detected = np.zeros(dataSlice.size, dtype=int)
-            detected[np.where(lcMags < dataSlice[self.m5Col] + self.detectM5Plus)] += 1
+        # Each phase shift (except the first, with no shift) loses one transient.
+        nTransMax = _nTransMax * len(tshifts) - np.sum(tshifts != 0)
+        if surveyStart is None:
+            surveyStart = self.surveyStart
+        if surveyStart is None:
+            surveyStart = mjd[0]
+        # Which lightcurve does each point belong to (this does not change with the phase shift).
+        lcNumber = np.floor((mjd - surveyStart) / self.transDuration)
+        # The visits are sorted, so each light curve is a contiguous block of visits, starting at lcStart.
+        lcStart = np.concatenate([[0], np.where(np.diff(lcNumber) != 0)[0] + 1])
+        lcIdx = np.cumsum(np.concatenate([[0], np.diff(lcNumber) != 0]))
+        # Time within the light curve, for each (phase shift, visit).
+        time = (mjd - surveyStart + tshifts[:, np.newaxis]) % self.transDuration
+        lcMags = self.lightCurve(time, filters)
+
+        # Flag points that are above the SNR limit
+        detected = lcMags < m5 + self.detectM5Plus
+        # How many criteria need to be passed (and how many each light curve passed, beyond detection).
+        detectThresh = 1
+        lcPassed = np.zeros((len(tshifts), len(lcStart)), int)
+
+        # If we demand points on the rise
+        if self.nPrePeak > 0:
             detectThresh += 1
+            nPrePeak = np.add.reduceat((detected & (time < self.peakTime)).astype(int), lcStart, axis=1)
+            lcPassed += (nPrePeak >= self.nPrePeak)
 
-            # If we demand points on the rise
-            if self.nPrePeak > 0:
-                detectThresh += 1
-                ord = np.argsort(dataSlice[self.mjdCol])
-                dataSlice = dataSlice[ord]
-                detected = detected[ord]
-                lcNumber = lcNumber[ord]
-                time = time[ord]
-                ulcNumber = np.unique(lcNumber)
-                left = np.searchsorted(lcNumber, ulcNumber)
-                right = np.searchsorted(lcNumber, ulcNumber, side='right')
-                # Note here I'm using np.searchsorted to basically do a 'group by'
-                # might be clearer to use scipy.ndimage.measurements.find_objects or pandas, but
-                # this numpy function is known for being efficient.
-                for le, ri in zip(left, right):
-                    # Number of points where there are a detection
-                    good = np.where(time[le:ri] < self.peakTime)
-                    nd = np.sum(detected[le:ri][good])
-                    if nd >= self.nPrePeak:
-                        detected[le:ri] += 1
-
-            # Check if we need multiple points per light curve or multiple filters
-            if (self.nPerLC > 1) | (self.nFilters > 1):
-                # make sure things are sorted by time
-                ord = np.argsort(dataSlice[self.mjdCol])
-                dataSlice = dataSlice[ord]
-                detected = detected[ord]
-                lcNumber = lcNumber[ord]
-                time = time[ord]
-                ulcNumber = np.unique(lcNumber)
-                left = np.searchsorted(lcNumber, ulcNumber)
-                right = np.searchsorted(lcNumber, ulcNumber, side='right')
-                detectThresh += self.nFilters
-
-                for le, ri in zip(left, right):
-                    points = np.where(detected[le:ri] > 0)
-                    ufilters = np.unique(dataSlice[self.filterCol][le:ri][points])
-                    phaseSections = np.floor(time[le:ri][points] / self.transDuration * self.nPerLC)
-                    for filtName in ufilters:
-                        good = np.where(dataSlice[self.filterCol][le:ri][points] == filtName)
-                        if np.size(np.unique(phaseSections[good])) >= self.nPerLC:
-                            detected[le:ri] += 1
-
-            # Find the unique number of light curves that passed the required number of conditions
-            nDetected += np.size(np.unique(lcNumber[np.where(detected >= detectThresh)]))
-
-        # Rather than keeping a single "detected" variable, maybe make a mask for each criteria, then
-        # reduce functions like: reduce_singleDetect, reduce_NDetect, reduce_PerLC, reduce_perFilter.
-        # The way I'm running now it would speed things up.
+        # Check if we need multiple points per light curve or multiple filters
+        if (self.nPerLC > 1) | (self.nFilters > 1):
+            detectThresh += self.nFilters
+            # Points count here if detected, or if their light curve passed the pre-peak check.
+            points = (detected + lcPassed[:, lcIdx]) > 0
+            ufilters, filterIdx = np.unique(filters, return_inverse=True)
+            phaseSections = np.floor(time / self.transDuration * self.nPerLC).astype(int)
+            phaseSections = np.clip(phaseSections, 0, self.nPerLC - 1)
+            # Record which light curve phase sections were sampled, in each filter.
+            sampled = np.zeros((len(tshifts), len(lcStart), len(ufilters), self.nPerLC), bool)
+            phaseIdx, visitIdx = np.where(points)
+            sampled[phaseIdx, lcIdx[visitIdx], filterIdx[visitIdx], phaseSections[phaseIdx, visitIdx]] = True
+            lcPassed += np.sum(sampled.sum(axis=-1) >= self.nPerLC, axis=-1)
 
+        # Find the number of light curves that passed the required number of conditions
+        maxScore = np.maximum.reduceat(detected.astype(int), lcStart, axis=1) + lcPassed
+        nDetected = np.sum(maxScore >= detectThresh)
         return float(nDetected) / nTransMax
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        """"
+        Calculate the detectability of a transient with the specified lightcurve.
+
+        Parameters
+        ----------
+        dataSlice : numpy.array
+            Numpy structured array containing the data related to the visits provided by the slicer.
+        slicePoint : dict, optional
+            Dictionary containing information about the slicepoint currently active in the slicer.
+        sliceContext : SliceContext, optional
+            Cached preprocessing of the dataSlice, shared with other metrics.
+
+        Returns
+        -------
+        float
+            The total number of transients that could be detected.
+        """
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        order = sliceContext.sortOrder(self.mjdCol)
+        return self.detectedFraction(dataSlice[self.mjdCol][order], dataSlice[self.m5Col][order],
+                                     dataSlice[self.filterCol][order])
+
+
+class TransientFractionReducer(object):
+    """Helper object to return a single transient parameter set's value as a reduce function result.
+    """
+    def __init__(self, index, name):
+        self.index = index
+        # The reduce bundle name (and reduceFuncs key) is __name__ without its 'reduce' prefix,
+        # so any parameter set name (even one containing 'reduce') is kept unchanged.
+        self.__name__ = 'reduce' + name
+
+    def __call__(self, metricValue):
+        return metricValue[self.index]
+
+
+class MultiTransientMetric(BaseMetric):
+    """
+    Calculate what fraction of transients would be detected, for a table of transient parameters.
+
+    Each set of transient parameters is evaluated as by TransientMetric, but the dataSlice is only
+    sorted (and passed through the metric) once for all sets.
+    The metric value is the array of detected fractions, and a reduce function is set up for each
+    parameter set (so each can be plotted and summarized as TransientMetric).
+
+    Parameters
+    ----------
+    transientParams : list of dict or pandas.DataFrame
+        The transient parameter sets. Each row or dictionary contains keyword arguments for
+        TransientMetric (transDuration, peakTime, riseSlope, declineSlope, [u-y]Peak, surveyDuration,
+        surveyStart, detectM5Plus, nPrePeak, nPerLC, nFilters, nPhaseCheck, countMethod),
+        plus an optional 'name' used for its reduce function (default Transient_[index]).
+    """
+    useSliceContext = True
+    def __init__(self, transientParams, metricName='MultiTransientMetric',
+                 mjdCol='observationStartMJD', m5Col='fiveSigmaDepth', filterCol='filter', **kwargs):
+        self.mjdCol = mjdCol
+        self.m5Col = m5Col
+        self.filterCol = filterCol
+        if hasattr(transientParams, 'to_dict'):
+            transientParams = transientParams.to_dict('records')
+        self.transients = []
+        names = []
+        for i, params in enumerate(transientParams):
+            params = dict(params)
+            names.append(str(params.pop('name', 'Transient_%d' % i)))
+            self.transients.append(TransientMetric(mjdCol=self.mjdCol, m5Col=self.m5Col,
+                                                   filterCol=self.filterCol, **params))
+        super(MultiTransientMetric, self).__init__(col=[self.mjdCol, self.m5Col, self.filterCol],
+                                                   units='Fraction Detected', metricDtype='object',
+                                                   metricName=metricName, **kwargs)
+        for i, name in enumerate(names):
+            self.reduceFuncs[name] = TransientFractionReducer(i, name)
+            self.reduceOrder[name] = i
+
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        order = sliceContext.sortOrder(self.mjdCol)
+        mjd = sliceContext.sortedCol(self.mjdCol)
+        m5 = dataSlice[self.m5Col][order]
+        filters = dataSlice[self.filterCol][order]
+        return np.array([t.detectedFraction(mjd, m5, filters) for t in self.transients])
@@ -1,4 +1,3 @@
-from builtins import zip
 # Example of more complex metric
 # Takes multiple columns of data (although 'night' could be calculable from 'expmjd')
 # Returns variable length array of data
@@ -6,6 +5,7 @@ from builtins import zip
 
 import numpy as np
 from .baseMetric import BaseMetric
+from .sliceContext import SliceContext
 
 __all__ = ['VisitGroupsMetric', 'PairFractionMetric']
 
@@ -61,6 +61,8 @@ class PairFractionMetric(BaseMetric):
 
 class VisitGroupsMetric(BaseMetric):
     """Count the number of visits per night within deltaTmin and deltaTmax."""
+    useSliceContext = True
+
     def __init__(self, timeCol='observationStartMJD', nightsCol='night', metricName='VisitGroups',
                  deltaTmin=15.0/60.0/24.0, deltaTmax=90.0/60.0/24.0, minNVisits=2, window=30, minNNights=3,
                  **kwargs):
@@ -109,7 +111,7 @@ class VisitGroupsMetric(BaseMetric):
         self.comment += 'VisitGroups_MaxSeqLunations calculates the maximum sequential lunations that have '
         self.comment += 'at least one "group". <br>'
 
-    def run(self, dataSlice, slicePoint=None):
+    def run(self, dataSlice, slicePoint=None, sliceContext=None):
         """
         Return a dictionary of:
         the number of visits within a night (within delta tmin/tmax of another visit),
@@ -122,48 +124,42 @@ class VisitGroupsMetric(BaseMetric):
         than deltaTmin, the two would be counted as 1.5 visits together (if only 1 and 2 existed,
         then there would be 0 visits as none would be within the qualifying time interval).
         """
-        uniquenights = np.unique(dataSlice[self.nights])
-        nights = []
-        visitNum = []
-        # Find the nights with visits within deltaTmin/max of one another and count the number of visits
-        for n in uniquenights:
-            condition = (dataSlice[self.nights] == n)
-            times = np.sort(dataSlice[self.times][condition])
-            nvisits = 0
-            ntooclose = 0
-            # Calculate difference between each visit and time of previous visit (tnext- tnow)
-            timediff = np.diff(times)
-            timegood = np.where((timediff <= self.deltaTmax) & (timediff >= self.deltaTmin), True, False)
-            timetooclose = np.where(timediff < self.deltaTmin, True, False)
-            if len(timegood)>1:
-                # Count visits for all but last index in timediff
-                for tg1, ttc1, tg2, ttc2 in zip(timegood[:-1], timetooclose[:-1], timegood[1:], timetooclose[1:]):
-                    if tg1:
-                        nvisits += 1
-                        if not tg2:
-                            nvisits += 1
-                    if ttc1:
-                        ntooclose += 1
-                        if not tg2 and not ttc2:
-                            ntooclose += 1
-                # Take care of last timediff
-                if timegood[-1]:
-                    nvisits += 2 #close out visit sequence
-                if timetooclose[-1]:
-                    ntooclose += 1
-                    if not timegood[-2] and not timetooclose[-2]:
-                        ntooclose += 1
-            else:
-                if timegood:
-                    nvisits += 2
-            # Count up all visits for night.
-            if nvisits > 0:
-                nvisits = nvisits + ntooclose/2.0
-                visitNum.append(nvisits)
-                nights.append(n)
-        # Convert to numpy arrays.
-        visitNum = np.array(visitNum)
-        nights = np.array(nights)
+        if sliceContext is None:
+            sliceContext = SliceContext(dataSlice)
+        order, uniquenights, nightBounds = sliceContext.nightSegments(self.times, self.nights)
+        times = dataSlice[self.times][order]
+        nightIdx = np.repeat(np.arange(len(uniquenights)), np.diff(nightBounds))
+        # Calculate difference between each visit and time of next visit (tnext - tnow), within each night.
+        timediff = np.diff(times)
+        sameNight = nightIdx[1:] == nightIdx[:-1]
+        timegood = sameNight & (timediff <= self.deltaTmax) & (timediff >= self.deltaTmin)
+        timetooclose = sameNight & (timediff < self.deltaTmin)
+        # Is there a following (or preceding) timediff within the same night, and does it qualify?
+        pad = np.array([False])
+        sameNightPad = np.concatenate([pad, sameNight, pad])
+        goodPad = np.concatenate([pad, timegood, pad])
+        closePad = np.concatenate([pad, timetooclose, pad])
+        hasNext = sameNight & sameNightPad[2:]
+        hasPrev = sameNight & sameNightPad[:-2]
+        goodNext = goodPad[2:] & hasNext
+        closeNext = closePad[2:] & hasNext
+        goodPrev = goodPad[:-2] & hasPrev
+        closePrev = closePad[:-2] & hasPrev
+        # Visits in a qualifying interval count once, and close out the sequence if the next interval
+        # does not also qualify.
+        nvisits = timegood * (1 + ~goodNext)
+        # Visits too close together count (as half visits), and close out their sequence if the next interval
+        # does not qualify at all (the last interval in a night looks back instead, and is not counted
+        # at all if it was the only interval in the night).
+        ntooclose = np.where(hasNext, timetooclose * (1 + (~goodNext & ~closeNext)),
+                             timetooclose * hasPrev * (1 + (~goodPrev & ~closePrev)))
+        # Count up all visits for each night.
+        diffNight = nightIdx[:-1][sameNight]
+        nvisits = np.bincount(diffNight, weights=nvisits[sameNight], minlength=len(uniquenights))
+        ntooclose = np.bincount(diffNight, weights=ntooclose[sameNight], minlength=len(uniquenights))
+        good = nvisits > 0
+        visitNum = nvisits[good] + ntooclose[good]/2.0
+        nights = uniquenights[good]
         metricval = {'visits':visitNum, 'nights':nights}
         if len(visitNum) == 0:
             return self.badval
@@ -178,81 +174,63 @@ class VisitGroupsMetric(BaseMetric):
         condition = (metricval['visits'] >= self.minNVisits)
         return len(metricval['visits'][condition])
 
-    def _inWindow(self, visits, nights, night, window, minNVisits):
-        condition = ((nights >= night) & (nights < night+window))
-        condition2 = (visits[condition] >= minNVisits)
-        return visits[condition][condition2], nights[condition][condition2]
+    def _inWindow(self, visits, nights, windowStart, windowEnd):
+        """For each window (windowStart <= night < windowEnd), find the number of nights with at least
+        minNVisits visits and the total number of visits on those nights."""
+        condition = (visits >= self.minNVisits)
+        goodNights = nights[condition]
+        cumVisits = np.concatenate([[0], np.cumsum(visits[condition])])
+        left = np.searchsorted(goodNights, windowStart)
+        right = np.searchsorted(goodNights, windowEnd)
+        return cumVisits[right] - cumVisits[left], right - left
 
     def reduceNVisitsInWindow(self, metricval):
         """Reduce to max number of total visits on all nights with more than minNVisits,
         within any 'window' (default=30 nights)."""
-        maxnvisits = 0
-        for n in metricval['nights']:
-            vw, nw = self._inWindow(metricval['visits'], metricval['nights'], n, self.window, self.minNVisits)
-            maxnvisits = max((vw.sum(), maxnvisits))
-        return maxnvisits
+        nights = metricval['nights']
+        nvisits, nnights = self._inWindow(metricval['visits'], nights, nights, nights + self.window)
+        return max(np.max(nvisits), 0)
 
     def reduceNNightsInWindow(self, metricval):
         """Reduce to max number of nights with more than minNVisits, within 'window' over all windows."""
-        maxnights = 0
-        for n in metricval['nights']:
-            vw, nw = self._inWindow(metricval['visits'], metricval['nights'], n, self.window, self.minNVisits)
-            maxnights = max(len(nw), maxnights)
-        return maxnights
+        nights = metricval['nights']
+        nvisits, nnights = self._inWindow(metricval['visits'], nights, nights, nights + self.window)
+        return max(np.max(nnights), 0)
 
-    def _inLunation(self, visits, nights, lunationStart, lunationLength):
-        condition = ((nights >= lunationStart) & (nights < lunationStart+lunationLength))
-        return visits[condition], nights[condition]
+    def _lunationGroups(self, metricval):
+        """Find which lunations (unique 30 day windows) contain at least one 'group', and whether the
+        first night in the lunation starts a group."""
+        lunationLength = 30
+        nights = metricval['nights']
+        lunations = np.arange(nights[0], nights[-1]+lunationLength/2.0, lunationLength)
+        lunationIdx = np.searchsorted(lunations, nights, side='right') - 1
+        # Windows starting at each night, but only within the lunation of that night.
+        windowEnd = np.minimum(nights + self.window, lunations[lunationIdx] + lunationLength)
+        nvisits, nnights = self._inWindow(metricval['visits'], nights, nights, windowEnd)
+        inGroup = nnights >= self.minNNights
+        hasGroup = np.bincount(lunationIdx[inGroup], minlength=len(lunations)) > 0
+        firstNight = np.searchsorted(lunationIdx, np.arange(len(lunations)))
+        firstInGroup = np.zeros(len(lunations), bool)
+        hasNights = firstNight < len(nights)
+        hasNights[hasNights] = lunationIdx[firstNight[hasNights]] == np.arange(len(lunations))[hasNights]
+        firstInGroup[hasNights] = inGroup[firstNight[hasNights]]
+        return hasGroup, firstInGroup
 
     def reduceNLunations(self, metricval):
         """Reduce to number of lunations (unique 30 day windows) that contain at least one 'group':
         a set of more than minNVisits per night, with more than minNNights of visits within 'window' time period.
         """
-        lunationLength = 30
-        lunations = np.arange(metricval['nights'][0], metricval['nights'][-1]+lunationLength/2.0, lunationLength)
-        nLunations = 0
-        for l in lunations:
-            # Find visits within lunation.
-            vl, nl = self._inLunation(metricval['visits'], metricval['nights'], l, lunationLength)
-            for n in nl:
-                # Find visits which are in groups within the lunation.
-                vw, nw = self._inWindow(vl, nl, n, self.window, self.minNVisits)
-                if len(nw) >= self.minNNights:
-                    nLunations += 1
-                    break
-        return nLunations
+        hasGroup, firstInGroup = self._lunationGroups(metricval)
+        return int(np.sum(hasGroup))
 
     def reduceMaxSeqLunations(self, metricval):
         """Count the max number of sequential lunations (unique 30 day windows) that contain at least one 'group':
         a set of more than minNVisits per night, with more than minNNights of visits within 'window' time period.
         """
-        lunationLength = 30
-        lunations = np.arange(metricval['nights'][0], metricval['nights'][-1]+lunationLength/2.0, lunationLength)
-        maxSequence = 0
-        curSequence = 0
-        inSeq = False
-        for l in lunations:
-            # Find visits within lunation.
-            vl, nl = self._inLunation(metricval['visits'], metricval['nights'], l, lunationLength)
-            # If no visits this lunation:
-            if len(vl) == 0:
-                inSeq = False
-                maxSequence = max(maxSequence, curSequence)
-                curSequence = 0
-            # Else, look to see if groups can be made from the visits.
-            for n in nl:
-                # Find visits which are in groups within the lunation.
-                vw, nw = self._inWindow(vl, nl, n, self.window, self.minNVisits)
-                # If there was a group within this lunation:
-                if len(nw) >= self.minNNights:
-                    curSequence += 1
-                    inSeq = True
-                    break
-                # Otherwise we're not in a sequence (anymore, or still).
-                else:
-                    inSeq = False
-                    maxSequence = max(maxSequence, curSequence)
-                    curSequence = 0
-        # Pick up last sequence if were in a sequence at last lunation.
-        maxSequence = max(maxSequence, curSequence)
-        return maxSequence
+        hasGroup, firstInGroup = self._lunationGroups(metricval)
+        # A lunation continues a sequence only if its first night starts a group; a lunation with a group
+        # starting on a later night begins a new sequence, and a lunation without a group ends the sequence.
+        idx = np.arange(len(hasGroup))
+        lastBreak = np.maximum.accumulate(np.where(firstInGroup, -1, idx))
+        curSequence = np.where(lastBreak < 0, idx + 1, idx - lastBreak + hasGroup[np.maximum(lastBreak, 0)])
+        return int(max(np.max(curSequence), 0))
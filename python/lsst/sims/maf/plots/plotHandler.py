@@ -2,9 +2,15 @@ from builtins import zip
 from builtins import range
 from builtins import object
 import os
+import json
+import hashlib
+import numbers
 import numpy as np
+import numpy.ma as ma
 import warnings
 import matplotlib.pyplot as plt
+from matplotlib.artist import Artist
+from matplotlib.colors import Colormap
 import lsst.sims.maf.utils as utils
 
 __all__ = ['applyZPNorm', 'PlotHandler', 'BasePlotter']
@@ -19,6 +25,49 @@ def applyZPNorm(metricValue, plotDict):
     return metricValue
 
 
+class _Unhashable(Exception):
+    pass
+
+
+def _hashUpdate(h, value):
+    """Add a stable representation of value (plotDict items, metric values ..) to the hash h.
+
+    Raises _Unhashable if value does not have a representation which is the same between sessions.
+    """
+    if isinstance(value, dict):
+        h.update(b'{')
+        for k in sorted(value, key=str):
+            h.update(str(k).encode('utf-8') + b':')
+            _hashUpdate(h, value[k])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'(')
+        for v in value:
+            _hashUpdate(h, v)
+        h.update(b')')
+    elif isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            _hashUpdate(h, value.tolist())
+        else:
+            h.update(('%s%s' % (value.dtype.str, value.shape)).encode('utf-8'))
+            h.update(np.ascontiguousarray(value).view(np.uint8))
+    elif isinstance(value, (str, bytes, numbers.Number, np.generic)) or value is None:
+        h.update(repr(value).encode('utf-8') + b';')
+    elif isinstance(value, BasePlotter):
+        _hashUpdate(h, type(value))
+        _hashUpdate(h, {k: v for k, v in vars(value).items() if not isinstance(v, Artist)})
+    elif isinstance(value, Colormap):
+        h.update(('Colormap %s %d;' % (value.name, value.N)).encode('utf-8'))
+    elif hasattr(value, '__qualname__'):
+        # Functions and classes.
+        h.update(('%s.%s;' % (getattr(value, '__module__', ''), value.__qualname__)).encode('utf-8'))
+    else:
+        r = repr(value)
+        if ' at 0x' in r:
+            raise _Unhashable(r)
+        h.update(r.encode('utf-8') + b';')
+
+
 class BasePlotter(object):
     """
     Serve as the base type for MAF plotters and example of API.
@@ -34,9 +83,34 @@ class BasePlotter(object):
 
 
 class PlotHandler(object):
+    """Make, save and record the plots of one or more MetricBundles.
+
+    Parameters
+    ----------
+    outDir : str, opt
+        Directory for the saved figures. Default '.'.
+    resultsDb : lsst.sims.maf.db.ResultsDb, opt
+        ResultsDb to record the saved figures in. Default None.
+    savefig : bool, opt
+        Save the figures to disk. Default True.
+    figformat : str, opt
+        Matplotlib figure format. Default pdf.
+    dpi : int, opt
+        DPI of the saved figures. Default 600.
+    thumbnail : bool, opt
+        Also save a png thumbnail of each figure. Default True.
+    trimWhitespace : bool, opt
+        Trim the whitespace around the saved figures. Default True.
+    plotCache : bool, opt
+        If True, keep a hash of everything which goes into each saved figure (the metric values,
+        slicePoints, plotDict, plotter and figure format) in a manifest in outDir (plotCache.json),
+        and skip remaking a figure when it and its thumbnail are on disk with the same hash.
+        The manifest is written by writePlotCache. Default False.
+    """
+    plotCacheFile = 'plotCache.json'
 
     def __init__(self, outDir='.', resultsDb=None, savefig=True,
-                 figformat='pdf', dpi=600, thumbnail=True, trimWhitespace=True):
+                 figformat='pdf', dpi=600, thumbnail=True, trimWhitespace=True, plotCache=False):
         self.outDir = outDir
         self.resultsDb = resultsDb
         self.savefig = savefig
@@ -44,6 +118,12 @@ class PlotHandler(object):
         self.dpi = dpi
         self.trimWhitespace = trimWhitespace
         self.thumbnail = thumbnail
+        # Information about each saved figure, as recorded in the resultsDb.
+        self.savedFigs = []
+        self.plotCache = plotCache
+        self.plotHashes = {}
+        if self.plotCache:
+            self.plotHashes = self._readPlotCache()
         self.filtercolors = {'u': 'cyan', 'g': 'g', 'r': 'y',
                              'i': 'r', 'z': 'm', 'y': 'k', ' ': None}
         self.filterorder = {' ': -1, 'u': 0, 'g': 1, 'r': 2, 'i': 3, 'z': 4, 'y': 5}
@@ -528,6 +608,17 @@ class PlotHandler(object):
         plotType = plotFunc.plotType
         if len(self.mBundles) > 1:
             plotType = 'Combo' + plotType
+        # Skip making the plot if it is already on disk, made from the same values.
+        plotHash = None
+        if self.savefig and self.plotCache:
+            plotHash = self._plotHash(plotFunc)
+            if self._isCached(outfile, plotType, plotHash):
+                if displayDict is None:
+                    displayDict = self._buildDisplayDict()
+                self._recordFig(outfile + '_' + plotType + '.' + self.figformat, plotType,
+                                self.jointMetricNames, self.slicer.slicerName, self.jointRunNames,
+                                self.constraints, self.jointMetadata, displayDict, plotHash)
+                return None
         # Make plot.
         fignum = None
         for mB, plotDict in zip(self.mBundles, self.plotDicts):
@@ -558,27 +649,125 @@ class PlotHandler(object):
             if displayDict is None:
                 displayDict = self._buildDisplayDict()
             self.saveFig(fignum, outfile, plotType, self.jointMetricNames, self.slicer.slicerName,
-                         self.jointRunNames, self.constraints, self.jointMetadata, displayDict)
+                         self.jointRunNames, self.constraints, self.jointMetadata, displayDict,
+                         plotHash=plotHash)
         return fignum
 
     def saveFig(self, fignum, outfileRoot, plotType, metricName, slicerName,
-                runName, constraint, metadata, displayDict=None):
+                runName, constraint, metadata, displayDict=None, plotHash=None):
         fig = plt.figure(fignum)
         plotFile = outfileRoot + '_' + plotType + '.' + self.figformat
         if self.trimWhitespace:
-            fig.savefig(os.path.join(self.outDir, plotFile), figformat=self.figformat, dpi=self.dpi,
+            fig.savefig(os.path.join(self.outDir, plotFile), format=self.figformat, dpi=self.dpi,
                         bbox_inches='tight')
         else:
-            fig.savefig(os.path.join(self.outDir, plotFile), figformat=self.figformat, dpi=self.dpi)
+            fig.savefig(os.path.join(self.outDir, plotFile), format=self.figformat, dpi=self.dpi)
         # Generate a png thumbnail.
         if self.thumbnail:
             thumbFile = 'thumb.' + outfileRoot + '_' + plotType + '.png'
             plt.savefig(os.path.join(self.outDir, thumbFile), dpi=72, bbox_inches='tight')
         # Save information about the file to resultsDb.
+        self._recordFig(plotFile, plotType, metricName, slicerName, runName, constraint, metadata,
+                        displayDict, plotHash)
+
+    def _recordFig(self, plotFile, plotType, metricName, slicerName, runName, constraint, metadata,
+                   displayDict=None, plotHash=None):
+        if displayDict is None:
+            displayDict = {}
+        figInfo = {'metricName': metricName, 'slicerName': slicerName, 'runName': runName,
+                   'constraint': constraint, 'metadata': metadata, 'displayDict': displayDict,
+                   'plotType': plotType, 'plotFile': plotFile, 'plotHash': plotHash}
+        self.savedFigs.append(figInfo)
+        if plotHash is not None:
+            self.plotHashes[plotFile] = plotHash
         if self.resultsDb:
-            if displayDict is None:
-                displayDict = {}
-            metricId = self.resultsDb.updateMetric(metricName, slicerName, runName, constraint,
-                                                   metadata, None)
-            self.resultsDb.updateDisplay(metricId=metricId, displayDict=displayDict, overwrite=False)
-            self.resultsDb.updatePlot(metricId=metricId, plotType=plotType, plotFile=plotFile)
+            self.writeResultsDb([figInfo])
+
+    def _plotHash(self, plotFunc):
+        """Calculate a hash of everything which goes into the plot of self.mBundles with plotFunc.
+
+        Returns None if some of this (such as an object in a plotDict) cannot be hashed.
+        """
+        h = hashlib.sha1()
+        try:
+            _hashUpdate(h, (plotFunc, self.figformat, self.dpi, self.trimWhitespace, self.thumbnail))
+            _hashUpdate(h, self.plotDicts)
+            for mB in self.mBundles:
+                _hashUpdate(h, (self.slicer.slicerName, getattr(mB.slicer, 'nside', None),
+                                mB.slicer.badval, mB.slicer.shape))
+                _hashUpdate(h, {k: mB.slicer.slicePoints.get(k) for k in ('sid', 'ra', 'dec', 'bins')})
+                if mB.metricValues is None:
+                    _hashUpdate(h, None)
+                else:
+                    _hashUpdate(h, (ma.getdata(mB.metricValues), ma.getmaskarray(mB.metricValues)))
+        except _Unhashable:
+            return None
+        return h.hexdigest()
+
+    def _isCached(self, outfileRoot, plotType, plotHash):
+        """Check if the figure (and thumbnail) for plotHash are already on disk."""
+        if plotHash is None:
+            return False
+        plotFile = outfileRoot + '_' + plotType + '.' + self.figformat
+        if self.plotHashes.get(plotFile) != plotHash:
+            return False
+        if not os.path.isfile(os.path.join(self.outDir, plotFile)):
+            return False
+        if self.thumbnail:
+            thumbFile = 'thumb.' + outfileRoot + '_' + plotType + '.png'
+            if not os.path.isfile(os.path.join(self.outDir, thumbFile)):
+                return False
+        return True
+
+    def _readPlotCache(self):
+        filename = os.path.join(self.outDir, self.plotCacheFile)
+        if not os.path.isfile(filename):
+            return {}
+        try:
+            with open(filename, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            warnings.warn('Could not read plot cache manifest %s; remaking all plots.' % filename)
+            return {}
+
+    def writePlotCache(self, savedFigs=None):
+        """Write the hashes of the saved figures to the plot cache manifest (if plotCache is True).
+
+        Parameters
+        ----------
+        savedFigs : list of dict, opt
+            Information about additional saved figures (as in self.savedFigs), such as from the
+            PlotHandlers of other processes, to add to the manifest. Default None.
+        """
+        if not self.plotCache:
+            return
+        if savedFigs is not None:
+            for figInfo in savedFigs:
+                if figInfo.get('plotHash') is not None:
+                    self.plotHashes[figInfo['plotFile']] = figInfo['plotHash']
+        filename = os.path.join(self.outDir, self.plotCacheFile)
+        # Write to a temporary file first, so an interrupted write does not lose the manifest.
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(self.plotHashes, f, indent=0, sort_keys=True)
+        os.replace(filename + '.tmp', filename)
+
+    def writeResultsDb(self, savedFigs=None):
+        """Record information about saved figures in the resultsDb.
+
+        Parameters
+        ----------
+        savedFigs : list of dict, opt
+            The information about each figure, as kept in self.savedFigs. This can come from
+            another PlotHandler (such as one used in a separate plotting process).
+            Default None, which records all of self.savedFigs.
+        """
+        if savedFigs is None:
+            savedFigs = self.savedFigs
+        for figInfo in savedFigs:
+            metricId = self.resultsDb.updateMetric(figInfo['metricName'], figInfo['slicerName'],
+                                                   figInfo['runName'], figInfo['constraint'],
+                                                   figInfo['metadata'], None)
+            self.resultsDb.updateDisplay(metricId=metricId, displayDict=figInfo['displayDict'],
+                                         overwrite=False)
+            self.resultsDb.updatePlot(metricId=metricId, plotType=figInfo['plotType'],
+                                      plotFile=figInfo['plotFile'])
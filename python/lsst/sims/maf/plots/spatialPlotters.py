@@ -1,8 +1,10 @@
 from builtins import zip
 import numbers
+from functools import lru_cache
 import numpy as np
 import warnings
 import healpy as hp
+from healpy import projaxes, projector
 from matplotlib import colors
 from matplotlib import ticker
 import matplotlib.pyplot as plt
@@ -10,7 +12,7 @@ import matplotlib.cm as cm
 from matplotlib.ticker import FuncFormatter
 import matplotlib as mpl
 from matplotlib.patches import Ellipse
-from matplotlib.collections import PatchCollection
+from matplotlib.collections import PolyCollection
 
 from lsst.sims.maf.utils import optimalBins, percentileClipping
 from .plotHandler import BasePlotter, applyZPNorm
@@ -32,6 +34,60 @@ baseDefaultPlotDict = {'title': None, 'xlabel': None, 'label': None,
                        'labelsize': None, 'fontsize': None, 'figsize': None, 'subplot': 111}
 
 
+@lru_cache(maxsize=16)
+def _healpixProjection(nside, xsize, mapCoord, rot, coord, flip):
+    """Return the (RING) healpix id of each pixel of a mollweide image (-1 outside the sky).
+
+    The projection is calculated by healpy (by projecting a map of the healpix ids), once for
+    each set of parameters, and then reused for every map with the same nside and projection.
+    """
+    proj = projector.MollweideProj(rot=rot, coord=coord, flipconv=flip, xsize=xsize)
+    img = proj.projmap(np.arange(hp.nside2npix(nside)), lambda x, y, z: hp.vec2pix(nside, x, y, z),
+                       coord=mapCoord)
+    lookup = np.where(np.isfinite(img), img, -1).astype(int)
+    lookup.setflags(write=False)
+    return lookup
+
+
+def _hashable(value):
+    """Convert (nested) lists of parameters to tuples, so they can be used as a cache key."""
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+class _CachedMollweideProj(projector.MollweideProj):
+    """A healpy MollweideProj which projects healpix maps using the cached _healpixProjection.
+    """
+    def __init__(self, rot=None, coord=None, flipconv=None, **kwds):
+        self._projKey = (_hashable(rot), _hashable(coord), flipconv)
+        super(_CachedMollweideProj, self).__init__(rot=rot, coord=coord, flipconv=flipconv, **kwds)
+
+    def projmap(self, map, vec2pix_func, rot=None, coord=None):
+        if rot is not None or isinstance(map, (dict, np.ma.MaskedArray)):
+            return super(_CachedMollweideProj, self).projmap(map, vec2pix_func, rot=rot, coord=coord)
+        lookup = _healpixProjection(hp.npix2nside(len(map)), int(self.arrayinfo['xsize']),
+                                    _hashable(coord), *self._projKey)
+        img = np.zeros(lookup.shape, np.float64) - np.inf
+        inside = lookup >= 0
+        img[inside] = map[lookup[inside]]
+        return img
+
+
+class _CachedHpxMollweideAxes(projaxes.HpxMollweideAxes):
+    """A healpy HpxMollweideAxes using the _CachedMollweideProj projection.
+    """
+    def __init__(self, *args, **kwds):
+        super(_CachedHpxMollweideAxes, self).__init__(*args, **kwds)
+        self.proj = _CachedMollweideProj(rot=kwds.get('rot'), coord=kwds.get('coord'),
+                                         flipconv=kwds.get('flipconv'))
+
+    def projmap(self, map, nest=False, **kwds):
+        if nest:
+            map = hp.reorder(map, n2r=True)
+        return super(_CachedHpxMollweideAxes, self).projmap(map, nest=False, **kwds)
+
+
 def setColorLims(metricValue, plotDict):
     """Set up color bar limits."""
     # Use plot dict if these values are set.
@@ -72,6 +128,9 @@ def setColorMap(plotDict):
 class HealpixSkyMap(BasePlotter):
     """
     Generate a sky map of healpix metric values using healpy's mollweide view.
+
+    The projection from the image pixels to the healpix ids is calculated once for each nside,
+    rotation, coordinate system and image size, and then reused for all following maps.
     """
     def __init__(self):
         super(HealpixSkyMap, self).__init__()
@@ -90,6 +149,37 @@ class HealpixSkyMap(BasePlotter):
         self.ax = None
         self.im = None
 
+    def _useProjectionCache(self, visufunc_params):
+        """Check whether the map can be drawn with the cached projection from image pixels to
+        healpix ids (a standard mollweide view), rather than letting healpy recalculate it.
+        """
+        if self.healpy_visufunc is not hp.mollview:
+            return False
+        if any(visufunc_params.get(k) for k in ('hold', 'reuse_axes', 'margins', 'remove_dip',
+                                                  'remove_mono', 'alpha')):
+            return False
+        sub = visufunc_params['sub']
+        if isinstance(sub, numbers.Integral):
+            sub = (sub // 100, (sub % 100) // 10, sub % 10)
+        return len(sub) == 3 and 1 <= sub[2] <= sub[0] * sub[1]
+
+    def _mollweideAxes(self, fig, visufunc_params):
+        """Create the mollweide axes which healpy would make for this subplot, using the cached
+        projection.
+        """
+        sub = visufunc_params['sub']
+        if isinstance(sub, numbers.Integral):
+            sub = (sub // 100, (sub % 100) // 10, sub % 10)
+        nrows, ncols, idx = sub
+        c, r = (idx - 1) % ncols, (idx - 1) // ncols
+        # The same margins as healpy uses for subplots.
+        margins = (0.01, 0.0, 0.0, 0.02)
+        extent = (c * 1.0 / ncols + margins[0], 1.0 - (r + 1) * 1.0 / nrows + margins[1],
+                  1.0 / ncols - margins[2] - margins[0], 1.0 / nrows - margins[3] - margins[1])
+        return _CachedHpxMollweideAxes(fig, extent, coord=visufunc_params['coord'],
+                                       rot=visufunc_params['rot'], format='%g',
+                                       flipconv=visufunc_params['flip'])
+
     def __call__(self, metricValueIn, slicer, userPlotDict, fignum=None):
         """
         Parameters
@@ -161,8 +251,13 @@ class HealpixSkyMap(BasePlotter):
                            'fig':fig.number,
                            'notext': notext}
         visufunc_params.update(self.healpy_visufunc_params)
+        if self._useProjectionCache(visufunc_params):
+            # Add the mollweide axes with the cached projection, for healpy to draw the map onto.
+            fig.add_axes(self._mollweideAxes(fig, visufunc_params))
+            visufunc_params = {k: v for k, v in visufunc_params.items() if k not in ('sub', 'fig')}
+            visufunc_params['reuse_axes'] = True
         self.healpy_visufunc(metricValue.filled(slicer.badval), **visufunc_params)
-        
+
         # Add a graticule (grid) over the globe.
         hp.graticule(dpar=30, dmer=30, verbose=False)
         # Add colorbar (not using healpy default colorbar because we want more tickmarks).
@@ -455,6 +550,34 @@ class BaseSkyMap(BasePlotter):
             ellipses.append(el)
         return ellipses
 
+    def _tissotVertices(self, lon, lat, radius, nVertices=32):
+        """Calculate the vertices of the (polygon) Tissot ellipses at all lon/lat positions at once.
+
+        Parameters
+        ----------
+        lon : numpy.ndarray
+            longitude-like of ellipse centers (radians)
+        lat : numpy.ndarray
+            latitude-like of ellipse centers (radians)
+        radius : float
+            radius of ellipses (radians)
+        nVertices : int, opt
+            Number of vertices of each ellipse. Default 32.
+
+        Returns
+        -------
+        numpy.ndarray
+            The vertices of each ellipse, with shape (len(lon), nVertices, 2),
+            as the same ellipses as _plot_tissot_ellipse.
+        """
+        theta = np.linspace(0, 2 * np.pi, nVertices, endpoint=False)
+        lon = np.asarray(lon, dtype=float)[:, np.newaxis]
+        lat = np.asarray(lat, dtype=float)[:, np.newaxis]
+        verts = np.empty((len(lon), nVertices, 2), float)
+        verts[:, :, 0] = lon + radius / np.cos(lat) * np.cos(theta)
+        verts[:, :, 1] = lat + radius * np.sin(theta)
+        return verts
+
     def _plot_ecliptic(self, raCen=0, ax=None):
         """
         Plot a red line at location of ecliptic.
@@ -508,16 +631,16 @@ class BaseSkyMap(BasePlotter):
         # Set up valid datapoints and colormin/max values.
         if plotDict['plotMask']:
             # Plot all data points.
-            mask = np.ones(len(metricValue), dtype='bool')
+            good = np.ones(len(metricValue), dtype='bool')
         else:
             # Only plot points which are not masked. Flip numpy ma mask where 'False' == 'good'.
             good = ~metricValue.mask
 
         # Add ellipses at RA/Dec locations - but don't add colors yet.
         lon = -(slicer.slicePoints['ra'][good] - plotDict['raCen'] - np.pi) % (np.pi * 2) - np.pi
-        ellipses = self._plot_tissot_ellipse(lon, slicer.slicePoints['dec'][good],
-                                             plotDict['radius'], rasterized=True, ax=ax)
         if plotDict['metricIsColor']:
+            ellipses = self._plot_tissot_ellipse(lon, slicer.slicePoints['dec'][good],
+                                                 plotDict['radius'], rasterized=True, ax=ax)
             current = None
             for ellipse, mVal in zip(ellipses, metricValue.data[good]):
                 if mVal[3] > 1:
@@ -543,16 +666,24 @@ class BaseSkyMap(BasePlotter):
                         plotDict['logScale'] = False
                 else:
                     plotDict['logScale'] = False
+            # Build all of the ellipses together, as a single collection of polygons.
+            verts = self._tissotVertices(lon, slicer.slicePoints['dec'][good], plotDict['radius'])
+            transform = ax.transData
+            if hasattr(ax, 'transProjection') and hasattr(ax, 'transAffine'):
+                # Project all of the vertices at once, rather than each ellipse separately when drawing.
+                verts = ax.transProjection.transform(verts.reshape(-1, 2)).reshape(verts.shape)
+                transform = ax.transAffine + ax.transAxes
             if plotDict['logScale']:
                 # Move min/max values to things that can be marked on the colorbar.
                 #clims[0] = 10 ** (int(np.log10(clims[0])))
                 #clims[1] = 10 ** (int(np.log10(clims[1])))
                 norml = colors.LogNorm()
-                p = PatchCollection(ellipses, cmap=plotDict['cmap'], alpha=plotDict['alpha'],
-                                    linewidth=0, edgecolor=None, norm=norml, rasterized=True)
+                p = PolyCollection(verts, cmap=plotDict['cmap'], alpha=plotDict['alpha'],
+                                   linewidth=0, edgecolor=None, norm=norml, rasterized=True,
+                                   transform=transform)
             else:
-                p = PatchCollection(ellipses, cmap=plotDict['cmap'], alpha=plotDict['alpha'],
-                                    linewidth=0, edgecolor=None, rasterized=True)
+                p = PolyCollection(verts, cmap=plotDict['cmap'], alpha=plotDict['alpha'],
+                                   linewidth=0, edgecolor=None, rasterized=True, transform=transform)
             p.set_array(metricValue.data[good])
             p.set_clim(clims)
             ax.add_collection(p)
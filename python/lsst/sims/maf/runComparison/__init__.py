@@ -1 +1,2 @@
+from .summaryStatWarehouse import *
 from .runComparison import *
@@ -2,12 +2,16 @@ from builtins import zip
 from builtins import range
 from builtins import object
 import os
+import shutil
+import tempfile
 import warnings
 import numpy as np
+import numpy.ma as ma
 import pandas as pd
-from lsst.sims.maf.db import ResultsDb
 import lsst.sims.maf.metricBundles as mb
 import lsst.sims.maf.plots as plots
+from lsst.sims.maf.utils import readNpzArray
+from .summaryStatWarehouse import SummaryStatWarehouse
 
 _BOKEH_HERE = True
 try:
@@ -31,8 +35,9 @@ class RunComparison(object):
     Class to read multiple results databases, find requested summary metric comparisons,
     and stores results in DataFrames in class.
 
-    Set up the runs to compare and opens connections to all resultsDb_sqlite directories under
-    baseDir/runNames[1-N] and their subdirectories.
+    Set up the runs to compare and gathers the summary statistics of all resultsDb_sqlite files under
+    baseDir/runNames[1-N] and their subdirectories into a SummaryStatWarehouse, so that the
+    statistics of all runs are compared with a single query.
     There are two ways to approach the storage and access to the MAF outputs:
     EITHER the outputs can be stored directly in the runNames directories or subdirectories of these:
     baseDir -> run1  -> subdirectory1 (e.g. 'scheduler', containing a resultsDb_sqlite.db file)
@@ -52,9 +57,14 @@ class RunComparison(object):
         A list of directories (relative to baseDir) where the MAF outputs in runNames reside.
         Optional - if not provided, assumes directories are simply the names in runNames.
         Must have same length as runNames (note that runNames can contain duplicate entries).
+    warehouse : str or SummaryStatWarehouse, opt
+        The sqlite file (or SummaryStatWarehouse) in which to gather the summary statistics.
+        Only the resultsDbs modified since they were last added to this file are read again, so
+        reusing a warehouse file makes repeated comparisons of many runs fast.
+        Default None builds the warehouse in memory.
     """
     def __init__(self, baseDir, runNames, rundirs=None,
-                 defaultResultsDb='resultsDb_sqlite.db', verbose=False):
+                 defaultResultsDb='resultsDb_sqlite.db', verbose=False, warehouse=None):
         self.baseDir = baseDir
         self.runlist = runNames
         self.verbose = verbose
@@ -65,6 +75,10 @@ class RunComparison(object):
             self.rundirs = rundirs
         else:
             self.rundirs = self.runlist
+        if isinstance(warehouse, SummaryStatWarehouse):
+            self.warehouse = warehouse
+        else:
+            self.warehouse = SummaryStatWarehouse(warehouse)
         self._connect_to_results()
         # Class attributes to store the stats data:
         self.headerStats = None       # Save information on the summary stat values
@@ -74,12 +88,12 @@ class RunComparison(object):
 
     def _connect_to_results(self):
         """
-        Open access to all the results database files.
-        Sets nested dictionary of results databases:
-        .. dictionary[run1][subdirectory1] = resultsDb
-        .. dictionary[run1][subdirectoryN] = resultsDb ...
+        Find all the results database files, and add them to the warehouse.
+        Sets nested dictionary of results database files:
+        .. dictionary[run1][subdirectory1] = resultsDb filename
+        .. dictionary[run1][subdirectoryN] = resultsDb filename ...
         """
-        # Open access to all results database files in any subdirectories under 'runs'.
+        # Find all results database files in any subdirectories under 'runs'.
         self.runresults = {}
         for r, rdir in zip(self.runlist, self.rundirs):
             checkdir = os.path.join(self.baseDir, rdir)
@@ -92,30 +106,40 @@ class RunComparison(object):
                 # Check for a resultsDB in the current checkdir
                 if os.path.isfile(os.path.join(checkdir, self.defaultResultsDb)):
                     s = os.path.split(rdir)[-1]
-                    self.runresults[r][s] = ResultsDb(outDir=checkdir)
+                    self.runresults[r][s] = os.path.join(checkdir, self.defaultResultsDb)
                 # And look for resultsDb files in subdirectories.
                 sublist = os.listdir(checkdir)
                 for s in sublist:
                     if os.path.isfile(os.path.join(checkdir, s, 'resultsDb_sqlite.db')):
-                        self.runresults[r][s] = ResultsDb(outDir=os.path.join(checkdir, s))
+                        self.runresults[r][s] = os.path.join(checkdir, s, 'resultsDb_sqlite.db')
         # Remove any runs from runlist which we could not find results databases for.
         for r in self.runlist:
-            if len(self.runresults[r]) == 0:
+            if len(self.runresults.get(r, {})) == 0:
                 warnings.warn('Warning: could not find any results databases for run %s'
                               % (os.path.join(self.baseDir, r)))
         # Now de-duplicate the runlist (we don't need to loop over extra items).
         self.runlist = list(self.runresults.keys())
+        # Label each resultsDb with its run and subdirectory (in the order searched above).
+        dbs = [(os.path.realpath(self.runresults[r][s]), r, s)
+               for r in self.runlist for s in self.runresults[r]]
+        self._resultsDbs = pd.DataFrame(dbs, columns=['resultsDb', 'runName', 'subdir'])
+        self._resultsDbs['dbOrder'] = np.arange(len(dbs))
+        self.warehouse.update(self._resultsDbs['resultsDb'])
+
+    def _query(self, func, subdir=None, **kwargs):
+        """Run a warehouse query over the resultsDbs of all runs (or only those in subdir),
+        adding the runName and subdir of each row, in the order of the runs and their subdirectories."""
+        dbs = self._resultsDbs
+        if subdir is not None:
+            dbs = dbs[dbs['subdir'] == subdir]
+        rows = func(resultsDbs=list(dbs['resultsDb']), **kwargs)
+        return rows.merge(dbs, on='resultsDb').sort_values('dbOrder', kind='mergesort')
 
     def close(self):
         """
-        Close all connections to the results database files.
+        Close the connection to the summary stat warehouse.
         """
-        self.__del__()
-
-    def __del__(self):
-        for r in self.runresults:
-            for s in self.runresults[r]:
-                self.runresults[r][s].close()
+        self.warehouse.close()
 
     def buildMetricDict(self, metricNameLike=None, metricMetadataLike=None,
                         slicerNameLike=None, subdir=None):
@@ -138,35 +162,15 @@ class RunComparison(object):
         Dict
             Key = self-created metric 'name', value = Dict{metricName, metricMetadata, slicerName}
         """
-        if metricNameLike is None and metricMetadataLike is None and slicerNameLike is None:
-            getAll = True
-        else:
-            getAll = False
         mDict = {}
-
-        # Track this here, so that if directories have different subdirectories, this will still work.
-        insubdir = subdir
-        for r in self.runlist:
-            if insubdir is not None:
-                subdirs = [insubdir]
-            else:
-                subdirs = list(self.runresults[r].keys())
-            for subdir in subdirs:
-                if getAll:
-                    mIds = self.runresults[r][subdir].getAllMetricIds()
-                else:
-                    mIds = self.runresults[r][subdir].getMetricIdLike(metricNameLike=metricNameLike,
-                                                                      metricMetadataLike=metricMetadataLike,
-                                                                      slicerNameLike=slicerNameLike)
-                for mId in mIds:
-                    info = self.runresults[r][subdir].getMetricInfo(mId)
-                    metricName = info['metricName'][0]
-                    metricMetadata = info['metricMetadata'][0]
-                    slicerName = info['slicerName'][0]
-                    name = self._buildSummaryName(metricName, metricMetadata, slicerName, None)
-                    mDict[name] = {'metricName': metricName,
-                                   'metricMetadata': metricMetadata,
-                                   'slicerName': slicerName}
+        metrics = self._query(self.warehouse.getMetrics, subdir=subdir, metricNameLike=metricNameLike,
+                              metricMetadataLike=metricMetadataLike, slicerNameLike=slicerNameLike)
+        for metricName, metricMetadata, slicerName in zip(metrics['metricName'], metrics['metricMetadata'],
+                                                          metrics['slicerName']):
+            name = self._buildSummaryName(metricName, metricMetadata, slicerName, None)
+            mDict[name] = {'metricName': metricName,
+                           'metricMetadata': metricMetadata,
+                           'slicerName': slicerName}
         return mDict
 
     def _buildSummaryName(self, metricName, metricMetadata, slicerName, summaryStatName):
@@ -185,7 +189,7 @@ class RunComparison(object):
         return name
 
     def _findSummaryStats(self, metricName, metricMetadata=None, slicerName=None, summaryName=None,
-                          colName=None, verbose=False):
+                          colName=None, verbose=False, stats=None):
         """
         Look for summary metric values matching metricName (and optionally metricMetadata, slicerName
         and summaryName) among the results databases for each run.
@@ -206,6 +210,9 @@ class RunComparison(object):
         verbose : bool, opt
             Issue warnings resulting from not finding the summary stat information
             (such as if it was never calculated) will not be issued.   Default False.
+        stats : pandas.DataFrame, opt
+            Summary stats already fetched from the warehouse (with self._query), to search instead
+            of querying the warehouse. Default None.
 
         Results
         -------
@@ -213,51 +220,34 @@ class RunComparison(object):
             <index>   <metricName>  (possibly additional metricNames - multiple summary stats or metadata..)
              runName    value
         """
-        summaryValues = {}
-        summaryNames = {}
-        for r in self.runlist:
-            summaryValues[r] = {}
-            summaryNames[r] = {}
-            # Check if this metric/metadata/slicer/summary stat name combo is in
-            # this resultsDb .. or potentially in another subdirectory's resultsDb.
-            for subdir in self.runresults[r]:
-                mId = self.runresults[r][subdir].getMetricId(metricName=metricName,
-                                                             metricMetadata=metricMetadata,
-                                                             slicerName=slicerName)
-                # Note that we may have more than one matching summary metric value per run.
-                if len(mId) > 0:
-                    # And we may have more than one summary metric value per resultsDb
-                    stats = self.runresults[r][subdir].getSummaryStats(mId, summaryName=summaryName)
-                    if len(stats['summaryName']) == 1 and colName is not None:
-                        name = colName
-                        summaryValues[r][name] = stats['summaryValue'][0]
-                        summaryNames[r][name] = stats['summaryName'][0]
-                    else:
-                        for i in range(len(stats['summaryName'])):
-                            name = self._buildSummaryName(metricName, metricMetadata, slicerName,
-                                                          stats['summaryName'][i])
-                            summaryValues[r][name] = stats['summaryValue'][i]
-                            summaryNames[r][name] = stats['summaryName'][i]
-            if len(summaryValues[r]) == 0 and verbose:
-                warnings.warn("Warning: Found no metric results for %s %s %s %s in run %s"
-                              % (metricName, metricMetadata, slicerName, summaryName, r))
-        # Make DataFrame.
-        # First determine list of all summary stats pulled from all databases.
-        unique_stats = set()
-        for r in self.runlist:
-            for name in summaryNames[r]:
-                unique_stats.add(name)
-        # Make sure every runName (key) in summaryValues dictionary has a value for each stat.
-        # And build summaryname properly
-        suNames = {}
-        for s in unique_stats:
+        match = {'metricName': metricName, 'metricMetadata': metricMetadata,
+                 'slicerName': slicerName, 'summaryName': summaryName}
+        if stats is None:
+            stats = self._query(self.warehouse.getSummaryStats, **match)
+        else:
+            for col, value in match.items():
+                if value is not None:
+                    stats = stats[stats[col] == value]
+        # Order the stats as they would be found run by run (and within each resultsDb) --
+        # if more than one stat has the same name within a run, the last one is used.
+        stats = stats.sort_values(['dbOrder', 'slicerName', 'metricMetadata', 'metricId', 'statId'],
+                                  kind='mergesort')
+        names = np.array([self._buildSummaryName(metricName, metricMetadata, slicerName, sName)
+                          for sName in stats['summaryName']], dtype=object)
+        if colName is not None:
+            # Use colName for runs where the resultsDb returned only one summary stat.
+            nStats = stats.groupby('dbOrder')['statId'].transform('size').values
+            names[nStats == 1] = colName
+        stats = stats.assign(name=names)
+        unique_stats = list(pd.unique(stats['name']))
+        stats = stats.drop_duplicates(subset=['runName', 'name'], keep='last')
+        if verbose:
             for r in self.runlist:
-                try:
-                    summaryValues[r][s]
-                    suNames[s] = summaryNames[r][s]
-                except KeyError:
-                    summaryValues[r][s] = np.nan
-        # Create data frames for each run. This is the simplest way to handle it in pandas.
+                if r not in set(stats['runName']):
+                    warnings.warn("Warning: Found no metric results for %s %s %s %s in run %s"
+                                  % (metricName, metricMetadata, slicerName, summaryName, r))
+        # Each stat takes its summaryName from the last run where it was found.
+        suNames = dict(zip(stats['name'], stats['summaryName']))
         summaryBase = {}
         mName = {}
         mData = {}
@@ -270,19 +260,41 @@ class RunComparison(object):
             sName[s] = slicerName
         header = pd.DataFrame([summaryBase, mName, mData, sName, suNames],
                               index=['BaseName', 'MetricName', 'MetricMetadata',
-                                     'SlicerName', 'SummaryName'])
-        tempDFList = []
-        for r in self.runlist:
-            tempDFList.append(pd.DataFrame(summaryValues[r], index=[r]))
-        # Concatenate dataframes for each run.
-        stats = pd.concat(tempDFList)
+                                     'SlicerName', 'SummaryName'], columns=unique_stats)
+        # Make the (runName x summary stat) dataframe, with NaN where a run does not have a stat.
+        values = np.full((len(self.runlist), len(unique_stats)), np.nan)
+        runIdx = pd.Index(self.runlist).get_indexer(stats['runName'])
+        values[runIdx, pd.Index(unique_stats).get_indexer(stats['name'])] = stats['summaryValue']
+        stats = pd.DataFrame(values, index=self.runlist, columns=unique_stats)
         return header, stats
 
+    @staticmethod
+    def _joinFrames(frames):
+        """Combine dataframes (with the same index) side by side, naming the columns as successive
+        DataFrame.join(lsuffix='_x') calls would (earlier columns with a repeated name get a '_x' suffix).
+        """
+        names = []
+        positions = {}
+        for frame in frames:
+            for col in frame.columns:
+                if col in positions:
+                    for i in positions.pop(col):
+                        names[i] = col + '_x'
+                        positions.setdefault(names[i], []).append(i)
+            for col in frame.columns:
+                positions.setdefault(col, []).append(len(names))
+                names.append(col)
+        joined = pd.concat(frames, axis=1)
+        joined.columns = names
+        return joined
+
     def addSummaryStats(self, metricDict=None, verbose=False):
         """
         Combine the summary statistics of a set of metrics into a pandas
         dataframe that is indexed by the opsim run name.and
 
+        The summary statistics of all runs are fetched from the warehouse in a single query.
+
         Parameters
         ----------
         metricDict: dict, opt
@@ -290,7 +302,6 @@ class RunComparison(object):
             a results database.  The metric/metadata/slicer/summary values referred to
             by a metricDict value could be unique but don't have to be.
             If None (default), then fetches all metric results.
-            (This can be slow if there are a lot of metrics.)
         verbose : bool, opt
             Issue warnings resulting from not finding the summary stat information
             (such as if it was never calculated) will not be issued.   Default False.
@@ -307,6 +318,14 @@ class RunComparison(object):
         """
         if metricDict is None:
             metricDict = self.buildMetricDict()
+        allStats = self._query(self.warehouse.getSummaryStats)
+        statsByMetric = dict(list(allStats.groupby('metricName', sort=False)))
+        noStats = allStats.iloc[:0]
+        headerList = []
+        statsList = []
+        if self.summaryStats is not None:
+            headerList.append(self.headerStats)
+            statsList.append(self.summaryStats)
         for mName, metric in metricDict.items():
             if 'summaryName' not in metric:
                 metric['summaryName'] = None
@@ -314,13 +333,14 @@ class RunComparison(object):
                                                            metricMetadata=metric['metricMetadata'],
                                                            slicerName=metric['slicerName'],
                                                            summaryName=metric['summaryName'],
-                                                           colName=mName, verbose=verbose)
-            if self.summaryStats is None:
-                self.summaryStats = tempStats
-                self.headerStats = tempHeader
-            else:
-                self.summaryStats = self.summaryStats.join(tempStats, lsuffix='_x')
-                self.headerStats = self.headerStats.join(tempHeader, lsuffix='_x')
+                                                           colName=mName, verbose=verbose,
+                                                           stats=statsByMetric.get(metric['metricName'],
+                                                                                   noStats))
+            headerList.append(tempHeader)
+            statsList.append(tempStats)
+        if len(statsList) > 0:
+            self.summaryStats = self._joinFrames(statsList)
+            self.headerStats = self._joinFrames(headerList)
 
     def normalizeStats(self, baselineRun):
         """
@@ -428,22 +448,168 @@ class RunComparison(object):
             Keys: runName, Value: path to file
         """
         filepaths = {}
-        for r in self.runlist:
-            for s in self.runresults[r]:
-                mId = self.runresults[r][s].getMetricId(metricName=metricName,
-                                                        metricMetadata=metricMetadata,
-                                                        slicerName=slicerName)
-                if len(mId) > 0 :
-                    if len(mId) > 1:
-                        warnings.warn("Found more than one metric data file matching " +
-                                      "metricName %s metricMetadata %s and slicerName %s"
-                                      % (metricName, metricMetadata, slicerName) +
-                                      " Skipping this combination.")
-                    else:
-                        filename = self.runresults[r][s].getMetricDataFiles(metricId=mId)
-                        filepaths[r] = os.path.join(r, s, filename[0])
+        metrics = self._query(self.warehouse.getMetrics, metricName=metricName,
+                              metricMetadata=metricMetadata, slicerName=slicerName)
+        for (dbOrder, r, s), m in metrics.groupby(['dbOrder', 'runName', 'subdir']):
+            if len(m) > 1:
+                warnings.warn("Found more than one metric data file matching " +
+                              "metricName %s metricMetadata %s and slicerName %s"
+                              % (metricName, metricMetadata, slicerName) +
+                              " Skipping this combination.")
+            else:
+                filepaths[r] = os.path.join(r, s, m['metricDataFile'].iloc[0])
         return filepaths
 
+    def _metricDataFiles(self, metricName, metricMetadata=None, slicerName=None):
+        """Return the full path to the datafile for a given metric, for each run (as getFileNames)."""
+        filepaths = {}
+        metrics = self._query(self.warehouse.getMetrics, metricName=metricName,
+                              metricMetadata=metricMetadata, slicerName=slicerName)
+        for (dbOrder, r), m in metrics.groupby(['dbOrder', 'runName']):
+            if len(m) > 1:
+                warnings.warn("Found more than one metric data file matching " +
+                              "metricName %s metricMetadata %s and slicerName %s"
+                              % (metricName, metricMetadata, slicerName) +
+                              " Skipping this combination.")
+            else:
+                filepaths[r] = os.path.join(os.path.dirname(m['resultsDb'].iloc[0]),
+                                            m['metricDataFile'].iloc[0])
+        return filepaths
+
+    def compareMetricMaps(self, metricName, metricMetadata, slicerName, baselineRun, outDir,
+                          comparisons=('difference', 'ratio', 'rank'), runlist=None, resultsDb=None,
+                          chunkSize=100000):
+        """Compare the metric values (such as healpix maps) of each run with baselineRun, slicePoint by
+        slicePoint, and write the results as new metric bundles.
+
+        The metric values of each run are memory-mapped from their data files and compared in chunks
+        of chunkSize slicePoints, while the results are accumulated in memory-mapped scratch files in
+        outDir, so that only one chunk of all of the runs (and one output map) is held in memory at a time.
+
+        Parameters
+        ----------
+        metricName : str
+            The name of the original metric.
+        metricMetadata : str
+            The metric metadata specifying the metric desired.
+        slicerName : str
+            The slicer name specifying the metric desired.
+        baselineRun : str
+            The run to compare the other runs against.
+        outDir : str
+            The directory for the output metric bundles.
+        comparisons : list of str, opt
+            The comparisons to calculate:
+            'difference' (value - baseline value), 'ratio' (value / baseline value) and/or
+            'rank' (the rank of the value of the run among all of the runs at this slicePoint,
+            from 1 for the smallest value).
+            Slicepoints where the run (or baseline, for difference and ratio) is masked are masked.
+        runlist : list of str, opt
+            The runs to compare. Default None, all runs (with this metric).
+        resultsDb : ResultsDb, opt
+            Results database to record the output metric bundles. Default None.
+        chunkSize : int, opt
+            The number of slicePoints to compare at a time. Default 100000.
+
+        Returns
+        -------
+        dict
+            Keys: (runName, comparison), Value: the filename of the output metric bundle.
+        """
+        for c in comparisons:
+            if c not in ('difference', 'ratio', 'rank'):
+                raise ValueError('Comparison %s not understood: use difference, ratio or rank' % c)
+        filenames = self._metricDataFiles(metricName, metricMetadata, slicerName)
+        if runlist is None:
+            runlist = self.runlist
+        runlist = [r for r in runlist if r in filenames]
+        if baselineRun not in runlist:
+            raise ValueError('Could not find the metric data for the baseline run %s' % baselineRun)
+        # The baseline bundle provides the slicer and metadata for the output bundles.
+        baseline = mb.createEmptyMetricBundle()
+        baseline.read(filenames[baselineRun])
+        nSlice = len(baseline.metricValues)
+        if baseline.metricValues.ndim != 1 or baseline.metricValues.dtype.kind not in 'iuf':
+            raise ValueError('Can only compare metrics with a single numerical value per slicePoint.')
+        maps = []
+        for r in runlist:
+            values = readNpzArray(filenames[r], 'metricValues')
+            if values.shape != (nSlice, ):
+                raise ValueError('The metric values of run %s do not match the baseline (shape %s, not %s)'
+                                 % (r, values.shape, (nSlice, )))
+            mask = readNpzArray(filenames[r], 'mask')
+            if mask is None:
+                # No mask was saved.
+                mask = None
+            elif mask.shape != values.shape:
+                # A single (scalar) mask value.
+                mask = np.ones(nSlice, bool) if mask.any() else None
+            maps.append((values, mask))
+        baseline.metricValues = None
+        b = runlist.index(baselineRun)
+        if not os.path.isdir(outDir):
+            os.makedirs(outDir)
+        scratchDir = tempfile.mkdtemp(dir=outDir)
+        try:
+            results = {c: np.lib.format.open_memmap(os.path.join(scratchDir, c + '.npy'), mode='w+',
+                                                    dtype=float, shape=(len(runlist), nSlice))
+                       for c in comparisons}
+            ranks = np.arange(1, len(runlist) + 1, dtype=float)[:, np.newaxis]
+            for start in range(0, nSlice, chunkSize):
+                end = min(start + chunkSize, nSlice)
+                # Masked (and non-finite) values are NaN.
+                chunk = np.empty((len(runlist), end - start), float)
+                for i, (values, mask) in enumerate(maps):
+                    chunk[i] = values[start:end]
+                    if mask is not None:
+                        chunk[i][mask[start:end]] = np.nan
+                chunk[~np.isfinite(chunk)] = np.nan
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    if 'difference' in results:
+                        results['difference'][:, start:end] = chunk - chunk[b]
+                    if 'ratio' in results:
+                        ratio = chunk / chunk[b]
+                        ratio[:, chunk[b] == 0] = np.nan
+                        results['ratio'][:, start:end] = ratio
+                if 'rank' in results:
+                    # Sort the runs at each slicePoint (NaN last); equal values share the lowest rank.
+                    order = np.argsort(chunk, axis=0, kind='stable')
+                    ordered = np.take_along_axis(chunk, order, axis=0)
+                    sortedRank = np.where(np.diff(ordered, axis=0, prepend=np.nan) != 0, ranks, 1)
+                    sortedRank = np.maximum.accumulate(sortedRank, axis=0)
+                    rank = np.empty(chunk.shape, float)
+                    np.put_along_axis(rank, order, sortedRank, axis=0)
+                    rank[np.isnan(chunk)] = np.nan
+                    results['rank'][:, start:end] = rank
+            del maps
+            # Write out the results, one run (and so one map) at a time.
+            outfiles = {}
+            plotDict = dict((k, v) for k, v in baseline.plotDict.items()
+                            if k not in ('colorMin', 'colorMax', 'xMin', 'xMax', 'yMin', 'yMax',
+                                         'zp', 'normVal', 'percentileClip'))
+            for c in comparisons:
+                for i, r in enumerate(runlist):
+                    values = np.array(results[c][i])
+                    mask = np.isnan(values)
+                    values[mask] = baseline.slicer.badval
+                    bundle = mb.createEmptyMetricBundle()
+                    bundle.slicer = baseline.slicer
+                    bundle.metric.name = '%s %s vs %s' % (baseline.metric.name, c, baselineRun)
+                    bundle.runName = r
+                    bundle.constraint = baseline.constraint
+                    bundle.metadata = baseline.metadata
+                    bundle.setPlotDict(plotDict)
+                    bundle.setDisplayDict(baseline.displayDict)
+                    bundle.metricValues = ma.MaskedArray(data=values, mask=mask,
+                                                         fill_value=baseline.slicer.badval)
+                    bundle._buildFileRoot()
+                    bundle.write(outDir=outDir, resultsDb=resultsDb)
+                    outfiles[(r, c)] = os.path.join(outDir, bundle.fileRoot + '.npz')
+            del results
+        finally:
+            shutil.rmtree(scratchDir)
+        return outfiles
+
     # Plot actual metric values (skymaps or histograms or power spectra) (values not stored in class).
     def readMetricData(self, metricName, metricMetadata, slicerName):
         # Get the names of the individual files for all runs.
@@ -0,0 +1,211 @@
+from builtins import object
+import os
+import json
+import warnings
+import sqlite3
+from urllib.parse import quote
+import pandas as pd
+
+__all__ = ['SummaryStatWarehouse']
+
+
+class SummaryStatWarehouse(object):
+    """A single (indexed) sqlite database holding the metric information and summary statistics
+    gathered from many MAF results databases, for fast comparisons of hundreds of runs.
+
+    Each resultsDb is copied into the warehouse when first added, and copied again only when its
+    modification time changes; rows are identified by the (real) path of their resultsDb.
+
+    Parameters
+    ----------
+    database : str, opt
+        The sqlite file to hold the warehouse. If this already exists, it is updated.
+        Default None uses an in-memory database (rebuilt each time).
+    """
+    def __init__(self, database=None):
+        if database is None:
+            database = ':memory:'
+        self.database = database
+        # uri=True allows the resultsDbs to be attached read-only.
+        self.connection = sqlite3.connect(database, uri=True)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS resultsdbs (dbId INTEGER PRIMARY KEY, resultsDb TEXT UNIQUE,
+                                                   mtime REAL);
+            CREATE TABLE IF NOT EXISTS metrics (dbId INTEGER, metricId INTEGER, metricName TEXT,
+                                                slicerName TEXT, simDataName TEXT, sqlConstraint TEXT,
+                                                metricMetadata TEXT, metricDataFile TEXT);
+            CREATE TABLE IF NOT EXISTS summarystats (dbId INTEGER, statId INTEGER, metricId INTEGER,
+                                                     summaryName TEXT, summaryValue REAL);
+            CREATE INDEX IF NOT EXISTS metrics_name ON metrics (metricName, metricMetadata, slicerName);
+            CREATE INDEX IF NOT EXISTS metrics_id ON metrics (dbId, metricId);
+            CREATE INDEX IF NOT EXISTS summarystats_id ON summarystats (dbId, metricId);
+            """)
+
+    def close(self):
+        """Close the connection to the warehouse."""
+        self.connection.close()
+
+    @staticmethod
+    def _mtime(resultsDb):
+        # Include the write-ahead log, which holds recent changes to the resultsDb
+        # (reading a resultsDb can leave an empty log behind, which does not count).
+        mtime = os.path.getmtime(resultsDb)
+        wal = resultsDb + '-wal'
+        if os.path.isfile(wal) and os.path.getsize(wal) > 0:
+            mtime = max(mtime, os.path.getmtime(wal))
+        return mtime
+
+    def update(self, resultsDbs):
+        """Add (or refresh, if modified since they were added) resultsDbs to the warehouse.
+
+        Parameters
+        ----------
+        resultsDbs : list of str
+            The paths to the resultsDb files.
+
+        Returns
+        -------
+        int
+            The number of resultsDbs which were (re-)read.
+        """
+        nRead = 0
+        for resultsDb in resultsDbs:
+            resultsDb = os.path.realpath(resultsDb)
+            mtime = self._mtime(resultsDb)
+            row = self.connection.execute('SELECT dbId, mtime FROM resultsdbs WHERE resultsDb = ?',
+                                          (resultsDb,)).fetchone()
+            if row is not None and row[1] == mtime:
+                continue
+            self.connection.execute('ATTACH DATABASE ? AS src', ('file:%s?mode=ro' % quote(resultsDb),))
+            try:
+                with self.connection:
+                    if row is None:
+                        dbId = self.connection.execute('INSERT INTO resultsdbs (resultsDb, mtime) '
+                                                       'VALUES (?, ?)', (resultsDb, mtime)).lastrowid
+                    else:
+                        dbId = row[0]
+                        self.connection.execute('DELETE FROM metrics WHERE dbId = ?', (dbId,))
+                        self.connection.execute('DELETE FROM summarystats WHERE dbId = ?', (dbId,))
+                        self.connection.execute('UPDATE resultsdbs SET mtime = ? WHERE dbId = ?',
+                                                (mtime, dbId))
+                    self.connection.execute('INSERT INTO metrics SELECT ?, metricId, metricName, slicerName, '
+                                            'simDataName, sqlConstraint, metricMetadata, metricDataFile '
+                                            'FROM src.metrics', (dbId,))
+                    self.connection.execute('INSERT INTO summarystats SELECT ?, statId, metricId, '
+                                            'summaryName, summaryValue FROM src.summarystats', (dbId,))
+                nRead += 1
+            except sqlite3.DatabaseError as e:
+                warnings.warn('Could not read the results database %s: %s' % (resultsDb, e))
+            finally:
+                self.connection.execute('DETACH DATABASE src')
+        return nRead
+
+    def _where(self, resultsDbs, equal, like=None):
+        """Build the WHERE clause (and parameters) matching resultsDbs and the metric columns."""
+        clauses = []
+        params = []
+        if resultsDbs is not None:
+            resultsDbs = [os.path.realpath(r) for r in resultsDbs]
+            clauses.append('d.resultsDb IN (SELECT value FROM json_each(?))')
+            params.append(json.dumps(resultsDbs))
+        for col, value in equal.items():
+            if value is not None:
+                clauses.append('%s = ?' % col)
+                params.append(value)
+        if like is not None:
+            for col, value in like.items():
+                if value is not None:
+                    clauses.append('%s LIKE ?' % col)
+                    params.append('%' + str(value) + '%')
+        if len(clauses) == 0:
+            return '', params
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def getMetrics(self, resultsDbs=None, metricName=None, metricMetadata=None, slicerName=None,
+                   metricNameLike=None, metricMetadataLike=None, slicerNameLike=None):
+        """Return the metrics (optionally matching the names, or 'like' the names) in resultsDbs.
+
+        Parameters
+        ----------
+        resultsDbs : list of str, opt
+            Return metrics from these resultsDbs only. Default None, all resultsDbs in the warehouse.
+        metricName, metricMetadata, slicerName : str, opt
+            Return metrics with exactly these values only.
+        metricNameLike, metricMetadataLike, slicerNameLike : str, opt
+            Return metrics where these values contain the strings only.
+
+        Returns
+        -------
+        pandas.DataFrame
+            With columns resultsDb, metricId, metricName, metricMetadata, slicerName, metricDataFile,
+            ordered by resultsDb and metricId.
+        """
+        where, params = self._where(resultsDbs,
+                                    {'m.metricName': metricName, 'm.metricMetadata': metricMetadata,
+                                     'm.slicerName': slicerName},
+                                    {'m.metricName': metricNameLike, 'm.metricMetadata': metricMetadataLike,
+                                     'm.slicerName': slicerNameLike})
+        query = ('SELECT d.resultsDb, m.metricId, m.metricName, m.metricMetadata, m.slicerName, '
+                 'm.metricDataFile FROM metrics m JOIN resultsdbs d ON m.dbId = d.dbId' + where +
+                 ' ORDER BY d.resultsDb, m.metricId')
+        return pd.read_sql(query, self.connection, params=params)
+
+    def getSummaryStats(self, resultsDbs=None, metricName=None, metricMetadata=None, slicerName=None,
+                        summaryName=None):
+        """Return all of the summary statistics (optionally matching the names) in resultsDbs,
+        with a single query.
+
+        Parameters
+        ----------
+        resultsDbs : list of str, opt
+            Return summary stats from these resultsDbs only. Default None, all resultsDbs.
+        metricName, metricMetadata, slicerName, summaryName : str, opt
+            Return summary stats with exactly these values only.
+
+        Returns
+        -------
+        pandas.DataFrame
+            With columns resultsDb, metricId, metricName, metricMetadata, slicerName, statId,
+            summaryName, summaryValue; ordered by resultsDb, metricId and statId.
+        """
+        where, params = self._where(resultsDbs,
+                                    {'m.metricName': metricName, 'm.metricMetadata': metricMetadata,
+                                     'm.slicerName': slicerName, 's.summaryName': summaryName})
+        query = ('SELECT d.resultsDb, m.metricId, m.metricName, m.metricMetadata, m.slicerName, '
+                 's.statId, s.summaryName, s.summaryValue FROM summarystats s '
+                 'JOIN metrics m ON s.dbId = m.dbId AND s.metricId = m.metricId '
+                 'JOIN resultsdbs d ON s.dbId = d.dbId' + where +
+                 ' ORDER BY d.resultsDb, m.metricId, s.statId')
+        return pd.read_sql(query, self.connection, params=params)
+
+    def statTable(self, resultsDbs=None, labels=None, **kwargs):
+        """Return the summary statistics as a (resultsDb x statistic) table.
+
+        Parameters
+        ----------
+        resultsDbs : list of str, opt
+            The resultsDbs to include. Default None, all resultsDbs.
+        labels : list of str, opt
+            Labels (such as the run names) to use for the index, in place of the resultsDb paths
+            (one per resultsDb). Rows with the same label are combined (the later resultsDb wins).
+        **kwargs
+            Passed to getSummaryStats, to select the statistics.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Indexed by resultsDb (or label), with columns (metricName, metricMetadata, slicerName,
+            summaryName).
+        """
+        stats = self.getSummaryStats(resultsDbs=resultsDbs, **kwargs)
+        if labels is not None:
+            if resultsDbs is None or len(labels) != len(resultsDbs):
+                raise ValueError('labels must match resultsDbs (one label per resultsDb).')
+            labelMap = dict(zip([os.path.realpath(r) for r in resultsDbs], labels))
+            stats['resultsDb'] = stats['resultsDb'].map(labelMap)
+        cols = ['metricName', 'metricMetadata', 'slicerName', 'summaryName']
+        stats = stats.drop_duplicates(subset=['resultsDb'] + cols, keep='last')
+        table = stats.pivot(index='resultsDb', columns=cols, values='summaryValue')
+        if labels is not None:
+            table = table.reindex(pd.unique(pd.Series(labels)))
+        return table
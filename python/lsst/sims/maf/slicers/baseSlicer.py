@@ -88,6 +88,9 @@ class BaseSlicer(with_metaclass(SlicerRegistry, object)):
         self.plotFuncs = []
         # Note if the slicer needs OpSim field ID info
         self.needsFields = False
+        # Note if the slicer guarantees the indexes for each slice are in increasing order
+        # (so that the slices of time-ordered simData are also time-ordered).
+        self.sortedIdxs = False
         # Set the y-axis range be on the two-d plot
         if self.nslice is not None:
             self.spatialExtent = [0,self.nslice-1]
@@ -71,6 +71,7 @@ class BaseSpatialSlicer(BaseSlicer):
         self.rotSkyPosColName = rotSkyPosColName
         self.mjdColName = mjdColName
         self.columnsNeeded = [lonCol, latCol]
+        self.sortedIdxs = True
         self.useCamera = useCamera
         if useCamera:
             self.columnsNeeded.append(rotSkyPosColName)
@@ -132,7 +133,7 @@ class BaseSpatialSlicer(BaseSlicer):
                 sx, sy, sz = simsUtils._xyz_from_ra_dec(self.slicePoints['ra'][islice],
                                                         self.slicePoints['dec'][islice])
                 # Query against tree.
-                indices = self.opsimtree.query_ball_point((sx, sy, sz), self.rad)
+                indices = self.opsimtree.query_ball_point((sx, sy, sz), self.rad, return_sorted=True)
 
             # Loop through all the slicePoint keys. If the first dimension of slicepoint[key] has
             # the same shape as the slicer, assume it is information per slicepoint.
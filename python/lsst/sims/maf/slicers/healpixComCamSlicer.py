@@ -130,6 +130,8 @@ class HealpixComCamSlicer(HealpixSlicer):
                     # Check if the slicepoint is inside the image corners and append to list
                     if bbPath.contains_point((0., 0.)):
                         indices.append(ind)
+                # Return the indexes in increasing order, as the other spatial slicers do.
+                indices = sorted(indices)
 
             # Loop through all the slicePoint keys. If the first dimension of slicepoint[key] has
             # the same shape as the slicer, assume it is information per slicepoint.
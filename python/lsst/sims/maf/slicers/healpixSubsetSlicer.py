@@ -194,7 +194,7 @@ class HealpixSubsetSlicer(BaseSpatialSlicer):
                 sx, sy, sz = simsUtils._xyz_from_ra_dec(self.slicePoints['ra'][islice],
                                                         self.slicePoints['dec'][islice])
                 # Query against tree.
-                indices = self.opsimtree.query_ball_point((sx, sy, sz), self.rad)
+                indices = self.opsimtree.query_ball_point((sx, sy, sz), self.rad, return_sorted=True)
 
             # Loop through all the slicePoint keys. If the first dimension of slicepoint[key] has
             # the same shape as the slicer, assume it is information per slicepoint.
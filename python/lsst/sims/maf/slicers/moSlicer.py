@@ -1,3 +1,4 @@
+import warnings
 import numpy as np
 import pandas as pd
 
@@ -20,17 +21,28 @@ class MoObjSlicer(BaseSlicer):
     ----------
     Hrange : numpy.ndarray or None
         The H values to clone the orbital parameters over. If Hrange is None, will not clone orbits.
+    orbitFile : str or None, optional
+        The name of the orbit file, as saved with the metric values (the file is not read;
+        use setupSlicer to read the orbits). Default None.
+    obsFile : str or None, optional
+        The name of the observation file, as saved with the metric values. Default None.
     """
-    def __init__(self, Hrange=None, verbose=True, badval=0):
+    def __init__(self, Hrange=None, verbose=True, badval=0, orbitFile=None, obsFile=None):
         super(MoObjSlicer, self).__init__(verbose=verbose, badval=badval)
         self.Hrange = Hrange
         self.slicer_init = {'Hrange': Hrange, 'badval': badval}
+        # The file names are restored with the slicer when reading metric values from disk.
+        self.orbitFile = orbitFile
+        self.obsFile = obsFile
+        if orbitFile is not None:
+            self.slicer_init['orbitFile'] = orbitFile
+            self.slicer_init['obsFile'] = obsFile
         # Set default plotFuncs.
         self.plotFuncs = [MetricVsH(),
                           MetricVsOrbit(xaxis='q', yaxis='e'),
                           MetricVsOrbit(xaxis='q', yaxis='inc')]
 
-    def setupSlicer(self, orbitFile, delim=None, skiprows=None, obsFile=None):
+    def setupSlicer(self, orbitFile, delim=None, skiprows=None, obsFile=None, idxRange=None):
         """Set up the slicer and read orbitFile and obsFile from disk.
 
         Sets self.orbits (with orbit parameters), self.allObs, and self.obs
@@ -44,8 +56,11 @@ class MoObjSlicer(BaseSlicer):
         obsFile : str, optional
             The file containing the observations of each object, optional.
             If not provided (default, None), then the slicer will not be able to 'slice', but can still plot.
+        idxRange : tuple of int, optional
+            Only use the orbits with index idxRange[0] <= index < idxRange[1] in orbitFile
+            (such as for a sharded worker). Default None uses all orbits.
         """
-        self.readOrbits(orbitFile, delim=delim, skiprows=skiprows)
+        self.readOrbits(orbitFile, delim=delim, skiprows=skiprows, idxRange=idxRange)
         if obsFile is not None:
             self.readObs(obsFile)
         else:
@@ -56,10 +71,10 @@ class MoObjSlicer(BaseSlicer):
         self.slicer_init['orbitFile'] = self.orbitFile
         self.slicer_init['obsFile'] = self.obsFile
 
-    def readOrbits(self, orbitFile, delim=None, skiprows=None):
+    def readOrbits(self, orbitFile, delim=None, skiprows=None, idxRange=None):
         # Use sims_movingObjects to read orbit files.
         orb = Orbits()
-        orb.readOrbits(orbitFile, delim=delim, skiprows=skiprows)
+        orb.readOrbits(orbitFile, delim=delim, skiprows=skiprows, idxRange=idxRange)
         self.orbitFile = orbitFile
         self.orbits = orb.orbits
         # Then go on as previously. Need to refactor this into 'setupSlicer' style.
@@ -102,6 +117,44 @@ class MoObjSlicer(BaseSlicer):
             self.allObs.drop('index', axis=1, inplace=True)
         self.subsetObs()
 
+    def runObsStackers(self, stackerList):
+        """Run moving object stackers once over all of the observations in self.obs.
+
+        Stackers which do not depend on H (Hdependent = False) then do not need to be run again
+        for each object and H value; H-dependent stackers precompute what they can.
+        The stackers are run on a copy of self.obs, which then replaces self.obs, so the new columns
+        are not added to self.allObs.
+
+        Parameters
+        ----------
+        stackerList : list of lsst.sims.maf.stackers.BaseMoStacker
+
+        Returns
+        -------
+        bool
+            True if the stackers were run over all observations. False if they were not (there were no
+            observations, or the orbits have duplicate objIds with different H values, so the reference
+            H of each observation is ambiguous), and all stackers must be run for each object.
+        """
+        if self.obs is None or len(self.obs) == 0:
+            return False
+        # The reference H value for each observation comes from the orbit of the matching object.
+        orbits = self.orbits[['objId', 'H']]
+        if orbits['objId'].duplicated().any():
+            if (orbits.groupby('objId')['H'].nunique() > 1).any():
+                warnings.warn('Orbits with the same objId have different H values; '
+                              'running the moving object stackers for each object instead.')
+                return False
+            # Duplicated orbits with the same H give the same reference H for their observations.
+            orbits = orbits.drop_duplicates('objId')
+        orbitH = pd.Series(orbits['H'].values, index=orbits['objId'].values)
+        Href = self.obs['objId'].map(orbitH).values
+        obs = self.obs.copy()
+        for s in stackerList:
+            obs = s.runObs(obs, Href)
+        self.obs = obs
+        return True
+
     def subsetObs(self, pandasConstraint=None):
         """
         Choose a subset of all the observations, such as those in a particular time period.
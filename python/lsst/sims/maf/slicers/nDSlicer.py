@@ -23,6 +23,7 @@ class NDSlicer(BaseSlicer):
          or a list of integers (one per column in sliceColList) or a single value
             (repeated for all columns, default=100)."""
         super(NDSlicer, self).__init__(verbose=verbose)
+        self.sortedIdxs = True
         self.bins = None
         self.nslice = None
         self.sliceColList = sliceColList
@@ -102,7 +103,7 @@ class NDSlicer(BaseSlicer):
             binIdxs = self.slicePoints['binIdxs'][islice]
             for d, i in zip(list(range(self.nD)), binIdxs):
                 simIdxsList.append(set(self.simIdxs[d][self.lefts[d][i]:self.lefts[d][i+1]]))
-            idxs = list(set.intersection(*simIdxsList))
+            idxs = sorted(set.intersection(*simIdxsList))
             return {'idxs':idxs,
                     'slicePoint':{'sid':islice,
                                   'binLeft':self.slicePoints['bins'][islice],
@@ -31,6 +31,7 @@ class OneDSlicer(BaseSlicer):
         super(OneDSlicer, self).__init__(verbose=verbose, badval=badval)
         self.sliceColName = sliceColName
         self.columnsNeeded = [sliceColName]
+        self.sortedIdxs = True
         self.bins = bins
         self.binMin = binMin
         self.binMax = binMax
@@ -101,6 +102,9 @@ class OneDSlicer(BaseSlicer):
         # "left" values are location where simdata == bin value
         self.left = np.searchsorted(simFieldsSorted, self.bins[:-1], 'left')
         self.left = np.concatenate((self.left, np.array([len(self.simIdxs),])))
+        # Sort the indexes within each slice (once), so that slices of time-ordered simData are time-ordered.
+        sliceId = np.searchsorted(self.left, np.arange(len(self.simIdxs)), 'right')
+        self.simIdxs = self.simIdxs[np.lexsort((self.simIdxs, sliceId))]
         # Set up _sliceSimData method for this class.
         @wraps(self._sliceSimData)
         def _sliceSimData(islice):
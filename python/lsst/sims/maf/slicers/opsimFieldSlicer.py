@@ -75,6 +75,7 @@ class OpsimFieldSlicer(BaseSpatialSlicer):
                             'fieldDecColName': fieldDecColName, 'badval': badval}
         self.plotFuncs = [BaseSkyMap, OpsimHistogram]
         self.needsFields = True
+        self.sortedIdxs = True
 
     def setupSlicer(self, simData, fieldData, maps=None):
         """Set up opsim field slicer object.
@@ -107,8 +108,8 @@ class OpsimFieldSlicer(BaseSpatialSlicer):
             self.slicePoints['dec'] = fieldData[self.fieldDecColName][idxs]
         self.nslice = len(self.slicePoints['sid'])
         self._runMaps(maps)
-        # Set up data slicing.
-        self.simIdxs = np.argsort(simData[self.simDataFieldIdColName])
+        # Set up data slicing. A stable sort keeps the indexes within each field in increasing order.
+        self.simIdxs = np.argsort(simData[self.simDataFieldIdColName], kind='mergesort')
         simFieldsSorted = np.sort(simData[self.simDataFieldIdColName])
         self.left = np.searchsorted(simFieldsSorted, self.slicePoints['sid'], 'left')
         self.right = np.searchsorted(simFieldsSorted, self.slicePoints['sid'], 'right')
@@ -1,3 +1,5 @@
+import os
+import json
 import warnings
 import numpy as np
 import pandas as pd
@@ -12,7 +14,14 @@ class Orbits(object):
 
     self.orbits stores the orbital parameters, as a pandas dataframe.
     self.dataCols defines the columns required, although objId, H, g, and sed_filename are optional.
+
+    Validated orbits can be saved with writeOrbits in a binary orbit catalog format (a directory
+    containing the orbits as a typed numpy array plus a json header with the orbit format),
+    which readOrbits can then load via memory map without re-parsing or re-validating the orbits.
     """
+    # Suffix for binary orbit catalogs.
+    binarySuffix = '.orbits'
+
     def __init__(self):
         self.orbits = None
         self.orb_format = None
@@ -209,7 +218,67 @@ class Orbits(object):
         sedvals = np.where(chance <= prob_c, 'C.dat', 'S.dat')
         return sedvals
 
-    def readOrbits(self, orbitfile, delim=None, skiprows=None):
+    def writeOrbits(self, outfile):
+        """Write the (already validated) orbits to disk as a binary orbit catalog.
+
+        The catalog is a directory containing 'orbits.npy' (the orbits as a typed, structured numpy array,
+        including the assigned sed_filename values) and 'header.json' (the orbit format and column names).
+
+        Parameters
+        ----------
+        outfile : str
+            The output directory name. The suffix '.orbits' is added if not already present.
+
+        Returns
+        -------
+        str
+            The name of the output directory.
+        """
+        if self.orbits is None:
+            raise ValueError('No orbits to write; use readOrbits or setOrbits first.')
+        if not outfile.endswith(self.binarySuffix):
+            outfile = outfile + self.binarySuffix
+        if not os.path.isdir(outfile):
+            os.makedirs(outfile)
+        columns = [str(col) for col in self.orbits.columns]
+        values = {}
+        for col in columns:
+            vals = self.orbits[col].values
+            # Store strings (such as objId and sed_filename) as fixed width unicode, not objects.
+            if vals.dtype == 'object':
+                vals = vals.astype(str)
+            values[col] = vals
+        orbits = np.empty(len(self.orbits), dtype=[(col, values[col].dtype) for col in columns])
+        for col in columns:
+            orbits[col] = values[col]
+        np.save(os.path.join(outfile, 'orbits.npy'), orbits)
+        header = {'orb_format': self.orb_format, 'nSso': len(orbits), 'columns': columns}
+        with open(os.path.join(outfile, 'header.json'), 'w') as f:
+            json.dump(header, f)
+        return outfile
+
+    def _readBinaryOrbits(self, orbitdir, idxRange=None):
+        """Read orbits from a binary orbit catalog (written by writeOrbits).
+
+        These orbits were validated before they were written, so only the header is checked here.
+        The orbits are memory-mapped, so only the objects in idxRange are read from disk.
+        """
+        with open(os.path.join(orbitdir, 'header.json'), 'r') as f:
+            header = json.load(f)
+        orb_format = header['orb_format']
+        missing = set(self.dataCols[orb_format]) - set(header['columns'])
+        if len(missing) > 0:
+            raise ValueError('Missing required orbital elements %s for orbital format type %s in %s'
+                             % (missing, orb_format, orbitdir))
+        orbits = np.load(os.path.join(orbitdir, 'orbits.npy'), mmap_mode='r', allow_pickle=False)
+        if idxRange is not None:
+            orbits = orbits[idxRange[0]:idxRange[1]]
+        if len(orbits) == 0:
+            raise ValueError('Length of the orbits dataframe was 0.')
+        self.orbits = pd.DataFrame({col: np.array(orbits[col]) for col in header['columns']})
+        self.orb_format = orb_format
+
+    def readOrbits(self, orbitfile, delim=None, skiprows=None, idxRange=None):
         """Read orbits from a file, generating a pandas dataframe containing columns matching dataCols,
         for the appropriate orbital parameter format (currently accepts COM, KEP or CAR formats).
 
@@ -221,6 +290,9 @@ class Orbits(object):
         unless skiprows = -1 or there is just no header line at all.
         in which case it is assumed to be a standard DES format file, with no header line.
 
+        If orbitfile is a binary orbit catalog (as written by writeOrbits), the orbits are instead
+        memory-mapped and used directly, without re-validation.
+
         Parameters
         ----------
         orbitfile : str
@@ -230,7 +302,14 @@ class Orbits(object):
         skiprows : int, optional
             The number of rows to skip before reading the header information for pandas.
             Default is None, which will trigger a check of the file to look for the header columns.
+        idxRange : tuple of int, optional
+            Only use the objects with index idxRange[0] <= index < idxRange[1] in the orbit file.
+            Default None uses all objects. (For a binary orbit catalog, only this range is read from disk).
         """
+        if os.path.isdir(orbitfile):
+            self._readBinaryOrbits(orbitfile, idxRange=idxRange)
+            return
+
         names = None
 
         # If skiprows is set, then we will assume the user has handled this so that the
@@ -343,6 +422,8 @@ class Orbits(object):
                 ssoCols[idx] = name
         # Assign the new column names back to the orbits dataframe.
         orbits.columns = ssoCols
+        if idxRange is not None:
+            orbits = orbits.iloc[idxRange[0]:idxRange[1]]
         # Validate and assign orbits to self.
         self.setOrbits(orbits)
 
@@ -17,6 +17,7 @@ class UniSlicer(BaseSlicer):
         self.shape = self.nslice
         self.slicePoints['sid'] = np.array([0,], int)
         self.plotFuncs = []
+        self.sortedIdxs = True
 
     def setupSlicer(self, simData, maps=None):
         """Use simData to set indexes to return."""
@@ -8,7 +8,15 @@ __all__ = ['BaseMoStacker', 'MoMagStacker', 'CometMagVStacker', 'EclStacker']
 class BaseMoStacker(BaseStacker):
     """Base class for moving object (SSobject)  stackers. Relevant for MoSlicer ssObs (pd.dataframe).
 
-    Provided to add moving-object specific API for 'run' method of moving object stackers."""
+    Provided to add moving-object specific API for 'run' method of moving object stackers.
+
+    Moving object stackers can also be run once over the observations of all objects (runObs),
+    before slicing. Stackers which do not depend on the (cloned) H value (Hdependent = False) are then
+    complete, and do not need to be run for each object and H value. Stackers which do depend on H can
+    use runObs to precompute their H-independent parts."""
+    # Flag whether the columns added by the stacker depend on the current (cloned) H value.
+    Hdependent = True
+
     def run(self, ssoObs, Href, Hval=None):
         # Redefine this here, as the API does not match BaseStacker.
         if Hval is None:
@@ -23,12 +31,43 @@ class BaseMoStacker(BaseStacker):
         # columns anymore (for different H values).
         return self._run(ssoObs, Href, Hval)
 
+    def runObs(self, obs, Href):
+        """Run the stacker over the observations of all objects at once.
+
+        Parameters
+        ----------
+        obs : pandas.DataFrame
+            The observations of all objects (such as MoObjSlicer.obs). Columns are added in place.
+        Href : numpy.ndarray
+            The reference H value of the object for each observation.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        if len(obs) == 0:
+            return obs
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            obs = self._runObs(obs, Href)
+        return obs
+
+    def _runObs(self, obs, Href):
+        # Stackers which do not depend on H can just be run over all of the observations (pandas
+        # will add the new columns). H-dependent stackers should override this, if they have
+        # parts which can be precomputed.
+        if not self.Hdependent:
+            obs = self._run(obs, Href, Href)
+        return obs
+
 
 class MoMagStacker(BaseMoStacker):
     """Add columns relevant to SSobject apparent magnitudes and visibility to the slicer ssoObs
     dataframe, given a particular Href and current Hval.
 
     Specifically, this stacker adds magLimit, appMag, SNR, and vis.
+    When run over all observations first (runObs), the apparent magnitudes at Href are stored
+    (as appMagVRef_<vMagCol>_<lossCol> and appMagRef_<vMagCol>_<colorCol>_<lossCol>), so that the apparent magnitudes at each Hval are then simply offsets.
     magLimit indicates the appropriate limiting magnitude to consider for a particular object in a particular
     observation, when combined with the losses due to detection (dmagDetect) or trailing (dmagTrail).
     appMag adds the apparent magnitude in the filter of the current object, at the current Hval.
@@ -70,12 +109,31 @@ class MoMagStacker(BaseMoStacker):
         self.randomSeed = randomSeed
         self.colsReq = [self.m5Col, self.vMagCol, self.colorCol, self.lossCol]
         self.units = ['mag', 'mag', 'SNR', '']
+        # The columns holding the apparent magnitudes at Href (added by runObs), named after the
+        # columns used, so that stackers with different vMagCol/colorCol/lossCol do not share them.
+        self.appMagVRefCol = 'appMagVRef_%s_%s' % (self.vMagCol, self.lossCol)
+        self.appMagRefCol = 'appMagRef_%s_%s_%s' % (self.vMagCol, self.colorCol, self.lossCol)
+
+    def _runObs(self, obs, Href):
+        # Apparent magnitudes at Href, which do not depend on the current Hval.
+        obs[self.appMagVRefCol] = obs[self.vMagCol] + obs[self.lossCol]
+        obs[self.appMagRefCol] = obs[self.vMagCol] + obs[self.colorCol] + obs[self.lossCol]
+        return obs
 
     def _run(self, ssoObs, Href, Hval):
         # Hval = current H value (useful if cloning over H range), Href = reference H value from orbit.
         # Without cloning, Href = Hval.
-        ssoObs['appMagV'] = ssoObs[self.vMagCol] + ssoObs[self.lossCol] + Hval - Href
-        ssoObs['appMag'] = ssoObs[self.vMagCol] + ssoObs[self.colorCol] + ssoObs[self.lossCol] + Hval - Href
+        if isinstance(ssoObs, np.ndarray):
+            precomputed = self.appMagRefCol in (ssoObs.dtype.names or ())
+        else:
+            precomputed = self.appMagRefCol in ssoObs.columns
+        if precomputed:
+            ssoObs['appMagV'] = ssoObs[self.appMagVRefCol] + Hval - Href
+            ssoObs['appMag'] = ssoObs[self.appMagRefCol] + Hval - Href
+        else:
+            ssoObs['appMagV'] = ssoObs[self.vMagCol] + ssoObs[self.lossCol] + Hval - Href
+            ssoObs['appMag'] = (ssoObs[self.vMagCol] + ssoObs[self.colorCol] + ssoObs[self.lossCol]
+                                + Hval - Href)
         xval = np.power(10, 0.5 * (ssoObs['appMag'] - ssoObs[self.m5Col]))
         ssoObs['SNR'] = 1.0 / np.sqrt((0.04 - self.gamma) * xval + self.gamma * xval * xval)
         completeness = 1.0 / (1 + np.exp((ssoObs['appMag'] - ssoObs[self.m5Col])/self.sigma))
@@ -110,6 +168,8 @@ class CometMagVStacker(BaseMoStacker):
         The column name for the geocentric distance. Default 'geo_dist'.
     """
     colsAdded = ['cometV']
+    # cometV depends only on Href, so can be calculated for all observations at once.
+    Hdependent = False
 
     def __init__(self, k=2, rhCol='helio_dist', deltaCol='geo_dist'):
         self.units = ['mag']  # new column units
@@ -139,6 +199,7 @@ class EclStacker(BaseMoStacker):
         Flag indicating whether RA/Dec are in degrees. Default True.
     """
     colsAdded = ['ecLat', 'ecLon']
+    Hdependent = False
 
     def __init__(self, raCol='ra', decCol='dec', inDeg=True):
         self.raCol = raCol
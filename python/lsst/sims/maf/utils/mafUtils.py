@@ -1,9 +1,12 @@
+import struct
+import zipfile
 import numpy as np
 import healpy as hp
 import warnings
 
 __all__ = ['optimalBins', 'percentileClipping',
-           'gnomonic_project_toxy', 'radec2pix']
+           'gnomonic_project_toxy', 'radec2pix', 'segmentByNight', 'crowdingErrorPerSeeing',
+           'readNpzArray']
 
 
 def optimalBins(datain, binmin=None, binmax=None, nbinMax=200, nbinMin=1):
@@ -138,3 +141,104 @@ def radec2pix(nside, ra, dec):
     lat = np.pi/2. - dec
     hpid = hp.ang2pix(nside, lat, ra )
     return hpid
+
+
+def segmentByNight(times, nights):
+    """
+    Sort visits by night (and by time within each night), and find where each night starts and ends.
+
+    After sorting, the visits in night uniqueNights[i] are order[nightBounds[i]:nightBounds[i+1]].
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        The times of the visits.
+    nights : numpy.ndarray
+        The nights of the visits.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray
+        The indexes which sort the visits by night and time, the unique (sorted) nights,
+        and the boundaries of each night in the sorted visits (length = number of unique nights + 1).
+    """
+    order = np.lexsort((times, nights))
+    sortedNights = np.asarray(nights)[order]
+    uniqueNights = np.unique(sortedNights)
+    nightBounds = np.searchsorted(sortedNights, uniqueNights)
+    nightBounds = np.concatenate([nightBounds, [len(sortedNights)]])
+    return order, uniqueNights, nightBounds
+
+
+def crowdingErrorPerSeeing(magVector, lumFunc):
+    """
+    Calculate the photometric crowding error, for one arcsecond seeing, given the luminosity function.
+
+    The crowding error is proportional to the seeing, so the crowding error for any seeing value is
+    this table multiplied by the seeing (in arcseconds).
+    Equation from Olsen, Blum, & Rigaut 2003, AJ, 126, 452.
+
+    Parameters
+    ----------
+    magVector : numpy.ndarray
+        Stellar magnitudes (the lower edges of the luminosity function bins).
+    lumFunc : numpy.ndarray
+        Stellar luminosity function. This can be a 2-d array (such as the luminosity function
+        at each healpixel, as in the StellarDensityMap), with the magnitude bins along the last axis.
+
+    Returns
+    -------
+    numpy.ndarray
+        Magnitude uncertainties for one arcsecond seeing, with the same shape as lumFunc.
+    """
+    lumAreaArcsec = 3600.0 ** 2
+    lumVector = 10 ** (-0.4 * np.asarray(magVector))
+    coeff = np.sqrt(np.pi / lumAreaArcsec) / 2.
+    myInt = np.flip(np.cumsum(np.flip(lumVector ** 2 * lumFunc, axis=-1), axis=-1), axis=-1)
+    return coeff * np.sqrt(myInt) / lumVector
+
+
+def readNpzArray(filename, key):
+    """
+    Read a single array from a (numpy.savez) npz file, memory-mapping it if possible.
+
+    Arrays stored uncompressed in the npz file (as by numpy.savez) and without python objects are
+    memory-mapped in place, so only the parts which are used are read from disk;
+    otherwise the array is read into memory.
+
+    Parameters
+    ----------
+    filename : str
+        The npz file.
+    key : str
+        The name of the array within the npz file.
+
+    Returns
+    -------
+    numpy.ndarray or numpy.memmap or None
+        The (read-only) array, or None if the stored value was None (such as a missing mask).
+    """
+    name = key + '.npy'
+    with zipfile.ZipFile(filename) as zf:
+        info = zf.getinfo(name)
+        with zf.open(name) as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            headerSize = f.tell()
+    if dtype.hasobject or info.compress_type != zipfile.ZIP_STORED or len(shape) == 0:
+        with np.load(filename, allow_pickle=True) as restored:
+            arr = restored[key]
+        if arr.dtype.hasobject and arr.shape == () and arr[()] is None:
+            return None
+        return arr
+    # Find the start of the data within the zip file, after the local file header of this member.
+    with open(filename, 'rb') as f:
+        f.seek(info.header_offset)
+        localHeader = f.read(30)
+    nameLen, extraLen = struct.unpack('<HH', localHeader[26:30])
+    offset = info.header_offset + 30 + nameLen + extraLen + headerSize
+    return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran else 'C')
@@ -2,6 +2,7 @@ from builtins import zip
 from builtins import object
 import os
 import re
+import threading
 from collections import OrderedDict
 import numpy as np
 import lsst.sims.maf.db as db
@@ -9,6 +10,14 @@ import lsst.sims.maf.metricBundles as metricBundles
 
 __all__ = ['MafRunResults']
 
+
+def _indexRows(values):
+    """Return a dictionary of the (increasing) row indexes in values with each unique value."""
+    order = np.argsort(values, kind='mergesort')
+    keys, starts = np.unique(values[order], return_index=True)
+    return dict(zip(keys.tolist(), np.split(order, starts[1:])))
+
+
 class MafRunResults(object):
     """
     Class to read MAF's resultsDb_sqlite.db and organize the output for display on web pages.
@@ -48,7 +57,11 @@ class MafRunResults(object):
         # Read in the results database.
         if resultsDb is None:
             resultsDb = os.path.join(self.outDir, 'resultsDb_sqlite.db')
-        database = db.ResultsDb(database=resultsDb)
+        self.resultsDbFile = resultsDb
+        # Record the modification time before reading, so changes made while reading make the run stale.
+        self.resultsDbMtime = self._resultsDbMtime()
+        # Read an existing resultsDb read-only, so that reading it does not modify it.
+        database = db.ResultsDb(database=resultsDb, readOnly=os.path.isfile(resultsDb))
 
         # Get the metric and display info (1-1 match)
         self.metrics = database.getMetricDisplayInfo()
@@ -57,13 +70,14 @@ class MafRunResults(object):
         # Get the plot and stats info (many-1 metric match)
         self.stats = database.getSummaryStats()
         self.plots = database.getPlotFiles()
+        database.close()
+
+        self._buildIndexes()
 
         # Pull up the names of the groups and subgroups.
-        groups = sorted(np.unique(self.metrics['displayGroup']))
         self.groups = OrderedDict()
-        for g in groups:
-            groupMetrics = self.metrics[np.where(self.metrics['displayGroup'] == g)]
-            self.groups[g] = sorted(np.unique(groupMetrics['displaySubgroup']))
+        for g in sorted(self._subgroupRows):
+            self.groups[g] = sorted(self._subgroupRows[g])
 
         self.summaryStatOrder = ['Id', 'Identity', 'Median', 'Mean', 'Rms', 'RobustRms',
                                  'N(-3Sigma)', 'N(+3Sigma)', 'Count',
@@ -84,6 +98,55 @@ class MafRunResults(object):
             self.summaryStatOrder.append('TableFraction 1 < P')
 
         self.plotOrder = ['SkyMap', 'Histogram', 'PowerSpectrum', 'Combo']
+        # Cache of the JSON version of recently requested metric data files.
+        self.jsonCacheSize = 16
+        self._jsonCache = OrderedDict()
+        self._jsonLock = threading.Lock()
+
+    def _resultsDbMtime(self):
+        """Return the last modification time of the resultsDb (including its write-ahead log)."""
+        mtime = None
+        for filename in (self.resultsDbFile, self.resultsDbFile + '-wal'):
+            # An empty write-ahead log (left behind by readers) holds no changes.
+            if os.path.isfile(filename) and os.path.getsize(filename) > 0:
+                mtime = max(mtime or 0, os.path.getmtime(filename))
+        return mtime
+
+    def isStale(self):
+        """Check whether the resultsDb was modified since it was read."""
+        return self._resultsDbMtime() != self.resultsDbMtime
+
+    def _buildIndexes(self):
+        """Index the rows of the metrics, plots and stats, so the methods used by the templates
+        do not have to search the full arrays on each call.
+        """
+        self._metricRows = dict(zip(self.metrics['metricId'].tolist(), range(len(self.metrics))))
+        # Group -> subgroup -> rows of self.metrics (in sorted order).
+        self._subgroupRows = {}
+        for g, groupRows in _indexRows(self.metrics['displayGroup']).items():
+            subgroups = _indexRows(self.metrics['displaySubgroup'][groupRows])
+            self._subgroupRows[g] = {sg: groupRows[rows] for sg, rows in subgroups.items()}
+        self._groupRows = {g: np.sort(np.concatenate(list(sgRows.values())))
+                           for g, sgRows in self._subgroupRows.items()}
+        # MetricId -> rows of self.plots and self.stats.
+        self._plotRows = _indexRows(self.plots['metricId'])
+        self._statRows = _indexRows(self.stats['metricId'])
+        # PlotType / summaryName -> metricIds.
+        self._plotTypeMetricIds = {pT: self.plots['metricId'][rows]
+                                   for pT, rows in _indexRows(self.plots['plotType']).items()}
+        self._statNameMetricIds = {n: self.stats['metricId'][rows]
+                                   for n, rows in _indexRows(self.stats['summaryName']).items()}
+        self._metricIdsWithStats = np.array(list(self._statRows.keys()), int)
+
+    def _rowsForMetricIds(self, rowIndex, metricIds):
+        """Return the (increasing, unique) rows in rowIndex for all of metricIds."""
+        metricIds = np.atleast_1d(metricIds).tolist()
+        if len(metricIds) == 1:
+            return rowIndex.get(metricIds[0], np.array([], int))
+        rows = [rowIndex[mId] for mId in metricIds if mId in rowIndex]
+        if len(rows) == 0:
+            return np.array([], int)
+        return np.unique(np.concatenate(rows))
 
     # Methods to deal with metricIds
 
@@ -118,13 +181,22 @@ class MafRunResults(object):
         if filename.upper() == 'NULL':
             return None
         datafile = os.path.join(self.outDir, filename)
+        # Reuse the JSON of recently requested data files, unless the file has changed.
+        key = (datafile, os.path.getmtime(datafile) if os.path.isfile(datafile) else None)
+        with self._jsonLock:
+            if key in self._jsonCache:
+                self._jsonCache.move_to_end(key)
+                return self._jsonCache[key]
         # Read data back into a  bundle.
         mB = metricBundles.createEmptyMetricBundle()
         mB.read(datafile)
         io = mB.outputJSON()
-        if io is None:
-            return None
-        return io.getvalue()
+        jsn = None if io is None else io.getvalue()
+        with self._jsonLock:
+            self._jsonCache[key] = jsn
+            while len(self._jsonCache) > self.jsonCacheSize:
+                self._jsonCache.popitem(last=False)
+        return jsn
 
     def getNpz(self, metric):
         """
@@ -161,8 +233,9 @@ class MafRunResults(object):
         Return an ordered numpy array of metrics matching metricIds.
         """
         if metrics is None:
-            metrics = self.metrics
-        # this should be faster with pandas (and self.metrics.query('metricId in @metricIds'))
+            rows = [self._metricRows[mId] for mId in np.atleast_1d(metricIds).tolist()
+                    if mId in self._metricRows]
+            return self.metrics[np.unique(np.array(rows, int))]
         metrics = metrics[np.in1d(metrics['metricId'], metricIds)]
         return metrics
 
@@ -192,7 +265,8 @@ class MafRunResults(object):
         Given a group, return the metrics belonging to this group, in display order.
         """
         if metrics is None:
-            metrics = self.metrics
+            # self.metrics is already sorted.
+            return self.metrics[self._groupRows.get(group, np.array([], int))]
         metrics = metrics[np.where(metrics['displayGroup'] == group)]
         if sort:
             metrics = self.sortMetrics(metrics)
@@ -205,6 +279,9 @@ class MafRunResults(object):
 
         If 'metrics' is provided, then only consider this subset of metrics.
         """
+        if metrics is None:
+            rows = self._subgroupRows.get(group, {}).get(subgroup, np.array([], int))
+            return self.metrics[rows]
         metrics = self.metricsInGroup(group, metrics, sort=False)
         if len(metrics) > 0:
             metrics = metrics[np.where(metrics['displaySubgroup'] == subgroup)]
@@ -237,12 +314,11 @@ class MafRunResults(object):
                 plotTypes.append(pT[:-4])
             else:
                 plotTypes.append(pT.lower() + 'Plot')
-        if metrics is None:
-            metrics = self.metrics
         # Identify the plots with the right plotType, get their IDs.
-        plotMatch = self.plots[np.in1d(self.plots['plotType'], plotTypes)]
+        plotMetricIds = [self._plotTypeMetricIds[pT] for pT in plotTypes if pT in self._plotTypeMetricIds]
+        plotMetricIds = np.concatenate(plotMetricIds) if len(plotMetricIds) > 0 else np.array([], int)
         # Convert those potentially matching metricIds to metrics, using the subset info.
-        metrics = self.metricIdsToMetrics(plotMatch['metricId'], metrics)
+        metrics = self.metricIdsToMetrics(plotMetricIds, metrics)
         return metrics
 
     def uniqueMetricNames(self, metrics=None, baseonly=True):
@@ -262,12 +338,12 @@ class MafRunResults(object):
         """
         Return metrics with summary stat matching 'summaryStatName' (optional, metric subset).
         """
-        if metrics is None:
-            metrics = self.metrics
-        # Identify the potentially matching stats.
-        stats = self.stats[np.in1d(self.stats['summaryName'], summaryStatName)]
+        # Identify the metrics with potentially matching stats.
+        statMetricIds = [self._statNameMetricIds[n] for n in np.atleast_1d(summaryStatName).tolist()
+                         if n in self._statNameMetricIds]
+        statMetricIds = np.concatenate(statMetricIds) if len(statMetricIds) > 0 else np.array([], int)
         # Identify the subset of relevant metrics.
-        metrics = self.metricIdsToMetrics(stats['metricId'], metrics)
+        metrics = self.metricIdsToMetrics(statMetricIds, metrics)
         # Re-sort metrics because at this point, probably want displayOrder + metadata before metric name.
         metrics = self.sortMetrics(metrics, order=['displayGroup', 'displaySubgroup', 'slicerName',
                                                    'displayOrder', 'metricMetadata', 'baseMetricNames'])
@@ -280,7 +356,7 @@ class MafRunResults(object):
         if metrics is None:
             metrics = self.metrics
         # Identify metricIds which are also in stats.
-        metrics = metrics[np.in1d(metrics['metricId'], self.stats['metricId'])]
+        metrics = metrics[np.in1d(metrics['metricId'], self._metricIdsWithStats)]
         metrics = self.sortMetrics(metrics, order=['displayGroup', 'displaySubgroup', 'slicerName',
                                                    'displayOrder', 'metricMetadata', 'baseMetricNames'])
         return metrics
@@ -388,7 +464,7 @@ class MafRunResults(object):
         """
         Return a numpy array of the plots which match a given metric.
         """
-        return self.plots[np.where(self.plots['metricId'] == metric['metricId'])]
+        return self.plots[self._rowsForMetricIds(self._plotRows, metric['metricId'])]
 
     def plotDict(self, plots=None):
         """
@@ -508,7 +584,7 @@ class MafRunResults(object):
         if metrics is None:
             metrics = self.metrics
         # Match the plots to the metrics required.
-        plotMetricMatch = self.plots[np.in1d(self.plots['metricId'], metrics['metricId'])]
+        plotMetricMatch = self.plots[self._rowsForMetricIds(self._plotRows, metrics['metricId'])]
         # Match the plot type (which could be a list)
         plotMatch = plotMetricMatch[np.in1d(plotMetricMatch['plotType'], plotType)]
         return plotMatch
@@ -521,7 +597,7 @@ class MafRunResults(object):
 
         Optionally specify a particular statName that you want to match.
         """
-        stats = self.stats[np.where(self.stats['metricId'] == metric['metricId'])]
+        stats = self.stats[self._rowsForMetricIds(self._statRows, metric['metricId'])]
         if statName is not None:
             stats = stats[np.where(stats['summaryName'] == statName)]
         return stats
@@ -564,7 +640,8 @@ class MafRunResults(object):
         Given an array of metrics, return a list containing all the unique 'summaryNames'
         in a default ordering.
         """
-        names = np.unique(self.stats['summaryName'][np.in1d(self.stats['metricId'], metrics['metricId'])])
+        names = np.unique(self.stats['summaryName'][self._rowsForMetricIds(self._statRows,
+                                                                            metrics['metricId'])])
         names = list(names)
         # Add some default sorting.
         namelist = []
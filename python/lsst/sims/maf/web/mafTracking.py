@@ -1,5 +1,6 @@
 from builtins import object
 import os
+import threading
 from collections import OrderedDict
 import numpy as np
 import lsst.sims.maf.db as db
@@ -12,7 +13,7 @@ class MafTracking(object):
     Class to read MAF's tracking SQLite database (tracking a set of MAF runs)
     and handle the output for web display.
     """
-    def __init__(self, database=None):
+    def __init__(self, database=None, runCacheSize=20):
         """
         Instantiate the (multi-run) layout visualization class.
 
@@ -21,6 +22,10 @@ class MafTracking(object):
         database :str
            Path to the sqlite tracking database file.
            If not set, looks for 'trackingDb_sqlite.db' file in current directory.
+        runCacheSize : int, opt
+           Maximum number of runs to keep (read into MafRunResults objects) in memory.
+           The runs are read when first requested; the least recently used run is dropped
+           when more runs are requested. None keeps all runs. Default 20.
         """
         if database is None:
             database = os.path.join(os.getcwd(), 'trackingDb_sqlite.db')
@@ -31,7 +36,10 @@ class MafTracking(object):
                 'mafDir', 'opsimVersion', 'opsimDate', 'mafVersion', 'mafDate']
         self.runs = tdb.query_columns('runs', colnames=cols)
         self.runs = self.sortRuns(self.runs, order=['mafRunId', 'opsimRun', 'mafComment'])
-        self.runsPage = {}
+        self.runCacheSize = runCacheSize
+        self.runsPage = OrderedDict()
+        # getRun may be called from several (web server) threads.
+        self._runsLock = threading.RLock()
 
     def runInfo(self, run):
         """
@@ -83,8 +91,9 @@ class MafTracking(object):
     def getRun(self, mafRunId):
         """
         Set up a mafRunResults object to read and handle the data from an individual run.
-        Caches the mafRunResults object, meaning the metric information from a particular run
-        is only read once from disk.
+        Caches the mafRunResults object (for the runCacheSize most recently used runs), meaning the
+        metric information from a particular run is only read once from disk (unless its resultsDb
+        has been modified since).
 
         Parameters
         ----------
@@ -102,12 +111,18 @@ class MafTracking(object):
                 mafRunId = int(mafRunId['runId'][0][0])
             if isinstance(mafRunId, list):
                 mafRunId = int(mafRunId[0])
-        if mafRunId in self.runsPage:
+        with self._runsLock:
+            if mafRunId in self.runsPage and not self.runsPage[mafRunId].isStale():
+                self.runsPage.move_to_end(mafRunId)
+                return self.runsPage[mafRunId]
+            match = (self.runs['mafRunId'] == mafRunId)
+            mafDir = self.runs[match]['mafDir'][0]
+            runName = self.runs[match]['opsimRun'][0]
+            if runName == 'NULL':
+                runName = None
+            self.runsPage[mafRunId] = MafRunResults(mafDir, runName)
+            self.runsPage.move_to_end(mafRunId)
+            if self.runCacheSize is not None:
+                while len(self.runsPage) > max(self.runCacheSize, 1):
+                    self.runsPage.popitem(last=False)
             return self.runsPage[mafRunId]
-        match = (self.runs['mafRunId'] == mafRunId)
-        mafDir = self.runs[match]['mafDir'][0]
-        runName = self.runs[match]['opsimRun'][0]
-        if runName == 'NULL':
-            runName = None
-        self.runsPage[mafRunId] = MafRunResults(mafDir, runName)
-        return self.runsPage[mafRunId]
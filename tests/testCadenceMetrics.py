@@ -3,11 +3,43 @@ from builtins import zip
 import matplotlib
 matplotlib.use("Agg")
 import numpy as np
+import scipy.stats
 import unittest
 import lsst.sims.maf.metrics as metrics
+from lsst.sims.maf.utils import m52snr
+import lsst.sims.utils as utils
 import lsst.utils.tests
 
 
+def periodicDetectLoop(dataSlice, periods, amplitudes, starMags, sig_level=0.05, SedTemplate='F'):
+    """Count the detected periodic stars one period (and filter) at a time,
+    to compare with the batched PeriodicDetectMetric."""
+    result = 0
+    n_pts = np.size(dataSlice['observationStartMJD'])
+    u_filters = np.unique(dataSlice['filter'])
+    p1 = np.size(u_filters)
+    p2 = 3. + p1
+    chi_sq_2 = 1. * (n_pts - p2)
+    if n_pts <= p2:
+        return result
+    for period, starMag, amplitude in zip(periods, starMags, amplitudes):
+        chi_sq_1 = 0
+        mags = utils.stellarMags(SedTemplate, rmag=starMag)
+        for filtername in u_filters:
+            in_filt = np.where(dataSlice['filter'] == filtername)[0]
+            lc = amplitude * np.sin(dataSlice['observationStartMJD'][in_filt] * (np.pi * 2) / period) \
+                + mags[filtername]
+            snr = m52snr(lc, dataSlice['fiveSigmaDepth'][in_filt])
+            delta_m = 2.5 * np.log10(1. + 1. / snr)
+            weights = 1. / (delta_m**2)
+            weighted_mean = np.sum(weights * lc) / np.sum(weights)
+            chi_sq_1 += np.sum(((lc - weighted_mean)**2 / delta_m**2))
+        p_value = scipy.stats.f.sf((chi_sq_1 - chi_sq_2) / (p2 - p1), p2 - p1, n_pts - p2)
+        if np.isfinite(p_value) and p_value < sig_level:
+            result += 1
+    return result
+
+
 class TestCadenceMetrics(unittest.TestCase):
 
     def testPhaseGapMetric(self):
@@ -43,6 +75,68 @@ class TestCadenceMetrics(unittest.TestCase):
         self.assertEqual(worstPeriod, 0.25)
         self.assertEqual(largestGap, 1.)
 
+        # Calculating the phases in small blocks of periods should not change the gaps.
+        rng = np.random.RandomState(42)
+        data = np.zeros(100, dtype=list(zip(['observationStartMJD'], [float])))
+        data['observationStartMJD'] = rng.rand(100) * 365
+        pgm = metrics.PhaseGapMetric(nPeriods=50, periodMin=0.5, periodMax=20)
+        metricVal = pgm.run(data)
+        pgm = metrics.PhaseGapMetric(nPeriods=50, periodMin=0.5, periodMax=20, maxBlockValues=250)
+        metricValBlocks = pgm.run(data)
+        np.testing.assert_array_equal(metricVal['maxGaps'], metricValBlocks['maxGaps'])
+
+    def testPeriodicQualityMetric(self):
+        """
+        Test the periodic quality metric, for single and multiple periods.
+        """
+        rng = np.random.RandomState(42)
+        data = np.zeros(100, dtype=list(zip(['observationStartMJD', 'fiveSigmaDepth'], [float, float])))
+        data['observationStartMJD'] = rng.rand(100) * 365
+        data['fiveSigmaDepth'] = rng.rand(100) + 23
+        periods = [0.5, 2., 7.5]
+        results = [metrics.PeriodicQualityMetric(period=period).run(data) for period in periods]
+        for result in results:
+            self.assertGreaterEqual(result, 0)
+            self.assertLessEqual(result, 1)
+        metric = metrics.PeriodicQualityMetric(period=periods, maxBlockValues=100)
+        self.assertAlmostEqual(metric.run(data), np.min(results))
+
+    def testPeriodicDetectMetric(self):
+        """
+        Test the batched periodic detection matches evaluating one period at a time.
+        """
+        rng = np.random.RandomState(42)
+        nPeriods = 40
+        periods = rng.rand(nPeriods) * 10 + 0.1
+        amplitudes = rng.rand(nPeriods) * 0.3
+        starMags = rng.choice([18., 20., 22.5, 24.], nPeriods)
+        for nVisits in [5, 60]:
+            data = np.zeros(nVisits, dtype=list(zip(['observationStartMJD', 'fiveSigmaDepth', 'filter'],
+                                                    [float, float, (np.str_, 1)])))
+            data['fiveSigmaDepth'] = rng.rand(nVisits) * 2 + 23
+            data['filter'] = rng.choice(['g', 'r', 'i'], nVisits)
+            times = rng.rand(nVisits) * 365
+            # Evaluate in blocks of fewer periods than in total.
+            metric = metrics.PeriodicDetectMetric(periods=periods, amplitudes=amplitudes, starMags=starMags,
+                                                  maxBlockValues=nVisits * 3)
+            # Start the light curves at different phases.
+            for startPhase in [0., 0.3, 0.75]:
+                data['observationStartMJD'] = times + startPhase * periods.max()
+                expected = periodicDetectLoop(data, periods, amplitudes, starMags)
+                self.assertEqual(metric.run(data), expected)
+            if nVisits > 5:
+                self.assertGreater(expected, 0)
+                self.assertLess(expected, nPeriods)
+        # Single amplitudes and starMags apply to all periods.
+        metric = metrics.PeriodicDetectMetric(periods=periods, amplitudes=0.05, starMags=22.5)
+        self.assertEqual(metric.run(data), periodicDetectLoop(data, periods, [0.05] * nPeriods,
+                                                              [22.5] * nPeriods))
+        metric = metrics.PeriodicDetectMetric(periods=periods[0], amplitudes=amplitudes[0],
+                                              starMags=starMags[0])
+        self.assertEqual(metric.run(data), periodicDetectLoop(data, periods[:1], amplitudes[:1], starMags[:1]))
+        with self.assertRaises(ValueError):
+            metrics.PeriodicDetectMetric(periods=periods, amplitudes=amplitudes[:3])
+
     def testTemplateExists(self):
         """
         Test the TemplateExistsMetric.
@@ -139,6 +233,30 @@ class TestCadenceMetrics(unittest.TestCase):
         self.assertEqual(result4[1], 2)
         self.assertEqual(result4[2], 1)
 
+        # Only one night - no gaps.
+        data['night'] = 3
+        metric = metrics.NightgapsMetric(allGaps=True, bins=np.arange(0, 5, 1))
+        result5 = metric.run(data)
+        self.assertEqual(np.sum(result5), 0)
+
+    def testAllGapsRandom(self):
+        """Compare allGaps histograms to a histogram of all pairwise differences, for random visits."""
+        rng = np.random.RandomState(42)
+        for i in range(50):
+            nvisits = rng.randint(2, 200)
+            data = np.zeros(nvisits, dtype=list(zip(['observationStartMJD', 'night'], [float, int])))
+            data['night'] = rng.randint(0, 100, nvisits)
+            data['observationStartMJD'] = data['night'] + rng.randint(0, 10, nvisits) / 10.
+            for bins in [np.arange(0, 50, 0.5), np.arange(1, 100, 10), 20]:
+                metric = metrics.TgapsMetric(allGaps=True, bins=bins)
+                times = np.sort(data['observationStartMJD'])
+                allDiffs = (times[np.newaxis, :] - times[:, np.newaxis])[np.triu_indices(nvisits, 1)]
+                np.testing.assert_array_equal(metric.run(data), np.histogram(allDiffs, bins)[0])
+                metric = metrics.NightgapsMetric(allGaps=True, bins=bins)
+                nights = np.unique(data['night'])
+                allDiffs = (nights[np.newaxis, :] - nights[:, np.newaxis])[np.triu_indices(len(nights), 1)]
+                np.testing.assert_array_equal(metric.run(data), np.histogram(allDiffs, bins)[0])
+
     def testNVisitsPerNightMetric(self):
         names = ['night']
         types = [float]
@@ -272,6 +390,30 @@ class TestCadenceMetrics(unittest.TestCase):
         metric = metrics.TransientMetric(nFilters=2, nPerLC=3, surveyDuration=ndata/365.25)
         self.assertEqual(metric.run(dataSlice), 1.)
 
+    def testMultiTransientMetric(self):
+        names = ['observationStartMJD', 'fiveSigmaDepth', 'filter']
+        types = [float, float, '<U1']
+        rng = np.random.RandomState(42)
+        ndata = 500
+        dataSlice = np.zeros(ndata, dtype=list(zip(names, types)))
+        dataSlice['observationStartMJD'] = rng.rand(ndata) * 365
+        dataSlice['fiveSigmaDepth'] = rng.rand(ndata) * 2 + 19.5
+        dataSlice['filter'] = rng.choice(['g', 'r', 'i'], ndata)
+        transientParams = [{'name': 'short', 'transDuration': 5., 'peakTime': 1., 'nPhaseCheck': 3},
+                           {'transDuration': 20., 'riseSlope': -0.5, 'declineSlope': 0.1, 'nPrePeak': 2},
+                           {'transDuration': 30., 'nPerLC': 3, 'nFilters': 2, 'nPhaseCheck': 4,
+                            'countMethod': 'partialLC'}]
+        metric = metrics.MultiTransientMetric(transientParams)
+        result = metric.run(dataSlice)
+        self.assertEqual(len(result), len(transientParams))
+        for i, params in enumerate(transientParams):
+            params = dict(params)
+            params.pop('name', None)
+            expected = metrics.TransientMetric(**params).run(dataSlice)
+            self.assertAlmostEqual(result[i], expected)
+        self.assertEqual(metric.reduceFuncs['short'](result), result[0])
+        self.assertEqual(metric.reduceFuncs['Transient_2'](result), result[2])
+
     def testSeasonLengthMetric(self):
         times = np.arange(0, 3650, 10)
         data = np.zeros(len(times), dtype=list(zip(['observationStartMJD'], [float])))
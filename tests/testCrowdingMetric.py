@@ -0,0 +1,60 @@
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import unittest
+import lsst.sims.maf.metrics as metrics
+from lsst.sims.maf.metrics.crowdingMetric import _compCrowdError
+from lsst.sims.maf.utils import crowdingErrorPerSeeing
+import lsst.utils.tests
+
+
+class TestCrowdingMetrics(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.bins = np.arange(15, 28.01, 0.1)
+        self.lumFunc = np.cumsum(rng.rand(10, len(self.bins) - 1), axis=1) * 1e4
+        names = ['seeingFwhmGeom', 'fiveSigmaDepth']
+        self.data = np.zeros(20, dtype=list(zip(names, [float, float])))
+        self.data['seeingFwhmGeom'] = rng.uniform(0.5, 1.5, 20)
+        self.data['fiveSigmaDepth'] = rng.uniform(23, 25, 20)
+
+    def testCrowdErrorTable(self):
+        """Test the crowding error table scales with seeing, for each healpixel."""
+        table = crowdingErrorPerSeeing(self.bins[1:], self.lumFunc)
+        self.assertEqual(table.shape, self.lumFunc.shape)
+        for i in range(len(self.lumFunc)):
+            np.testing.assert_allclose(_compCrowdError(self.bins[1:], self.lumFunc[i], 0.7),
+                                       0.7 * table[i])
+
+    def testCrowdingMetrics(self):
+        """Test the metrics give the same values with and without the precomputed crowding error table."""
+        table = crowdingErrorPerSeeing(self.bins[1:], self.lumFunc)
+        metricList = [metrics.CrowdingM5Metric(crowding_error=0.05), metrics.NstarsMetric(crowding_error=0.05),
+                      metrics.CrowdingMagUncertMetric(rmag=20.)]
+        for i in range(len(self.lumFunc)):
+            slicePoint = {'starMapBins_r': self.bins, 'starLumFunc_r': self.lumFunc[i], 'nside': 64}
+            withTable = dict(slicePoint, starCrowdErr_r=table[i])
+            for metric in metricList:
+                self.assertEqual(metric.run(self.data, withTable), metric.run(self.data, slicePoint))
+        # Ignoring crowding can only increase the number of stars.
+        nstars = metrics.NstarsMetric(crowding_error=0.05).run(self.data, slicePoint)
+        nstarsNoCrowding = metrics.NstarsMetric(crowding_error=0.05, ignore_crowding=True).run(self.data,
+                                                                                                slicePoint)
+        self.assertGreaterEqual(nstarsNoCrowding, nstars)
+        # Magnitudes outside the luminosity function raise an error.
+        with self.assertRaises(ValueError):
+            metrics.CrowdingMagUncertMetric(rmag=30.).run(self.data, slicePoint)
+
+
+class TestMemory(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
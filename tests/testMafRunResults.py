@@ -0,0 +1,93 @@
+import matplotlib
+matplotlib.use("Agg")
+import os
+import unittest
+import numpy as np
+import lsst.sims.maf.db as db
+from lsst.sims.maf.web import MafRunResults
+import shutil
+import tempfile
+import lsst.utils.tests
+
+
+class TestMafRunResults(unittest.TestCase):
+
+    def setUp(self):
+        self.outDir = tempfile.mkdtemp(prefix='mafRun')
+        resultsDb = db.ResultsDb(outDir=self.outDir)
+        rng = np.random.RandomState(42)
+        self.metricIds = []
+        for i in range(30):
+            metricId = resultsDb.updateMetric('Metric%d' % (i % 7), 'HealpixSlicer', 'fakeopsim', '',
+                                              'metadata%d' % i, 'metric%d.npz' % i)
+            self.metricIds.append(metricId)
+            resultsDb.updateDisplay(metricId, {'group': 'group%d' % (i % 3), 'subgroup': 'sub%d' % (i % 2),
+                                               'order': rng.randint(5), 'caption': 'caption'})
+        for i in range(60):
+            metricId = self.metricIds[rng.randint(len(self.metricIds))]
+            resultsDb.updatePlot(metricId, ['SkyMap', 'Histogram'][i % 2], 'plot%d_SkyMap.pdf' % i)
+            resultsDb.updateSummaryStat(metricId, ['Mean', 'Median', 'Count'][i % 3], rng.rand())
+        resultsDb.close()
+        self.run = MafRunResults(self.outDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.outDir)
+
+    def testIndexes(self):
+        """Test the indexed lookups match searching the full arrays."""
+        run = self.run
+        self.assertEqual(len(run.metrics), 30)
+        self.assertEqual(list(run.groups.keys()), ['group0', 'group1', 'group2'])
+        for g in run.groups:
+            self.assertEqual(run.groups[g], ['sub0', 'sub1'])
+            expected = run.sortMetrics(run.metrics[run.metrics['displayGroup'] == g])
+            np.testing.assert_array_equal(run.metricsInGroup(g), expected)
+            for sg in run.groups[g]:
+                expected = run.sortMetrics(run.metrics[(run.metrics['displayGroup'] == g) &
+                                                       (run.metrics['displaySubgroup'] == sg)])
+                np.testing.assert_array_equal(run.metricsInSubgroup(g, sg), expected)
+        self.assertEqual(len(run.metricsInSubgroup('nogroup', 'sub0')), 0)
+        for metric in run.metrics:
+            np.testing.assert_array_equal(run.plotsForMetric(metric),
+                                          run.plots[run.plots['metricId'] == metric['metricId']])
+            np.testing.assert_array_equal(run.statsForMetric(metric, statName='Mean'),
+                                          run.stats[(run.stats['metricId'] == metric['metricId']) &
+                                                    (run.stats['summaryName'] == 'Mean')])
+        skyMetrics = run.metricsWithPlotType('SkyMap')
+        np.testing.assert_array_equal(skyMetrics['metricId'],
+                                      [m for m in run.metrics['metricId']
+                                       if m in run.plots['metricId'][run.plots['plotType'] == 'SkyMap']])
+        np.testing.assert_array_equal(np.sort(run.metricsWithStats()['metricId']),
+                                      np.unique(run.stats['metricId']))
+        np.testing.assert_array_equal(run.metricIdsToMetrics(self.metricIds[:5]),
+                                      run.metrics[np.in1d(run.metrics['metricId'], self.metricIds[:5])])
+
+    def testStale(self):
+        """Test a run notices when its resultsDb is modified (but not when it is only read)."""
+        self.assertFalse(self.run.isStale())
+        mtime = self.run.resultsDbMtime - 10
+        os.utime(self.run.resultsDbFile, (mtime, mtime))
+        run = MafRunResults(self.outDir)
+        self.assertEqual(os.path.getmtime(run.resultsDbFile), mtime)
+        self.assertFalse(run.isStale())
+        # An empty write-ahead log does not count as a modification.
+        open(run.resultsDbFile + '-wal', 'w').close()
+        self.assertFalse(run.isStale())
+        os.remove(run.resultsDbFile + '-wal')
+        mtime = run.resultsDbMtime + 10
+        os.utime(run.resultsDbFile, (mtime, mtime))
+        self.assertTrue(run.isStale())
+        self.assertFalse(MafRunResults(self.outDir).isStale())
+
+
+class TestMemory(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
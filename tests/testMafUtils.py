@@ -0,0 +1,60 @@
+import matplotlib
+matplotlib.use("Agg")
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import lsst.sims.maf.utils as utils
+import lsst.utils.tests
+
+
+class TestMafUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.outDir = tempfile.mkdtemp(prefix='TMU')
+
+    def tearDown(self):
+        if os.path.isdir(self.outDir):
+            shutil.rmtree(self.outDir)
+
+    def testReadNpzArray(self):
+        """Test reading single arrays from npz files, memory-mapped where possible."""
+        rng = np.random.RandomState(42)
+        values = rng.rand(20, 3)
+        fortran = np.asfortranarray(rng.rand(4, 5))
+        mask = values > 0.5
+        objects = np.empty(2, object)
+        objects[0] = {'a': 1}
+        filename = os.path.join(self.outDir, 'test.npz')
+        np.savez(filename, values=values, fortran=fortran, mask=mask, missing=None, objects=objects,
+                 scalar=np.float64(3.))
+        for key, expected in [('values', values), ('fortran', fortran), ('mask', mask)]:
+            arr = utils.readNpzArray(filename, key)
+            self.assertIsInstance(arr, np.memmap)
+            np.testing.assert_array_equal(arr, expected)
+            del arr
+        self.assertIsNone(utils.readNpzArray(filename, 'missing'))
+        self.assertEqual(utils.readNpzArray(filename, 'objects')[0], {'a': 1})
+        self.assertEqual(utils.readNpzArray(filename, 'scalar'), 3.)
+        # Compressed arrays are read into memory.
+        filename = os.path.join(self.outDir, 'compressed.npz')
+        np.savez_compressed(filename, values=values)
+        arr = utils.readNpzArray(filename, 'values')
+        self.assertNotIsInstance(arr, np.memmap)
+        np.testing.assert_array_equal(arr, values)
+        with self.assertRaises(KeyError):
+            utils.readNpzArray(filename, 'mask')
+
+
+class TestMemory(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
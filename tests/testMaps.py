@@ -91,6 +91,7 @@ class TestMaps(unittest.TestCase):
                 assert('starMapBins_r' in list(result1.keys()))
                 assert('starLumFunc_r' in list(result1.keys()))
                 assert(np.max(result1['starLumFunc_r'] > 0))
+                assert(np.shape(result1['starCrowdErr_r']) == np.shape(result1['starLumFunc_r']))
 
             fieldData = makeFieldData(22)
 
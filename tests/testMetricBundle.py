@@ -1,6 +1,7 @@
 import unittest
 import matplotlib
 matplotlib.use("Agg")
+import numpy as np
 
 import lsst.sims.maf.metrics as metrics
 import lsst.sims.maf.slicers as slicers
@@ -12,6 +13,7 @@ import glob
 import os
 import tempfile
 import shutil
+import warnings
 import lsst.utils.tests
 from lsst.utils import getPackageDir
 from lsst.sims.utils.CodeUtilities import sims_clean_up
@@ -63,6 +65,204 @@ class TestMetricBundle(unittest.TestCase):
         assert(len(outPdf) == 3)
         assert(len(outNpz) == 1)
 
+    def testReduce(self):
+        """
+        Check that reducing all metric values together matches reducing with each function in turn
+        """
+        rng = np.random.RandomState(42)
+        nvisits = 3000
+        names = ['observationStartMJD', 'night', 'filter']
+        data = np.zeros(nvisits, dtype=list(zip(names, [float, int, (np.str_, 1)])))
+        data['night'] = rng.randint(0, 100, nvisits)
+        data['observationStartMJD'] = data['night'] + rng.randint(0, 30, nvisits) * 15. / 60. / 24.
+        data['filter'] = rng.choice(['u', 'g', 'r', 'i', 'z', 'y'], nvisits)
+        for metric in [metrics.VisitGroupsMetric(), metrics.CompletenessMetric(g=10, r=10, i=20)]:
+            slicer = slicers.OneDSlicer(sliceColName='night', binsize=5)
+            metricB = metricBundles.MetricBundle(metric, slicer, '')
+            slicer.setupSlicer(data)
+            metricB._setupMetricValues()
+            for i, s in enumerate(slicer):
+                metricB.metricValues.data[i] = metric.run(data[s['idxs']])
+            metricB.metricValues.mask[::7] = True
+            reduceFuncs = list(metric.reduceFuncs.values())
+            reduced = metricB.reduceMetrics(reduceFuncs)
+            self.assertEqual(len(reduced), len(reduceFuncs))
+            for reduceFunc, newB in zip(reduceFuncs, reduced):
+                expected = metricB.reduceMetric(reduceFunc)
+                self.assertEqual(newB.metric.name, expected.metric.name)
+                np.testing.assert_array_equal(newB.metricValues.mask, metricB.metricValues.mask)
+                good = ~newB.metricValues.mask
+                np.testing.assert_array_equal(newB.metricValues.data[good], expected.metricValues.data[good])
+                loopValues = [reduceFunc(v) for v in metricB.metricValues.data[good]]
+                np.testing.assert_array_equal(newB.metricValues.data[good], np.array(loopValues, float).ravel())
+        self.assertEqual(sorted(metrics.CompletenessMetric(r=10).vectorReduceFuncs.keys()),
+                         sorted(metrics.CompletenessMetric(r=10).reduceFuncs.keys()))
+
+    def testReduceName(self):
+        """
+        Check that reduce bundle names only strip the 'reduce' prefix, when reducing and reading
+        """
+        class ReduceNameMetric(metrics.BaseMetric):
+            def run(self, dataSlice, slicePoint=None):
+                return {'values': dataSlice['airmass']}
+
+            def reduceAfterreduce(self, metricValue):
+                return np.mean(metricValue['values'])
+
+        metric = ReduceNameMetric('airmass', metricName='ReduceName', metricDtype='object')
+        slicer = slicers.UniSlicer()
+        metricB = metricBundles.MetricBundle(metric, slicer, '', runName='test')
+        slicer.setupSlicer(np.zeros(3, dtype=[('airmass', float)]))
+        metricB._setupMetricValues()
+        metricB.metricValues.data[0] = {'values': np.array([1., 2., 3.])}
+        reduced = metricB.reduceMetrics([metric.reduceAfterreduce])[0]
+        self.assertEqual(reduced.metric.name, 'ReduceName_Afterreduce')
+        self.assertEqual(reduced.metricValues[0], 2.)
+        metricB.write(outDir=self.outDir)
+        reduced.write(outDir=self.outDir)
+        readB = metricBundles.MetricBundle(ReduceNameMetric('airmass', metricName='ReduceName',
+                                                            metricDtype='object'),
+                                           slicers.UniSlicer(), '', runName='test')
+        bgroup = metricBundles.MetricBundleGroup({'parent': readB}, None, outDir=self.outDir, verbose=False)
+        bgroup.readAll()
+        self.assertIn('ReduceName_Afterreduce', bgroup.bundleDict)
+        self.assertEqual(bgroup.bundleDict['ReduceName_Afterreduce'].metricValues[0], 2.)
+
+    def testMultiTransientReduceNames(self):
+        """
+        Check that MultiTransientMetric reduce bundles keep the parameter set names, when reducing and reading
+        """
+        transientParams = [{'name': 'reducedRate', 'transDuration': 5.},
+                           {'name': 'fast_reduce', 'transDuration': 10.},
+                           {'transDuration': 20.}]
+        metric = metrics.MultiTransientMetric(transientParams, metricName='MultiTransient')
+        slicer = slicers.UniSlicer()
+        metricB = metricBundles.MetricBundle(metric, slicer, '', runName='test')
+        slicer.setupSlicer(np.zeros(3, dtype=[('observationStartMJD', float)]))
+        metricB._setupMetricValues()
+        metricB.metricValues.data[0] = np.array([0.1, 0.2, 0.3])
+        reduced = metricB.reduceMetrics(list(metric.reduceFuncs.values()))
+        names = ['MultiTransient_reducedRate', 'MultiTransient_fast_reduce', 'MultiTransient_Transient_2']
+        self.assertEqual([b.metric.name for b in reduced], names)
+        metricB.write(outDir=self.outDir)
+        for b in reduced:
+            b.write(outDir=self.outDir)
+        readB = metricBundles.MetricBundle(metrics.MultiTransientMetric(transientParams,
+                                                                        metricName='MultiTransient'),
+                                           slicers.UniSlicer(), '', runName='test')
+        bgroup = metricBundles.MetricBundleGroup({'parent': readB}, None, outDir=self.outDir, verbose=False)
+        bgroup.readAll()
+        for name, value in zip(names, [0.1, 0.2, 0.3]):
+            self.assertIn(name, bgroup.bundleDict)
+            self.assertEqual(bgroup.bundleDict[name].metricValues[0], value)
+
+    def _oneDBundles(self):
+        rng = np.random.RandomState(42)
+        nvisits = 1000
+        data = np.zeros(nvisits, dtype=list(zip(['night', 'airmass'], [int, float])))
+        data['night'] = rng.randint(0, 100, nvisits)
+        data['airmass'] = rng.rand(nvisits) + 1.
+        bundleList = []
+        for metric in [metrics.MeanMetric('airmass'), metrics.CountMetric('airmass')]:
+            slicer = slicers.OneDSlicer(sliceColName='night', binsize=10)
+            metricB = metricBundles.MetricBundle(metric, slicer, '', runName='test')
+            slicer.setupSlicer(data)
+            metricB._setupMetricValues()
+            for i, s in enumerate(slicer):
+                metricB.metricValues.data[i] = metric.run(data[s['idxs']])
+            bundleList.append(metricB)
+        return bundleList
+
+    def testPlotParallel(self):
+        """
+        Check that plotting in separate processes saves the same figures and resultsDb records
+        """
+        plotFiles = []
+        for nProcs in (1, 2):
+            outDir = os.path.join(self.outDir, 'nProcs%d' % nProcs)
+            resultsDb = db.ResultsDb(outDir=outDir)
+            bundleList = self._oneDBundles()
+            bgroup = metricBundles.MetricBundleGroup(metricBundles.makeBundlesDictFromList(bundleList),
+                                                     None, outDir=outDir, resultsDb=resultsDb,
+                                                     verbose=False)
+            bgroup.plotAll(nProcs=nProcs)
+            files = resultsDb.getPlotFiles()
+            resultsDb.close()
+            for f in files['plotFile']:
+                self.assertTrue(os.path.isfile(os.path.join(outDir, f)))
+            self.assertEqual(len(glob.glob(os.path.join(outDir, 'thumb*'))), len(files))
+            plotFiles.append(sorted(zip(files['metricName'], files['plotType'], files['plotFile'])))
+        self.assertEqual(len(plotFiles[0]), 2)
+        self.assertEqual(plotFiles[0], plotFiles[1])
+
+    def testPlotCache(self):
+        """
+        Check that only the figures with changed values or plotDicts are remade with the plot cache
+        """
+        bundleList = self._oneDBundles()
+        bundleDict = metricBundles.makeBundlesDictFromList(bundleList)
+
+        def plotTimes(nProcs=1):
+            resultsDb = db.ResultsDb(outDir=self.outDir)
+            bgroup = metricBundles.MetricBundleGroup(bundleDict, None, outDir=self.outDir,
+                                                     resultsDb=resultsDb, verbose=False)
+            bgroup.plotAll(plotCache=True, nProcs=nProcs)
+            plotFiles = resultsDb.getPlotFiles()['plotFile']
+            resultsDb.close()
+            return {f: os.stat(os.path.join(self.outDir, f)).st_mtime_ns for f in plotFiles}
+
+        first = plotTimes()
+        self.assertEqual(len(first), 2)
+        self.assertTrue(os.path.isfile(os.path.join(self.outDir, 'plotCache.json')))
+        # Nothing changed, so nothing is remade (but the figures are still in the resultsDb).
+        self.assertEqual(plotTimes(), first)
+        bundleList[0].setPlotDict({'title': 'new title'})
+        second = plotTimes(nProcs=2)
+        changed = [f for f in first if first[f] != second[f]]
+        self.assertEqual(len(changed), 1)
+        self.assertTrue(changed[0].startswith(bundleList[0].fileRoot))
+        self.assertEqual(plotTimes(), second)
+        bundleList[1].metricValues.data[0] += 1
+        third = plotTimes()
+        changed = [f for f in second if second[f] != third[f]]
+        self.assertEqual(changed, [f for f in second if f.startswith(bundleList[1].fileRoot)])
+
+    def testReadAll(self):
+        """
+        Check that lazy and threaded reads restore the same metric values as the written bundles
+        """
+        written = self._oneDBundles()
+        for b in written:
+            b.write(outDir=self.outDir)
+
+        def readBundles():
+            # The third bundle was not written.
+            bundleList = [metricBundles.MetricBundle(metric, slicers.OneDSlicer(sliceColName='night'), '',
+                                                     runName='test')
+                          for metric in [metrics.MeanMetric('airmass'), metrics.CountMetric('airmass'),
+                                         metrics.MaxMetric('airmass')]]
+            return metricBundles.MetricBundleGroup(metricBundles.makeBundlesDictFromList(bundleList),
+                                                   None, outDir=self.outDir, verbose=False)
+
+        # Read everything now, lazily when used, or lazily and then with loadAll.
+        for lazy, nThreads in [(False, None), (True, None), (True, 1), (True, 4)]:
+            bgroup = readBundles()
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                bgroup.readAll(lazy=lazy)
+            self.assertEqual(len([m for m in w if 'not found' in str(m.message)]), 1)
+            self.assertEqual(sorted(bgroup.bundleDict.keys()), sorted(b.fileRoot for b in written))
+            for b in written:
+                self.assertEqual(bgroup.bundleDict[b.fileRoot]._lazyFile is not None, lazy)
+            if nThreads is not None:
+                bgroup.loadAll(nThreads=nThreads)
+            for b in written:
+                bundle = bgroup.bundleDict[b.fileRoot]
+                self.assertEqual(bundle._lazyFile is not None, lazy and nThreads is None)
+                np.testing.assert_array_equal(bundle.metricValues, b.metricValues)
+                np.testing.assert_array_equal(bundle.slicer.slicePoints['bins'], b.slicer.slicePoints['bins'])
+                self.assertIsNone(bundle._lazyFile)
+
     def tearDown(self):
         if os.path.isdir(self.outDir):
             shutil.rmtree(self.outDir)
@@ -1,7 +1,16 @@
+import os
+import shutil
+import tempfile
+import warnings
 import numpy as np
+import numpy.ma as ma
 import pandas as pd
 import unittest
 import lsst.sims.maf.metrics as metrics
+import lsst.sims.maf.metricBundles as mb
+import lsst.sims.maf.slicers as slicers
+import lsst.sims.maf.stackers as stackers
+import lsst.sims.maf.batches as batches
 
 
 class TestMoMetrics1(unittest.TestCase):
@@ -209,6 +218,151 @@ class TestDiscoveryMetrics(unittest.TestCase):
         magic = discMetric3.run(self.ssoObs, self.orb, self.Hval)
         self.assertEqual(magic, 6)
 
+    def testDiscoveryResults(self):
+        discMetric = metrics.DiscoveryMetric(nObsPerNight=2, tMin=0.0, tMax=0.3,
+                                             nNightsPerWindow=3, tWindow=9, snrLimit=5)
+        metricValue = discMetric.run(self.ssoObs, self.orb, self.Hval)
+        # Build a (3 objects x 2 H) set of parent values, with some masked values.
+        Hvals = np.array([8, 9], float)
+        metricValues = ma.MaskedArray(data=np.empty((3, 2), 'object'), mask=np.zeros((3, 2), bool))
+        metricValues.data[0, 0] = metricValue
+        metricValues.data[0, 1] = metricValue
+        metricValues.mask[1, :] = True
+        metricValues.data[2, 0] = {'start': np.array([3]), 'end': np.array([10]),
+                                   'trackletNights': np.array([1., 7., 10.])}
+        metricValues.mask[2, 1] = True
+        results = mb.DiscoveryResults.fromMetricValues(metricValues, Hvals, objIds=np.array(['a', 'b', 'c']))
+        np.testing.assert_array_equal(results.nChances().filled(0), np.array([[2, 2], [0, 0], [1, 0]]))
+        self.assertIsNone(results[1, 0])
+        tempdir = tempfile.mkdtemp(prefix='discRes')
+        try:
+            outfile = results.write(os.path.join(tempdir, 'test'))
+            restored = mb.DiscoveryResults.read(outfile)
+            np.testing.assert_array_equal(restored.mask, metricValues.mask)
+            np.testing.assert_array_equal(restored.Hvals, Hvals)
+            for key in metricValue:
+                np.testing.assert_array_equal(restored[0, 1][key], metricValue[key])
+            # Child metrics give the same results from the stored parent values.
+            for i in range(2):
+                child = metrics.Discovery_TimeMetric(discMetric, i=i)
+                self.assertEqual(child.run(self.ssoObs, self.orb, self.Hval, restored[0, 0]),
+                                 child.run(self.ssoObs, self.orb, self.Hval, metricValue))
+            # Combine with a second 'shard' which holds the values for the second object.
+            shardValues = ma.MaskedArray(data=np.empty((3, 2), 'object'), mask=np.ones((3, 2), bool))
+            shardValues.data[1, 1] = metricValue
+            shardValues.mask[1, 1] = False
+            shard = mb.DiscoveryResults.fromMetricValues(shardValues, Hvals, objIds=np.array(['a', 'b', 'c']))
+            joint = mb.combineDiscoveryResults([restored, shard])
+            expectedMask = np.array([[False, False], [True, False], [False, True]])
+            np.testing.assert_array_equal(joint.mask, expectedMask)
+            np.testing.assert_array_equal(joint[1, 1]['start'], metricValue['start'])
+            np.testing.assert_array_equal(joint[2, 0]['trackletNights'], np.array([1., 7., 10.]))
+            np.testing.assert_array_equal(joint[0, 0]['end'], metricValue['end'])
+        finally:
+            shutil.rmtree(tempdir)
+
+    def _moSlicer(self, nSso=3, objIds=None, H=None):
+        # Set up a slicer in memory, where each object has the observations in self.ssoObs.
+        slicer = slicers.MoObjSlicer(Hrange=np.array([self.Hval], float), verbose=False)
+        slicer.orbitFile = 'orbits.des'
+        slicer.obsFile = 'obs.txt'
+        if objIds is None:
+            objIds = np.arange(nSso)
+        if H is None:
+            H = np.zeros(nSso) + self.Hval
+        slicer.orbits = pd.DataFrame({'objId': objIds, 'H': H})
+        slicer.nSso = nSso
+        slicer.slicePoints = {'orbits': slicer.orbits, 'H': slicer.Hrange}
+        slicer.shape = [nSso, len(slicer.Hrange)]
+        slicer.nslice = nSso * len(slicer.Hrange)
+        obs = pd.DataFrame.from_records(self.ssoObs)
+        obs['magV'] = 22.0
+        obs['dmagColor'] = 0.0
+        obs['geo_dist'] = 1.0
+        obs['helio_dist'] = 2.0
+        allObs = []
+        for objId in np.unique(objIds):
+            obs['objId'] = objId
+            allObs.append(obs.copy())
+        slicer.allObs = pd.concat(allObs, ignore_index=True)
+        slicer.subsetObs()
+        return slicer
+
+    def _runDiscovery(self, outDir, parentResults=None, slicer=None):
+        # Use a badval which is not None, so that masked parent values are not mistaken for bad values.
+        discMetric = metrics.DiscoveryMetric(nObsPerNight=2, tMin=0.0, tMax=0.3,
+                                             nNightsPerWindow=3, tWindow=9, snrLimit=5, badval=0)
+        if slicer is None:
+            slicer = self._moSlicer()
+        bundle = mb.MoMetricBundle(discMetric, slicer, None, runName='test',
+                                   stackerList=[stackers.MoMagStacker(randomSeed=42)])
+        if parentResults is not None:
+            bundle.setParentResults(parentResults)
+        bgroup = mb.MoMetricBundleGroup({'disc': bundle}, outDir=outDir, verbose=False)
+        bgroup.runAll()
+        return bundle
+
+    def testParentResults(self):
+        """Test the child metrics use stored parent values, skipping masked (undiscovered) objects."""
+        tempdir = tempfile.mkdtemp(prefix='discParent')
+        try:
+            bundle = self._runDiscovery(os.path.join(tempdir, 'all'))
+            self.assertFalse(np.any(bundle.metricValues.mask))
+            results = mb.DiscoveryResults.fromMetricValues(bundle.metricValues, bundle.slicer.Hrange)
+            # The parent did not discover the second object.
+            results.mask[1, 0] = True
+            reran = self._runDiscovery(os.path.join(tempdir, 'parent'), parentResults=results)
+            expectedMask = np.array([[False], [True], [False]])
+            np.testing.assert_array_equal(ma.getmaskarray(reran.metricValues), expectedMask)
+            self.assertTrue(len(reran.childBundles) > 0)
+            for cName, cBundle in reran.childBundles.items():
+                self.assertTrue(cBundle.metricValues.mask[1, 0])
+                expected = bundle.childBundles[cName].metricValues
+                for i in (0, 2):
+                    self.assertEqual(ma.getmaskarray(cBundle.metricValues)[i, 0],
+                                     ma.getmaskarray(expected)[i, 0])
+                    if not cBundle.metricValues.mask[i, 0]:
+                        np.testing.assert_array_equal(cBundle.metricValues.data[i, 0],
+                                                      expected.data[i, 0])
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testObsUnchanged(self):
+        """Test running the stackers over all observations does not add columns to the slicer obs."""
+        tempdir = tempfile.mkdtemp(prefix='discObs')
+        try:
+            slicer = self._moSlicer()
+            columns = list(slicer.allObs.columns)
+            self._runDiscovery(tempdir, slicer=slicer)
+            self.assertEqual(list(slicer.allObs.columns), columns)
+            self.assertEqual(list(slicer.obs.columns), columns)
+            self.assertFalse(any(c.startswith('appMagVRef') for c in slicer.obs.columns))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testDuplicateObjIds(self):
+        """Test the stackers are run for orbits with duplicate objIds."""
+        tempdir = tempfile.mkdtemp(prefix='discDup')
+        try:
+            expected = self._runDiscovery(os.path.join(tempdir, 'unique'))
+            # Duplicated orbits with the same H use the same observations and reference H.
+            slicer = self._moSlicer(objIds=np.array([0, 1, 1]))
+            bundle = self._runDiscovery(os.path.join(tempdir, 'sameH'), slicer=slicer)
+            np.testing.assert_array_equal(bundle.childBundles['N_Chances'].metricValues,
+                                          expected.childBundles['N_Chances'].metricValues)
+            # With different H values, the stackers are run for each object.
+            slicer = self._moSlicer(objIds=np.array([0, 1, 1]), H=np.array([self.Hval, self.Hval, 25.]))
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                bundle = self._runDiscovery(os.path.join(tempdir, 'diffH'), slicer=slicer)
+            self.assertTrue(any('same objId' in str(m.message) for m in w))
+            nChances = bundle.childBundles['N_Chances'].metricValues
+            np.testing.assert_array_equal(nChances[:2], expected.childBundles['N_Chances'].metricValues[:2])
+            # The third object is brighter (cloned to H=8 from Href=25), so is discovered the same way.
+            np.testing.assert_array_equal(nChances[2], expected.childBundles['N_Chances'].metricValues[2])
+        finally:
+            shutil.rmtree(tempdir)
+
     def testHighVelocityMetric(self):
         rng = np.random.RandomState(8123)
         velMetric = metrics.HighVelocityMetric(psfFactor=1.0, snrLimit=5)
@@ -293,5 +447,106 @@ class TestKnownObjectMetrics(unittest.TestCase):
         self.assertEqual(mVal, knownObjectMetric.badval)
 
 
+class TestMoCompleteness(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.Hvals = np.arange(16, 22, 0.5)
+        self.times = np.arange(60000, 60000 + 365 * 3 + 1, 365 / 2.)
+        discoveryTimes = rng.rand(200, len(self.Hvals)) * 365 * 3.2 + 59990
+        # Include discoveries exactly on the first and last time bin edges.
+        discoveryTimes[0, 0] = self.times[0]
+        discoveryTimes[1, 0] = self.times[-1]
+        self.discoveryTimes = ma.MaskedArray(discoveryTimes, mask=rng.rand(*discoveryTimes.shape) > 0.7,
+                                             fill_value=-999)
+
+    def testCompletenessOverTime(self):
+        differential, cumulative = metrics.completenessOverTime(self.discoveryTimes, self.Hvals,
+                                                                self.times, Hindex=0.33)
+        self.assertEqual(differential.shape, (len(self.times), len(self.Hvals)))
+        # Compare against histogramming each H value separately.
+        nSsos = self.discoveryTimes.shape[0]
+        for i in range(len(self.Hvals)):
+            n, b = np.histogram(self.discoveryTimes[:, i].compressed(), bins=self.times)
+            expected = np.concatenate([[0], n.cumsum()]) / float(nSsos)
+            np.testing.assert_allclose(differential[:, i], expected)
+        for t in range(len(self.times)):
+            np.testing.assert_allclose(cumulative[t], metrics.integrateOverH(differential[t], self.Hvals))
+        # And the summary metrics pick out the appropriate H value.
+        metric = metrics.MoCompletenessAtTimeMetric(self.times, Hval=18, cumulative=True)
+        summaryVal = metric.run(self.discoveryTimes, self.Hvals)
+        np.testing.assert_allclose(summaryVal['value'], cumulative[:, 4])
+        metric = metrics.MoCompletenessAtTimeMetric(self.times, Hval=18, cumulative=False)
+        summaryVal = metric.run(self.discoveryTimes, self.Hvals)
+        np.testing.assert_allclose(summaryVal['value'], differential[:, 4])
+
+    def testCompletenessOverH(self):
+        nChances = ma.MaskedArray(np.floor(self.discoveryTimes.data - 59990) % 4,
+                                  mask=self.discoveryTimes.mask)
+        metric = metrics.MoCompletenessMetric(threshold=2, cumulative=False)
+        summaryVal = metric.run(nChances, self.Hvals)
+        expected = np.array([np.sum(nChances[:, i].filled(0) >= 2) for i in range(len(self.Hvals))])
+        np.testing.assert_allclose(summaryVal['value'], expected / float(nChances.shape[0]))
+
+
+class TestCombineSplits(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir = tempfile.mkdtemp(prefix='TMoSplits')
+        self.nSplits = 3
+        nSso = 12
+        Hrange = np.arange(15, 20, 1.0)
+        rng = np.random.RandomState(42)
+        self.values = rng.rand(nSso, len(Hrange)) * 10
+        self.mask = rng.rand(nSso, len(Hrange)) > 0.8
+        orbits = pd.DataFrame({'objId': np.arange(nSso), 'H': np.zeros(nSso) + 15})
+        for i in range(self.nSplits):
+            slicer = slicers.MoObjSlicer(Hrange=Hrange)
+            slicer.slicer_init['orbitFile'] = 'orbits.des'
+            slicer.slicePoints = {'orbits': orbits, 'H': Hrange}
+            slicer.shape = [nSso, len(Hrange)]
+            slicer.nslice = nSso * len(Hrange)
+            # Each split only calculates values for every nSplits'th object.
+            mask = np.ones(self.values.shape, bool)
+            mask[i::self.nSplits] = self.mask[i::self.nSplits]
+            metricValues = ma.MaskedArray(np.where(mask, 0, self.values), mask=mask, fill_value=0)
+            splitDir = os.path.join(self.baseDir, 'orbits_%d' % i)
+            os.makedirs(splitDir)
+            slicer.writeData(os.path.join(splitDir, 'test_NObs_MOOB.npz'), metricValues, metricName='NObs',
+                             plotDict={})
+        os.makedirs(os.path.join(self.baseDir, 'orbits_other'))
+
+    def tearDown(self):
+        if os.path.isdir(self.baseDir):
+            shutil.rmtree(self.baseDir)
+
+    def testReadAndCombine(self):
+        splits = batches.findSplits('orbits', self.baseDir)
+        self.assertEqual(splits, list(range(self.nSplits)))
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            bundle = batches.readAndCombine('orbits', self.baseDir, None, 'test_NObs_MOOB.npz')
+        # The slicer of the first split is restored with its saved init values.
+        self.assertFalse(any('Cannot use saved slicer init' in str(m.message) for m in w))
+        self.assertEqual(bundle.slicer.orbitFile, 'orbits.des')
+        np.testing.assert_array_equal(bundle.slicer.Hrange, np.arange(15, 20, 1.0))
+        np.testing.assert_array_equal(ma.getmaskarray(bundle.metricValues), self.mask)
+        np.testing.assert_array_equal(bundle.metricValues.filled(0), np.where(self.mask, 0, self.values))
+        # Splits using a different H range cannot be combined.
+        slicer = slicers.MoObjSlicer(Hrange=np.arange(15, 20, 0.5))
+        slicer.slicer_init['orbitFile'] = 'orbits.des'
+        slicer.slicePoints = {'orbits': None, 'H': slicer.Hrange}
+        slicer.shape = [self.values.shape[0], len(slicer.Hrange)]
+        slicer.nslice = slicer.shape[0] * slicer.shape[1]
+        badfile = os.path.join(self.baseDir, 'orbits_0', 'test_bad_MOOB.npz')
+        slicer.writeData(badfile, ma.MaskedArray(np.zeros(slicer.shape)), metricName='NObs',
+                         plotDict={})
+        metricfiles = [os.path.join(self.baseDir, 'orbits_1', 'test_NObs_MOOB.npz'), badfile]
+        with self.assertRaises(ValueError):
+            batches.streamCombine(metricfiles)
+        with self.assertRaises(ValueError):
+            batches.streamCombine(metricfiles[::-1])
+
+
 if __name__ == "__main__":
     unittest.main()
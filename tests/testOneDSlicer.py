@@ -255,6 +255,9 @@ class TestOneDSlicerSlicing(unittest.TestCase):
                 idxs = s['idxs']
                 dataslice = dv['testdata'][idxs]
                 sum += len(idxs)
+                # The slicer advertises that the indexes in each slice are sorted.
+                self.assertTrue(self.testslicer.sortedIdxs)
+                self.assertTrue(np.all(np.diff(idxs) > 0))
                 if len(dataslice) > 0:
                     self.assertEqual(len(dataslice), nvalues/float(nbins))
                 else:
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from lsst.sims.maf.slicers.orbits import Orbits
+import lsst.utils.tests
+
+
+class TestOrbits(unittest.TestCase):
+
+    def setUp(self):
+        self.outDir = tempfile.mkdtemp(prefix='TOrbits')
+        nSso = 10
+        rng = np.random.RandomState(42)
+        orbits = pd.DataFrame({'objId': ['obj%d' % i for i in range(nSso)],
+                               'q': rng.rand(nSso) + 1.0,
+                               'e': rng.rand(nSso) * 0.5,
+                               'inc': rng.rand(nSso) * 20.,
+                               'Omega': rng.rand(nSso) * 360.,
+                               'argPeri': rng.rand(nSso) * 360.,
+                               'tPeri': rng.rand(nSso) * 100. + 59580.,
+                               'epoch': np.zeros(nSso) + 59580.,
+                               'H': rng.rand(nSso) + 15.})
+        self.orbitFile = os.path.join(self.outDir, 'orbits.txt')
+        orbits.to_csv(self.orbitFile, sep=' ', index=False)
+
+    def tearDown(self):
+        if os.path.isdir(self.outDir):
+            shutil.rmtree(self.outDir)
+
+    def testBinaryOrbits(self):
+        """Test writing and reading orbits as a binary orbit catalog."""
+        orb = Orbits()
+        orb.readOrbits(self.orbitFile)
+        orbitDir = orb.writeOrbits(os.path.join(self.outDir, 'orbits'))
+        self.assertTrue(orbitDir.endswith(Orbits.binarySuffix))
+        orb2 = Orbits()
+        orb2.readOrbits(orbitDir)
+        self.assertEqual(orb2.orb_format, orb.orb_format)
+        self.assertEqual(list(orb2.orbits.columns), list(orb.orbits.columns))
+        for col in orb.orbits.columns:
+            np.testing.assert_array_equal(orb2.orbits[col].values, orb.orbits[col].values)
+        # Read a range of objects, from both the text and binary files.
+        # (sed_filename values are only preserved by the binary file, as they are assigned randomly).
+        orb3 = Orbits()
+        orb3.readOrbits(orbitDir, idxRange=(2, 5))
+        orb4 = Orbits()
+        orb4.readOrbits(self.orbitFile, idxRange=(2, 5))
+        self.assertEqual(len(orb3), 3)
+        for col in orb.orbits.columns:
+            np.testing.assert_array_equal(orb3.orbits[col].values, orb.orbits[col].values[2:5])
+            if col != 'sed_filename':
+                np.testing.assert_array_equal(orb4.orbits[col].values, orb.orbits[col].values[2:5])
+        with self.assertRaises(ValueError):
+            orb3.readOrbits(orbitDir, idxRange=(20, 25))
+
+
+class TestMemory(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
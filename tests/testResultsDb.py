@@ -3,6 +3,7 @@ from builtins import range
 import matplotlib
 matplotlib.use("Agg")
 import os
+import sqlite3
 import warnings
 import unittest
 import numpy as np
@@ -81,6 +82,76 @@ class TestResultsDb(unittest.TestCase):
             self.assertIn("not save", str(w[-1].message))
         shutil.rmtree(tempdir)
 
+    def testBatchWrites(self):
+        tempdir = tempfile.mkdtemp(prefix='resDb')
+        resultsDb = db.ResultsDb(outDir=tempdir)
+        with resultsDb.batchWrites():
+            metricId = resultsDb.updateMetric(self.metricName, self.slicerName,
+                                              self.runName, self.constraint,
+                                              self.metadata, self.metricDataFile)
+            # The metricId is available immediately, and repeated updates return the same metricId.
+            metricId2 = resultsDb.updateMetric(self.metricName, self.slicerName,
+                                               self.runName, self.constraint,
+                                               self.metadata, self.metricDataFile)
+            self.assertEqual(metricId, metricId2)
+            resultsDb.updateDisplay(metricId, dict(self.displayDict))
+            resultsDb.updatePlot(metricId, self.plotType, self.plotName)
+            resultsDb.updateSummaryStat(metricId, self.summaryStatName1, self.summaryStatValue1)
+            resultsDb.updateSummaryStat(metricId, self.summaryStatName3, self.summaryStatValue3)
+            # Nothing has been written to the database file yet.
+            otherDb = db.ResultsDb(outDir=tempdir)
+            self.assertEqual(len(otherDb.getAllMetricIds()), 0)
+            otherDb.close()
+        # Everything has been written at the end of the batch.
+        otherDb = db.ResultsDb(outDir=tempdir)
+        self.assertEqual(otherDb.getAllMetricIds(), [metricId])
+        self.assertEqual(len(otherDb.getSummaryStats(metricId)), 11)
+        self.assertEqual(len(otherDb.getPlotFiles(metricId)), 1)
+        self.assertEqual(len(otherDb.getMetricDisplayInfo(metricId)), 1)
+        otherDb.close()
+        self.assertFalse(resultsDb.batch)
+        resultsDb.close()
+        shutil.rmtree(tempdir)
+
+
+    def testJournalMode(self):
+        tempdir = tempfile.mkdtemp(prefix='resDb')
+        resultsDb = db.ResultsDb(outDir=tempdir)
+        metricId = resultsDb.updateMetric(self.metricName, self.slicerName, self.runName, self.constraint,
+                                          self.metadata, self.metricDataFile)
+        dbFile = resultsDb.database
+
+        def journalMode():
+            connection = sqlite3.connect(dbFile)
+            mode = connection.execute('PRAGMA journal_mode').fetchone()[0]
+            connection.close()
+            return mode
+
+        # Plain writes use the default journal.
+        self.assertEqual(journalMode(), 'delete')
+        # Batched writes use write-ahead logging, until the resultsDb is closed.
+        with resultsDb.batchWrites():
+            resultsDb.updateSummaryStat(metricId, self.summaryStatName1, self.summaryStatValue1)
+        self.assertEqual(journalMode(), 'wal')
+        resultsDb.close()
+        self.assertEqual(journalMode(), 'delete')
+        self.assertFalse(os.path.isfile(dbFile + '-wal'))
+        # Reading the resultsDb read-only does not modify the file.
+        mtime = os.path.getmtime(dbFile) - 10
+        os.utime(dbFile, (mtime, mtime))
+        readDb = db.ResultsDb(outDir=tempdir, readOnly=True)
+        self.assertEqual(readDb.getAllMetricIds(), [metricId])
+        self.assertEqual(len(readDb.getSummaryStats(metricId)), 1)
+        with self.assertRaises(Exception):
+            readDb.updateMetric('other', self.slicerName, self.runName, self.constraint,
+                                self.metadata, self.metricDataFile)
+        readDb.session.rollback()
+        readDb.close()
+        self.assertEqual(os.path.getmtime(dbFile), mtime)
+        self.assertEqual(sorted(os.listdir(tempdir)), ['resultsDb_sqlite.db'])
+        with self.assertRaises(IOError):
+            db.ResultsDb(outDir=tempdir, database='missing.db', readOnly=True)
+        shutil.rmtree(tempdir)
 
 class TestUseResultsDb(unittest.TestCase):
 
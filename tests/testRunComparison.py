@@ -0,0 +1,148 @@
+import matplotlib
+matplotlib.use("Agg")
+import os
+import unittest
+import warnings
+import numpy as np
+import lsst.sims.maf.db as db
+import lsst.sims.maf.metrics as metrics
+import lsst.sims.maf.slicers as slicers
+import lsst.sims.maf.metricBundles as metricBundles
+from lsst.sims.maf.runComparison import RunComparison, SummaryStatWarehouse
+import shutil
+import tempfile
+import lsst.utils.tests
+
+
+class TestRunComparison(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir = tempfile.mkdtemp(prefix='runComp')
+        self.runNames = ['runA', 'runB', 'runC']
+        self.values = {}
+        rng = np.random.RandomState(42)
+        for i, runName in enumerate(self.runNames):
+            # runB keeps its outputs in subdirectories.
+            for subdir in (['sched', 'sci'] if runName == 'runB' else ['']):
+                resultsDb = db.ResultsDb(outDir=os.path.join(self.baseDir, runName, subdir))
+                for m in range(5):
+                    # runC does not have Metric4.
+                    if runName == 'runC' and m == 4:
+                        continue
+                    metricId = resultsDb.updateMetric('Metric%d' % m, 'UniSlicer', runName, '',
+                                                      'md%s' % subdir, 'metric%d.npz' % m)
+                    for summaryName in ['Mean', 'Median']:
+                        value = rng.rand()
+                        resultsDb.updateSummaryStat(metricId, summaryName, value)
+                        self.values[(runName, subdir, m, summaryName)] = value
+                resultsDb.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir)
+
+    def testWarehouse(self):
+        """Test the warehouse is only updated with new or modified resultsDbs."""
+        resultsDbs = [os.path.join(self.baseDir, 'runA', 'resultsDb_sqlite.db'),
+                      os.path.join(self.baseDir, 'runC', 'resultsDb_sqlite.db')]
+        database = os.path.join(self.baseDir, 'warehouse_sqlite.db')
+        warehouse = SummaryStatWarehouse(database)
+        self.assertEqual(warehouse.update(resultsDbs), 2)
+        warehouse.close()
+        warehouse = SummaryStatWarehouse(database)
+        self.assertEqual(warehouse.update(resultsDbs), 0)
+        mtime = os.path.getmtime(resultsDbs[1]) + 10
+        os.utime(resultsDbs[1], (mtime, mtime))
+        self.assertEqual(warehouse.update(resultsDbs), 1)
+        stats = warehouse.getSummaryStats(metricName='Metric2', summaryName='Median')
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(len(warehouse.getMetrics(resultsDbs=resultsDbs[:1], metricNameLike='etric')), 5)
+        table = warehouse.statTable(resultsDbs, labels=['runA', 'runC'])
+        self.assertEqual(list(table.index), ['runA', 'runC'])
+        self.assertEqual(table.shape, (2, 10))
+        self.assertEqual(table.loc['runA', ('Metric3', 'md', 'UniSlicer', 'Mean')],
+                         self.values[('runA', '', 3, 'Mean')])
+        self.assertTrue(np.isnan(table.loc['runC', ('Metric4', 'md', 'UniSlicer', 'Mean')]))
+        warehouse.close()
+
+    def testSummaryStats(self):
+        """Test the summary stats dataframes gathered from the warehouse."""
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            runComp = RunComparison(self.baseDir, self.runNames)
+        self.assertEqual(sorted(runComp.runresults['runB'].keys()), ['sched', 'sci'])
+        metricDict = runComp.buildMetricDict(subdir='sci')
+        self.assertEqual(sorted(metricDict.keys()), ['Metric%d mdsci' % m for m in range(5)])
+        metricDict = {'Median 1': {'metricName': 'Metric1', 'metricMetadata': 'md',
+                                   'slicerName': 'UniSlicer', 'summaryName': 'Median'},
+                      'Metric4': {'metricName': 'Metric4', 'metricMetadata': None, 'slicerName': None}}
+        runComp.addSummaryStats(metricDict)
+        stats = runComp.summaryStats
+        self.assertEqual(list(stats.index), self.runNames)
+        self.assertEqual(sorted(stats.columns), ['Mean Metric4', 'Median 1', 'Median Metric4'])
+        self.assertEqual(stats.loc['runA', 'Median 1'], self.values[('runA', '', 1, 'Median')])
+        self.assertTrue(np.isnan(stats.loc['runB', 'Median 1']))
+        # The last subdirectory of runB wins when a stat is in both.
+        lastSubdir = list(runComp.runresults['runB'].keys())[-1]
+        self.assertEqual(stats.loc['runB', 'Mean Metric4'], self.values[('runB', lastSubdir, 4, 'Mean')])
+        self.assertTrue(np.isnan(stats.loc['runC', 'Mean Metric4']))
+        self.assertEqual(runComp.headerStats.loc['SummaryName', 'Median 1'], 'Median')
+        # Adding the same stat again keeps both columns (as DataFrame.join).
+        runComp.addSummaryStats({'Median 1': metricDict['Median 1']})
+        self.assertEqual(sorted(runComp.summaryStats.columns),
+                         ['Mean Metric4', 'Median 1', 'Median 1_x', 'Median Metric4'])
+        self.assertEqual(runComp.getFileNames('Metric0', 'mdsci', 'UniSlicer'),
+                         {'runB': os.path.join('runB', 'sci', 'metric0.npz')})
+        runComp.close()
+
+    def testCompareMetricMaps(self):
+        """Test the streamed differences, ratios and ranks of metric maps against the baseline run."""
+        rng = np.random.RandomState(42)
+        maps = {}
+        for runName in self.runNames:
+            outDir = os.path.join(self.baseDir, runName, 'maps')
+            resultsDb = db.ResultsDb(outDir=outDir)
+            bundle = metricBundles.MetricBundle(metrics.MeanMetric('airmass'),
+                                                slicers.HealpixSlicer(nside=4, verbose=False), '',
+                                                runName=runName, metadata='maps')
+            bundle._setupMetricValues()
+            bundle.metricValues.data[:] = rng.randint(0, 4, len(bundle.metricValues))
+            bundle.metricValues.mask = rng.rand(len(bundle.metricValues)) < 0.2
+            bundle.write(outDir=outDir, resultsDb=resultsDb)
+            resultsDb.close()
+            maps[runName] = bundle.metricValues.filled(np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            runComp = RunComparison(self.baseDir, self.runNames)
+        outDir = os.path.join(self.baseDir, 'compare')
+        outfiles = runComp.compareMetricMaps('Mean airmass', 'maps', 'HealpixSlicer', 'runB', outDir,
+                                             chunkSize=50)
+        self.assertEqual(len(outfiles), 9)
+        values = np.array([maps[r] for r in self.runNames])
+        for runName in self.runNames:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(maps['runB'] == 0, np.nan, maps[runName] / maps['runB'])
+            rank = [np.nan if np.isnan(v) else 1 + np.sum(col[np.isfinite(col)] < v)
+                    for v, col in zip(maps[runName], values.T)]
+            for comparison, expected in [('difference', maps[runName] - maps['runB']),
+                                         ('ratio', ratio), ('rank', rank)]:
+                bundle = metricBundles.createEmptyMetricBundle()
+                bundle.read(outfiles[(runName, comparison)])
+                self.assertEqual(bundle.runName, runName)
+                self.assertEqual(bundle.metric.name, 'Mean airmass %s vs runB' % comparison)
+                self.assertEqual(bundle.slicer.nside, 4)
+                np.testing.assert_array_equal(bundle.metricValues.filled(np.nan), expected)
+        self.assertEqual(len(os.listdir(outDir)), 9)
+        runComp.close()
+
+
+class TestMemory(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -10,6 +10,8 @@ from lsst.sims.maf.metrics.snCadenceMetric import SNCadenceMetric
 from lsst.sims.maf.metrics.snSNRMetric import SNSNRMetric
 from lsst.sims.maf.metrics.snSLMetric import SNSLMetric
 import os
+import shutil
+import tempfile
 import warnings
 
 m5_ref = dict(
@@ -176,6 +178,50 @@ class TestSNmetrics(unittest.TestCase):
             warnings.warn(
                 "skipping SN test because no SIMS_MAF_CONTRIB_DIR set")
 
+    def testSNSNRMetricCache(self):
+        """Test the SN SNR metric lookup tables and fakes cache, with simple reference data."""
+        band = 'r'
+        z = 0.3
+        outDir = tempfile.mkdtemp(prefix='TSNSNR')
+        # A gaussian light curve and a simple m5 to flux relation.
+        t = np.arange(-30., 80., 0.5)
+        lc = np.zeros(len(t), dtype=[('z', 'f8'), ('band', 'U10'), ('time', 'f8'),
+                                     ('DayMax', 'f8'), ('flux_e', 'f8')])
+        lc['z'] = z
+        lc['band'] = 'LSST::' + band
+        lc['time'] = 59000. + t
+        lc['DayMax'] = 59000.
+        lc['flux_e'] = 1000. * np.exp(-0.5 * (t / 15.)**2)
+        m5 = np.arange(18., 30., 0.05)
+        mag_to_flux = np.zeros(len(m5), dtype=[('band', 'U1'), ('m5', 'f8'), ('flux_e', 'f8')])
+        mag_to_flux['band'] = band
+        mag_to_flux['m5'] = m5
+        mag_to_flux['flux_e'] = 5. * 10**(-0.4 * (m5 - 27.))
+        Li_files = [os.path.join(outDir, 'lc.npy')]
+        mag_to_flux_files = [os.path.join(outDir, 'mag_to_flux.npy')]
+        np.save(Li_files[0], lc)
+        np.save(mag_to_flux_files[0], mag_to_flux)
+        lim_sn = ReferenceData(Li_files, mag_to_flux_files, band, z)
+        shutil.rmtree(outDir)
+
+        data = fakeData(band)
+        metric = SNSNRMetric(lim_sn=lim_sn, coadd=False, names_ref=['test'], season=1, z=z)
+        # The lookup tables match the reference interpolators.
+        times = np.arange(-40., 90., 0.3)
+        np.testing.assert_array_equal(metric.ref_fluxes[0](times), lim_sn.fluxes[0](times))
+        np.testing.assert_array_equal(metric.ref_mag_to_flux[0](m5), lim_sn.mag_to_flux[0](m5))
+        result = metric.run(data)
+        self.assertGreaterEqual(result, 0)
+        self.assertLessEqual(result, 1)
+        self.assertEqual(len(metric.fakes_cache), 1)
+        # Running again uses the cached fakes, and gives the same result.
+        self.assertEqual(metric.run(data), result)
+        self.assertEqual(len(metric.fakes_cache), 1)
+        metric = SNSNRMetric(lim_sn=lim_sn, coadd=False, names_ref=['test'], season=1, z=z,
+                             fakesCacheSize=0)
+        self.assertEqual(metric.run(data), result)
+        self.assertEqual(len(metric.fakes_cache), 0)
+
     def testSNSLMetric(self):
         """Test the SN SNR metric """
 
@@ -0,0 +1,80 @@
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import unittest
+import lsst.sims.maf.metrics as metrics
+import lsst.sims.maf.utils as mafUtils
+import lsst.utils.tests
+
+
+class TestSliceContext(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        nvisits = 500
+        names = ['observationStartMJD', 'night', 'filter', 'fiveSigmaDepth', 'seeingFwhmGeom']
+        types = [float, int, (np.str_, 1), float, float]
+        self.data = np.zeros(nvisits, dtype=list(zip(names, types)))
+        self.data['night'] = rng.randint(0, 365, nvisits)
+        self.data['observationStartMJD'] = 59580 + self.data['night'] + rng.rand(nvisits) * 0.3
+        self.data['filter'] = rng.choice(['u', 'g', 'r', 'i', 'z', 'y'], nvisits)
+        self.data['fiveSigmaDepth'] = rng.rand(nvisits) + 23.5
+        self.data['seeingFwhmGeom'] = rng.rand(nvisits) + 0.6
+
+    def testContext(self):
+        """Test the cached values match the direct calculations."""
+        context = metrics.SliceContext(self.data)
+        mjd = self.data['observationStartMJD']
+        np.testing.assert_array_equal(context.sortOrder('observationStartMJD'), np.argsort(mjd))
+        np.testing.assert_array_equal(context.sortedCol('observationStartMJD'), np.sort(mjd))
+        np.testing.assert_array_equal(context.sortedCol('night', 'observationStartMJD'),
+                                      self.data['night'][np.argsort(mjd)])
+        nights, counts = context.unique('night')
+        expectedNights, expectedCounts = np.unique(self.data['night'], return_counts=True)
+        np.testing.assert_array_equal(nights, expectedNights)
+        np.testing.assert_array_equal(counts, expectedCounts)
+        groups = context.filterGroups('filter')
+        self.assertEqual(sorted(groups.keys()), ['g', 'i', 'r', 'u', 'y', 'z'])
+        for f in groups:
+            np.testing.assert_array_equal(groups[f], np.where(self.data['filter'] == f)[0])
+        mags = {'u': 20, 'g': 21, 'r': 21.5, 'i': 22, 'z': 22, 'y': 21.5}
+        snr = context.snr(mags, 'fiveSigmaDepth', 'filter')
+        for f in groups:
+            expected = mafUtils.m52snr(mags[f], self.data['fiveSigmaDepth'][groups[f]])
+            np.testing.assert_array_equal(snr[groups[f]], expected)
+        # A visit in a filter without a magnitude is an error, not an SNR of 0.
+        with self.assertRaises(KeyError):
+            context.snr({'u': 20, 'g': 21}, 'fiveSigmaDepth', 'filter')
+        # Repeated requests return the cached values.
+        self.assertIs(context.snr(mags, 'fiveSigmaDepth', 'filter'), snr)
+        self.assertIs(context.filterGroups('filter'), groups)
+
+    def testSharedContext(self):
+        """Test metrics give the same results with a shared context as when run on their own."""
+        metricList = [metrics.TeffMetric(), metrics.TgapsMetric(), metrics.NightgapsMetric(allGaps=True),
+                      metrics.NVisitsPerNightMetric(), metrics.MaxGapMetric(),
+                      metrics.TransientMetric(), metrics.VisitGroupsMetric()]
+        context = metrics.SliceContext(self.data)
+        for metric in metricList:
+            self.assertTrue(metric.useSliceContext)
+            shared = metric.run(self.data, sliceContext=context)
+            alone = metric.run(self.data)
+            if isinstance(alone, dict):
+                for key in alone:
+                    np.testing.assert_array_equal(shared[key], alone[key])
+            else:
+                np.testing.assert_array_equal(shared, alone)
+        self.assertFalse(metrics.SumMetric('fiveSigmaDepth').useSliceContext)
+
+
+class TestMemory(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,75 @@
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import numpy.ma as ma
+import healpy as hp
+import unittest
+import lsst.sims.maf.plots as plots
+import lsst.sims.maf.slicers as slicers
+import lsst.utils.tests
+
+
+class TestSpatialPlotters(unittest.TestCase):
+
+    def tearDown(self):
+        plt.close('all')
+
+    def _skyMapImage(self, plotter, metricValues, slicer, plotDict):
+        fignum = plotter(metricValues, slicer, plotDict)
+        ax = [a for a in plt.figure(fignum).axes if len(a.get_images()) > 0][0]
+        img = ax.get_images()[0].get_array()
+        return ma.getdata(img).copy(), ma.getmaskarray(img).copy(), ax.get_position().bounds
+
+    def testHealpixSkyMapCache(self):
+        """Test the cached projection gives the same image as healpy."""
+        nside = 16
+        slicer = slicers.HealpixSlicer(nside=nside, verbose=False)
+        rng = np.random.RandomState(42)
+        npix = hp.nside2npix(nside)
+        metricValues = ma.MaskedArray(rng.rand(npix), mask=rng.rand(npix) < 0.2)
+        for plotDict in [{}, {'rot': (90, 90, 90), 'flip': 'geo'}, {'subplot': 223}]:
+            plotter = plots.HealpixSkyMap()
+            self.assertTrue(plotter._useProjectionCache({'sub': 111}))
+            cached = self._skyMapImage(plotter, metricValues, slicer, plotDict)
+            plotter._useProjectionCache = lambda visufunc_params: False
+            expected = self._skyMapImage(plotter, metricValues, slicer, plotDict)
+            np.testing.assert_array_equal(cached[0], expected[0])
+            np.testing.assert_array_equal(cached[1], expected[1])
+            self.assertEqual(cached[2], expected[2])
+        # Other healpy views are not cached.
+        plotter = plots.HealpixSkyMap()
+        plotter.healpy_visufunc = hp.cartview
+        self.assertFalse(plotter._useProjectionCache({'sub': 111}))
+
+    def testBaseSkyMap(self):
+        """Test the sky map of a generic spatial slicer."""
+        rng = np.random.RandomState(42)
+        npts = 200
+        ra = rng.rand(npts) * 360.
+        dec = np.degrees(np.arcsin(rng.rand(npts) * 2 - 1))
+        slicer = slicers.UserPointsSlicer(ra, dec)
+        metricValues = ma.MaskedArray(rng.rand(npts) + 0.1, mask=rng.rand(npts) < 0.1)
+        plotter = plots.BaseSkyMap()
+        for plotDict in [{'mwZone': False}, {'mwZone': False, 'plotMask': True, 'logScale': True}]:
+            fignum = plotter(metricValues, slicer, plotDict)
+            self.assertNotEqual(fignum, None)
+        lon = np.radians(ra[:5]) - np.pi
+        lat = np.radians(dec[:5])
+        verts = plotter._tissotVertices(lon, lat, 0.1, nVertices=8)
+        self.assertEqual(verts.shape, (5, 8, 2))
+        np.testing.assert_allclose(verts.mean(axis=1), np.array([lon, lat]).T, atol=1e-12)
+        np.testing.assert_allclose(verts[:, :, 1].max(axis=1) - lat, 0.1)
+
+
+class TestMemory(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -387,6 +387,67 @@ class TestStackerClasses(unittest.TestCase):
         assert(q3.size > 0)
         assert(q4.size > 0)
 
+    def testMoStackersRunObs(self):
+        """
+        Test that running moving object stackers over all observations matches running per object.
+        """
+        import pandas as pd
+        rng = np.random.RandomState(42)
+        nObs = 50
+        obs = pd.DataFrame({'ra': rng.rand(nObs) * 360., 'dec': rng.rand(nObs) * 180. - 90.,
+                            'magV': rng.rand(nObs) * 5 + 20., 'dmagColor': rng.rand(nObs) * 0.2,
+                            'dmagDetect': rng.rand(nObs) * 0.1, 'fiveSigmaDepth': np.zeros(nObs) + 24.,
+                            'helio_dist': rng.rand(nObs) + 1., 'geo_dist': rng.rand(nObs) + 0.5})
+        Href = 15.
+        Hval = 17.
+        # Run per object.
+        stackerList = [stackers.EclStacker(), stackers.CometMagVStacker(),
+                       stackers.MoMagStacker(vMagCol='cometV', randomSeed=5)]
+        expected = obs.to_records()
+        for s in stackerList:
+            expected = s.run(expected, Href, Hval)
+        # Run over all observations first, then only H-dependent stackers per object.
+        stackerList = [stackers.EclStacker(), stackers.CometMagVStacker(),
+                       stackers.MoMagStacker(vMagCol='cometV', randomSeed=5)]
+        allObs = obs.copy()
+        for s in stackerList:
+            allObs = s.runObs(allObs, np.zeros(nObs) + Href)
+        result = allObs.to_records()
+        for s in stackerList:
+            if s.Hdependent:
+                result = s.run(result, Href, Hval)
+        for col in ['ecLat', 'ecLon', 'cometV', 'appMagV', 'appMag', 'SNR', 'vis']:
+            np.testing.assert_allclose(result[col], expected[col])
+
+    def testMoMagStackerLossCols(self):
+        """
+        Test that MoMagStackers with different lossCols keep separate precomputed magnitudes.
+        """
+        import pandas as pd
+        rng = np.random.RandomState(42)
+        nObs = 50
+        obs = pd.DataFrame({'magV': rng.rand(nObs) * 5 + 20., 'dmagColor': rng.rand(nObs) * 0.2,
+                            'dmagDetect': rng.rand(nObs) * 0.1, 'dmagTrail': rng.rand(nObs) * 0.5,
+                            'fiveSigmaDepth': np.zeros(nObs) + 24.})
+        Href = 15.
+        Hval = 17.
+        lossCols = ['dmagTrail', 'dmagDetect']
+        expected = {}
+        for lossCol in lossCols:
+            expected[lossCol] = stackers.MoMagStacker(lossCol=lossCol, randomSeed=5).run(obs.to_records(),
+                                                                                          Href, Hval)
+        stackerList = [stackers.MoMagStacker(lossCol=lossCol, randomSeed=5) for lossCol in lossCols]
+        allObs = obs.copy()
+        for s in stackerList:
+            allObs = s.runObs(allObs, np.zeros(nObs) + Href)
+        for s in stackerList:
+            result = s.run(allObs.to_records(), Href, Hval)
+            for col in ['appMagV', 'appMag', 'SNR', 'vis']:
+                np.testing.assert_allclose(result[col], expected[s.lossCol][col])
+        # The precomputed magnitudes are also found in a DataFrame.
+        result = stackers.MoMagStacker(lossCol='dmagTrail', randomSeed=5)._run(allObs.copy(), Href, Hval)
+        np.testing.assert_allclose(result['appMag'], expected['dmagTrail']['appMag'])
+
     def testOpSimFieldStacker(self):
         """
         Test the OpSimFieldStacker
@@ -23,6 +23,41 @@ class TestSummaryMetrics(unittest.TestCase):
             self.assertEqual(table['value'][-2], np.size(np.where(metricdata1 == 1)[0]))
             self.assertEqual(table['value'].sum(), metricdata1.size)
 
+    def testSharedContext(self):
+        """Test summary metrics give the same results with a shared SliceContext as when run on their own."""
+        rng = np.random.RandomState(42)
+        for values in [rng.rand(2000) * 1.4 - 0.2, rng.randint(0, 20, 2000) / 10.]:
+            values[rng.rand(len(values)) < 0.01] = np.nan
+            for withNaN in [False, True]:
+                data = np.zeros(len(values), dtype=[('metricdata', float)])
+                data['metricdata'] = values if withNaN else np.nan_to_num(values)
+                context = metrics.SliceContext(data)
+                summaryMetrics = [metrics.MeanMetric(), metrics.RmsMetric(), metrics.MedianMetric(),
+                                  metrics.MaxMetric(), metrics.MinMetric(), metrics.FullRangeMetric(),
+                                  metrics.RobustRmsMetric(), metrics.PercentileMetric(percentile=25),
+                                  metrics.NoutliersNsigmaMetric(nSigma=-1.),
+                                  metrics.fOArea(nside=16, Nvisit=1), metrics.fONv(nside=16, Asky=1000.),
+                                  metrics.TableFractionMetric()]
+                for metric in summaryMetrics:
+                    metric.colname = 'metricdata'
+                    self.assertTrue(metric.useSliceContext)
+                    with np.errstate(invalid='ignore'):
+                        shared = metric.run(data, sliceContext=context)
+                        alone = metric.run(data)
+                    if isinstance(alone, np.ndarray):
+                        np.testing.assert_array_equal(shared['value'], alone['value'])
+                    else:
+                        np.testing.assert_array_equal(shared, alone)
+                # Check the table fraction against a histogram of the values.
+                table = summaryMetrics[-1].run(data, sliceContext=context)
+                metricdata = data['metricdata']
+                hist, b = np.histogram(metricdata[(metricdata > 0) & (metricdata < 1)],
+                                       bins=np.arange(11.) / 10.)
+                np.testing.assert_array_equal(table['value'][1:-2], hist)
+                self.assertEqual(table['value'][0], np.sum(metricdata == 0))
+                self.assertEqual(table['value'][-2], np.sum(metricdata == 1))
+                self.assertEqual(table['value'][-1], np.sum(metricdata > 1))
+
     def testIdentityMetric(self):
         """Test identity metric."""
         dv = np.arange(0, 10, .5)
@@ -6,6 +6,75 @@ import lsst.sims.maf.metrics as metrics
 import lsst.utils.tests
 
 
+def referenceVisitGroups(metric, dataSlice):
+    """Loop-based (reference) calculation of the VisitGroupsMetric values, night by night."""
+    visitNum = []
+    nights = []
+    for n in np.unique(dataSlice[metric.nights]):
+        times = np.sort(dataSlice[metric.times][dataSlice[metric.nights] == n])
+        nvisits = 0
+        ntooclose = 0
+        timediff = np.diff(times)
+        timegood = (timediff <= metric.deltaTmax) & (timediff >= metric.deltaTmin)
+        timetooclose = timediff < metric.deltaTmin
+        if len(timegood) > 1:
+            for tg1, ttc1, tg2, ttc2 in zip(timegood[:-1], timetooclose[:-1], timegood[1:], timetooclose[1:]):
+                if tg1:
+                    nvisits += 1
+                    if not tg2:
+                        nvisits += 1
+                if ttc1:
+                    ntooclose += 1
+                    if not tg2 and not ttc2:
+                        ntooclose += 1
+            if timegood[-1]:
+                nvisits += 2
+            if timetooclose[-1]:
+                ntooclose += 1
+                if not timegood[-2] and not timetooclose[-2]:
+                    ntooclose += 1
+        elif len(timegood) == 1 and timegood[0]:
+            nvisits += 2
+        if nvisits > 0:
+            visitNum.append(nvisits + ntooclose / 2.0)
+            nights.append(n)
+    return {'visits': np.array(visitNum), 'nights': np.array(nights)}
+
+
+def referenceReduce(metric, metricval):
+    """Loop-based (reference) calculation of the VisitGroupsMetric window and lunation reduce values."""
+    visits = metricval['visits']
+    nights = metricval['nights']
+
+    def inWindow(v, n, night):
+        condition = (n >= night) & (n < night + metric.window) & (v >= metric.minNVisits)
+        return v[condition], n[condition]
+
+    results = {'NVisitsInWindow': 0, 'NNightsInWindow': 0, 'NLunations': 0, 'MaxSeqLunations': 0}
+    for n in nights:
+        vw, nw = inWindow(visits, nights, n)
+        results['NVisitsInWindow'] = max(vw.sum(), results['NVisitsInWindow'])
+        results['NNightsInWindow'] = max(len(nw), results['NNightsInWindow'])
+    curSequence = 0
+    for lunation in np.arange(nights[0], nights[-1] + 15, 30):
+        condition = (nights >= lunation) & (nights < lunation + 30)
+        vl, nl = visits[condition], nights[condition]
+        if len(vl) == 0:
+            results['MaxSeqLunations'] = max(results['MaxSeqLunations'], curSequence)
+            curSequence = 0
+        for n in nl:
+            vw, nw = inWindow(vl, nl, n)
+            if len(nw) >= metric.minNNights:
+                results['NLunations'] += 1
+                curSequence += 1
+                break
+            else:
+                results['MaxSeqLunations'] = max(results['MaxSeqLunations'], curSequence)
+                curSequence = 0
+    results['MaxSeqLunations'] = max(results['MaxSeqLunations'], curSequence)
+    return results
+
+
 class TestVisitGroupsMetric(unittest.TestCase):
 
     def testPairFractionMetric(self):
@@ -107,6 +176,31 @@ class TestVisitGroupsMetric(unittest.TestCase):
         self.assertEqual(testmetric.reduceNLunations(metricval), 4)
         self.assertEqual(testmetric.reduceMaxSeqLunations(metricval), 3)
 
+    def testVisitGroupsRandom(self):
+        """Compare visit groups metric and reduce values to a loop-based calculation, for random visits."""
+        tmin = 15.0/60./24.0
+        tmax = 90./60./24.0
+        rng = np.random.RandomState(42)
+        for i in range(200):
+            nvisits = rng.randint(1, 150)
+            night = rng.randint(0, rng.choice([5, 50, 400]), nvisits)
+            # Use times on a grid, so that visits are often exactly tmin or tmax apart.
+            expmjd = night + 0.1 + rng.randint(0, 60, nvisits) * rng.choice([tmin / 10., tmin / 2., tmin])
+            testdata = np.core.records.fromarrays([expmjd, night], names=['expmjd', 'night'])
+            testmetric = metrics.VisitGroupsMetric(timeCol='expmjd', nightsCol='night',
+                                                   deltaTmin=tmin, deltaTmax=tmax,
+                                                   minNVisits=rng.randint(1, 4), window=rng.randint(1, 40),
+                                                   minNNights=rng.randint(1, 5))
+            metricval = testmetric.run(testdata)
+            expected = referenceVisitGroups(testmetric, testdata)
+            if len(expected['visits']) == 0:
+                self.assertEqual(metricval, testmetric.badval)
+                continue
+            np.testing.assert_equal(metricval['visits'], expected['visits'])
+            np.testing.assert_equal(metricval['nights'], expected['nights'])
+            for reduceName, value in referenceReduce(testmetric, expected).items():
+                self.assertEqual(testmetric.reduceFuncs[reduceName](metricval), value)
+
 
 class TestMemory(lsst.utils.tests.MemoryTestCase):
     pass